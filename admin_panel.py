@@ -4,14 +4,18 @@ from config import (
     ADMIN_USERNAME, ADMIN_PASSWORD, SECRET_KEY,
     FLASK_HOST, FLASK_PORT
 )
-from game_logic import BingoGame, Player
+from datetime import datetime
+from database import db, init_db
+from game_logic import BingoGame
+import ledger
+from models import Transaction, User
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+init_db(app)
 
 # In-memory storage
 games = []
-players = {}
 
 def admin_required(f):
     @wraps(f)
@@ -38,12 +42,17 @@ def login():
 @app.route('/admin/dashboard')
 @admin_required
 def dashboard():
+    withdrawals = (db.session.query(Transaction, User)
+                   .join(User, User.id == Transaction.user_id)
+                   .filter(Transaction.type == 'withdraw', Transaction.status == 'pending')
+                   .order_by(Transaction.created_at)
+                   .all())
     return render_template(
         'admin/dashboard.html',
-        players=players,
+        withdrawals=withdrawals,
         games=games,
         active_games=len([g for g in games if g.status == "active"]),
-        total_players=len(players)
+        total_players=User.query.count()
     )
 
 @app.route('/admin/game/start', methods=['POST'])
@@ -59,19 +68,31 @@ def start_game():
 @app.route('/admin/withdrawal/approve', methods=['POST'])
 @admin_required
 def approve_withdrawal():
-    user_id = request.form.get('user_id')
-    amount = float(request.form.get('amount'))
-    
-    if user_id in players:
-        player = players[user_id]
-        if player.balance >= amount:
-            player.balance -= amount
-            flash('Withdrawal approved')
-        else:
-            flash('Insufficient balance')
-    else:
-        flash('Player not found')
-        
+    transaction = (Transaction.query
+                   .filter_by(id=request.form.get('transaction_id', type=int), type='withdraw', status='pending')
+                   .with_for_update()
+                   .first())
+    if not transaction:
+        flash('Withdrawal not found')
+        return redirect(url_for('dashboard'))
+
+    # Withdrawal amounts are stored negative
+    cents = ledger.to_cents(-transaction.amount)
+    try:
+        ledger.post('withdraw', [
+            (ledger.USER, transaction.user_id, -cents),
+            (ledger.WITHDRAWALS, None, cents),
+        ], reference=f"transaction:{transaction.id}")
+    except ledger.InsufficientFunds:
+        db.session.rollback()
+        flash('Insufficient balance')
+        return redirect(url_for('dashboard'))
+
+    transaction.status = 'completed'
+    transaction.withdrawal_status = 'approved'
+    transaction.completed_at = datetime.utcnow()
+    db.session.commit()
+    flash('Withdrawal approved')
     return redirect(url_for('dashboard'))
 
 if __name__ == '__main__':
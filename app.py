@@ -1,11 +1,30 @@
 import os
-import random
-import asyncio
+import atexit
+import json
+import hashlib
 import logging
-from flask import Flask, jsonify, request, session, render_template, redirect, url_for
+import threading
+from typing import Optional
+from flask import Flask, Response, jsonify, request, session, render_template, redirect, url_for, stream_with_context
 from datetime import datetime
 from database import db, init_db
 from game_logic import BingoGame
+from game_caller import GameCaller
+from game_persistence import GamePersister, load_active_games, last_game_id
+from game_store import create_game_store
+from lobby import Lobby
+from matchmaking import Matchmaker
+from outbox import Outbox
+from webapp_auth import verify_init_data
+from cartelas import CARTELAS
+from config import (
+    GAME_PRICES,
+    GAME_STORE,
+    LOBBY_SYNC_INTERVAL,
+    SSE_KEEPALIVE,
+    TELEGRAM_BOT_TOKEN,
+    WEBAPP_AUTH_MAX_AGE
+)
 
 # Configure logging
 logging.basicConfig(
@@ -23,17 +42,106 @@ init_db(app)
 
 # Import models after db initialization
 from models import User, Game, GameParticipant, Transaction
-
-# Game storage (temporary, will be moved to database)
-active_games = {}
+import ledger
+
+# Deposit webhooks and game results are queued here for the bot process
+outbox = Outbox()
+
+# Live games are kept in the configured store and mirrored to the database in the background
+game_persister = GamePersister(app, outbox=outbox)
+game_store = create_game_store()
+
+# Open rooms as served by /game/list; other workers' changes are synced from a shared store
+lobby = Lobby(LOBBY_SYNC_INTERVAL if GAME_STORE == "sqlite" else None)
+
+def game_changed(game: BingoGame):
+    """Persist a changed game and refresh its lobby entry."""
+    game_persister.mark_dirty(game)
+    lobby.update(game)
+
+# Numbers are called by the server on a fixed cadence; clients only read state
+game_caller = GameCaller(game_store, on_call=game_changed)
+
+def open_room(game: BingoGame):
+    game_caller.watch(game.game_id)
+    game_changed(game)
+
+# Players are routed into one filling room per price tier
+matchmaker = Matchmaker(game_store, on_create=open_room)
+
+_game_services_started = False
+_game_services_lock = threading.Lock()
+
+def start_game_services():
+    """Restore open games and start calling them, once per serving process.
+
+    Run from gunicorn's post_fork hook or the first request rather than at
+    import, so a parent process that imports the app (main.py, before
+    gunicorn forks) never starts its own caller on its own copy of the games.
+    """
+    global _game_services_started
+    with _game_services_lock:
+        if _game_services_started:
+            return
+        _game_services_started = True
+        game_store.reserve_ids(last_game_id(app))
+        if not game_store.game_ids():
+            for restored_game in load_active_games(app).values():
+                game_store.add(restored_game)
+        lobby.sync(game_store, force=True)
+        for open_game_id in game_store.game_ids():
+            game_caller.watch(open_game_id)
+        atexit.register(stop_game_services)
+
+def stop_game_services():
+    """Write out games still waiting for the persister before the process exits."""
+    game_persister.flush()
+
+@app.before_request
+def ensure_game_services():
+    start_game_services()
+
+def current_user_id() -> Optional[int]:
+    """User.id of the Telegram user this session was verified as by /auth, else None."""
+    if session.get('telegram_id') is None:
+        return None
+    return session.get('user_id')
+
+@app.route('/auth', methods=['POST'])
+def authenticate():
+    """Sign the session in as the Telegram user whose WebApp initData is posted."""
+    init_data = (request.get_json(silent=True) or {}).get('init_data', '')
+    telegram_user = verify_init_data(init_data, TELEGRAM_BOT_TOKEN, WEBAPP_AUTH_MAX_AGE)
+    if telegram_user is None:
+        return jsonify({'error': 'Invalid Telegram login'}), 401
+    user = User.query.filter_by(telegram_id=int(telegram_user['id'])).first()
+    if user is None:
+        return jsonify({'error': 'Please register with the bot first'}), 403
+    session.clear()
+    session['user_id'] = user.id
+    session['telegram_id'] = user.telegram_id
+    return jsonify({'user_id': user.id})
 
 @app.route('/')
 def index():
     """Show available games or create a new one."""
-    if 'user_id' not in session:
-        session['user_id'] = random.randint(1, 1000000)  # Temporary user ID generation
     return render_template('game_lobby.html')
 
+def deposit_key(data: dict) -> Optional[str]:
+    """Idempotency key of a deposit SMS: the bank's transaction id, else a hash of the SMS.
+
+    None for payloads with neither: amount and phone alone can't tell a
+    retry from a second deposit of the same amount, so those aren't deduplicated.
+    A value starting with '%' is a Tasker variable that was never set, not an id.
+    """
+    transaction_id = str(data.get('transaction_id') or '')
+    if transaction_id and not transaction_id.startswith('%'):
+        return transaction_id[:100]
+    sms = str(data.get('sms') or '')
+    if sms and not sms.startswith('%'):
+        return 'sha256:' + hashlib.sha256(sms.encode()).hexdigest()
+    return None
+
 @app.route('/webhook/deposit', methods=['POST'])
 def deposit_webhook():
     """Handle deposit webhook from Tasker"""
@@ -55,11 +163,22 @@ def deposit_webhook():
         except (ValueError, TypeError):
             return jsonify({'error': 'Invalid amount format'}), 400
 
-        # Process deposit through bot
-        from bot import process_deposit_confirmation
-        asyncio.run(process_deposit_confirmation(data))
+        # Replays (Tasker retries) are answered without touching balances
+        key = deposit_key(data)
+        if key is None:
+            logger.warning("Deposit webhook without transaction_id or sms; queued without deduplication")
+        elif Transaction.query.filter_by(transaction_id=key).first():
+            logger.info(f"Deposit {key} was already applied")
+            return jsonify({'status': 'duplicate', 'idempotency_key': key})
+
+        # Queued durably; the bot process applies it and notifies the user
+        job_id, created = outbox.append('deposit', dict(data, idempotency_key=key), key=key)
+        if created:
+            logger.info(f"Queued deposit webhook as job {job_id}")
+        else:
+            logger.info(f"Deposit {key} is already queued as job {job_id}")
 
-        return jsonify({'status': 'success', 'message': 'Deposit processed successfully'})
+        return jsonify({'status': 'queued', 'job_id': job_id, 'idempotency_key': key}), 202
 
     except Exception as e:
         error_msg = str(e)
@@ -161,24 +280,21 @@ def test_webhook():
 
 @app.route('/game/create', methods=['GET', 'POST'])
 def create_game():
-    """Create a new game."""
+    """Find the filling room for an entry price, opening one if needed."""
     try:
         if request.method == 'POST':
             entry_price = int(request.json.get('entry_price', 10))
-            user_id = request.json.get('user_id')
 
-            if entry_price not in [10, 20, 50, 100]:
+            if entry_price not in GAME_PRICES:
                 return jsonify({'error': 'Invalid entry price'}), 400
 
-            game_id = len(active_games) + 1
-            active_games[game_id] = BingoGame(game_id, entry_price)
-
-            # Store user_id in session for web app
-            session['user_id'] = user_id
+            game = matchmaker.room_for(entry_price)
 
             return jsonify({
-                'game_id': game_id,
-                'entry_price': entry_price
+                'game_id': game.game_id,
+                'entry_price': entry_price,
+                'players': len(game.players),
+                'start_at': game.start_at.isoformat() if game.start_at else None
             })
         else:
             return jsonify({'error': 'Invalid request method'}), 405
@@ -189,46 +305,126 @@ def create_game():
 @app.route('/game/<int:game_id>/select_cartela')
 def select_cartela(game_id):
     """Show cartela selection interface"""
-    if game_id not in active_games:
+    game = game_store.get(game_id)
+    if game is None:
         return redirect(url_for('index'))
 
-    game = active_games[game_id]
-
-    # Get list of used cartela numbers
-    used_cartelas = set()
-    for player in game.players.values():
-        used_cartelas.add(player.get('cartela_number', 0))
-
     return render_template(
         'cartela_selection.html',
         game_id=game_id,
         entry_price=game.entry_price,
-        used_cartelas=used_cartelas
+        taken_cartelas=game.taken_cartelas_hex()  # Same bitmap the page refreshes from /game/list
     )
 
+def post_entry(game: BingoGame, user_id: int, kind: str) -> bool:
+    """Move a game's entry price from the player to its pot (game_entry) or back (refund).
+
+    Only the session's own verified user is ever charged or refunded.
+    """
+    if user_id is None or user_id != current_user_id():
+        logger.warning(f"Entry to game {game.game_id} refused: session is not verified as user {user_id}")
+        return False
+    cents = ledger.to_cents(game.entry_price)
+    sign = -1 if kind == 'game_entry' else 1
+    try:
+        ledger.post(kind, [
+            (ledger.USER, user_id, sign * cents),
+            (ledger.game_account(game.game_id), None, -sign * cents),
+        ], reference=f"game:{game.game_id}")
+        db.session.add(Transaction(user_id=user_id, type=kind, amount=sign * game.entry_price,
+                                   status='completed', completed_at=datetime.utcnow()))
+        db.session.commit()
+        return True
+    except ledger.InsufficientFunds as e:
+        db.session.rollback()
+        logger.info(f"Entry to game {game.game_id} refused: {e}")
+        return False
+
+def join_game(game: BingoGame, user_id: int, cartela_number: int = None) -> Optional[BingoGame]:
+    """Charge the entry and seat a player; returns the updated game, or None if refused."""
+    if game.status != "waiting" or cartela_number in game.cartela_owners:
+        return None
+    if not post_entry(game, user_id, 'game_entry'):
+        return None
+    try:
+        board = game_store.update(game.game_id, lambda g: g.add_player(user_id, cartela_number))
+    except Exception:
+        post_entry(game, user_id, 'refund')  # Not seated (store conflict, game evicted, ...)
+        raise
+    if not board:
+        post_entry(game, user_id, 'refund')  # Cartela taken, game filled up or closed meanwhile
+        return None
+    game = game_store.get(game.game_id)
+    game_changed(game)
+    return game
+
+@app.route('/game/list')
+def list_games():
+    """List open rooms from the lobby snapshot, answering 304 if the client's copy is current."""
+    lobby.sync(game_store)
+    body, etag = lobby.snapshot()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/game/<int:game_id>/join', methods=['POST'])
+def join_with_cartela(game_id):
+    """Join a game with a chosen cartela."""
+    game = game_store.get(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    cartela_number = (request.get_json(silent=True) or {}).get('cartela_number')
+    if user_id in game.players:
+        return jsonify({'game_id': game_id, 'cartela_number': game.players[user_id].cartela_number})
+    if not isinstance(cartela_number, int) or cartela_number not in CARTELAS:
+        return jsonify({'error': 'Invalid cartela number'}), 400
+
+    game = join_game(game, user_id, cartela_number)
+    if game is None:
+        return jsonify({'error': 'This cartela is taken or the game is closed. Please choose another.'}), 409
+    return jsonify({'game_id': game_id, 'cartela_number': cartela_number})
+
+@app.route('/game/<int:game_id>/leave', methods=['POST'])
+def leave_game(game_id):
+    """Leave a game before it starts and get the entry back."""
+    game = game_store.get(game_id)
+    user_id = current_user_id()
+    if game is None or user_id not in game.players:
+        return jsonify({'error': 'Not in this game'}), 404
+
+    if not game_store.update(game_id, lambda g: g.remove_player(user_id)):
+        return jsonify({'error': 'The game has already started'}), 409
+    post_entry(game, user_id, 'refund')
+    game_changed(game_store.get(game_id))
+    return jsonify({'game_id': game_id, 'left': True})
+
 @app.route('/game/<int:game_id>')
 def play_game(game_id):
     """Show the game interface."""
-    if game_id not in active_games:
+    game = game_store.get(game_id)
+    if game is None:
         return redirect(url_for('index'))
 
-    game = active_games[game_id]
-    user_id = session['user_id']
+    user_id = current_user_id()
+    if user_id is None:
+        return redirect(url_for('select_cartela', game_id=game_id))  # Signs in through Telegram first
 
-    # Add player if they haven't joined
+    # Add player if they haven't joined (the game auto-starts once enough players are in)
     if user_id not in game.players:
-        board = game.add_player(user_id)
-        if not board:
+        game = join_game(game, user_id)
+        if game is None:
             return redirect(url_for('index'))
 
     player = game.players[user_id]
 
-    # Auto-start game if enough players have joined
-    if game.status == "waiting" and len(game.players) >= game.min_players:
-        game.start_game()
-        if game.status == "active":
-            game.call_number()  # Call first number automatically
-
     # Get current call number
     current_number = None
     if game.status == "active" and game.called_numbers:
@@ -237,50 +433,109 @@ def play_game(game_id):
     return render_template('game.html',
                          game_id=game_id,
                          game=game,
-                         board=player['board'],
-                         marked=player['marked'],
+                         board=player.board,
+                         marked=game.marked_numbers(user_id),
                          called_numbers=game.called_numbers,
                          current_number=current_number,
                          active_players=len(game.players),
                          game_status=game.status,
                          entry_price=game.entry_price)
 
-@app.route('/game/<int:game_id>/call', methods=['POST'])
-def call_number(game_id):
-    """Call the next number."""
-    if game_id not in active_games:
+@app.route('/game/<int:game_id>/call', methods=['GET', 'POST'])
+def current_call(game_id):
+    """Return the latest called number. Numbers are called by the server-side GameCaller."""
+    game = game_store.get(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 404
 
-    game = active_games[game_id]
-    if game.status != "active":
-        return jsonify({'error': 'Game not active'}), 400
+    number = game.format_number(game.called_numbers[-1]) if game.called_numbers else None
+    return jsonify({
+        'number': number,
+        'called_numbers': game.called_numbers,
+        'status': game.status
+    })
 
-    number = game.call_number()
-    if number:
-        return jsonify({
-            'number': number,
-            'called_numbers': game.called_numbers
-        })
-    return jsonify({'error': 'No more numbers to call'}), 400
+@app.route('/game/<int:game_id>/state')
+def game_state(game_id):
+    """Return what changed in a game since the client's version cursor."""
+    game = game_store.get(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    try:
+        since = int(request.args.get('since', -1))
+    except ValueError:
+        return jsonify({'error': 'Invalid version'}), 400
+    return jsonify(game.changes_since(since, current_user_id(), request.args.get('epoch')))
+
+@app.route('/game/<int:game_id>/events')
+def game_events(game_id):
+    """Stream game events as Server-Sent Events.
+
+    Every event carries "<epoch>:<seq>" as the SSE id, so a reconnecting
+    EventSource resumes from Last-Event-ID without missing or repeating
+    events. A cursor into another event log gets a 'reset' event instead.
+    """
+    game = game_store.get(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+
+    epoch, _, last_seq = (request.headers.get('Last-Event-ID') or request.args.get('since', '')).rpartition(':')
+    try:
+        last_seq = int(last_seq)
+    except ValueError:
+        return jsonify({'error': 'Invalid event id'}), 400
+    reset = epoch != game.epoch or not 0 <= last_seq <= len(game.events)
+
+    def stream():
+        seq = len(game.events) if reset else last_seq
+        yield 'retry: 2000\n\n'
+        if reset:
+            # The client's view is from a lost log; it reloads rather than replaying this one
+            yield f"id: {game.epoch}:{seq}\nevent: reset\ndata: {{}}\n\n"
+        while True:
+            events = game_store.wait_for_events(game_id, seq, timeout=SSE_KEEPALIVE)
+            if not events:
+                if game_id not in game_store:
+                    return  # Finished long ago and evicted
+                yield ': keepalive\n\n'
+                continue
+            for event in events:
+                seq = event['seq']
+                yield f"id: {game.epoch}:{seq}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+            if events[-1]['type'] == 'game-finished':
+                return
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/game/<int:game_id>/mark', methods=['POST'])
 def mark_number(game_id):
     """Mark a number on the player's board."""
-    if game_id not in active_games:
+    game = game_store.get(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 404
 
-    game = active_games[game_id]
-    user_id = session['user_id']
-
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
     if user_id not in game.players:
         return jsonify({'error': 'Player not in game'}), 400
 
     # Handle bingo check request
     check_win = request.json.get('check_win', False)
     if check_win:
-        winner, message = game.check_winner(user_id)
+        def claim_bingo(game):
+            winner, message = game.check_winner(user_id)
+            if winner:
+                game.end_game(user_id)
+            return winner, message
+
+        winner, message = game_store.update(game_id, claim_bingo)
         if winner:
-            game.end_game(user_id)
+            game_changed(game_store.get(game_id))
         return jsonify({
             'winner': winner,
             'message': message
@@ -291,17 +546,23 @@ def mark_number(game_id):
     if not number:
         return jsonify({'error': 'Number required'}), 400
 
-    success = game.mark_number(user_id, number)
-    if not success:
-        return jsonify({'error': 'Could not mark number'}), 400
+    def mark(game):
+        if not game.mark_number(user_id, number):
+            return None
+        # Check for win after marking
+        winner, message = game.check_winner(user_id)
+        if winner:
+            game.end_game(user_id)
+        return game.marked_numbers(user_id), winner, message
 
-    # Check for win after marking
-    winner, message = game.check_winner(user_id)
-    if winner:
-        game.end_game(user_id)
+    result = game_store.update(game_id, mark)
+    if result is None:
+        return jsonify({'error': 'Could not mark number'}), 400
+    game_changed(game_store.get(game_id))
 
+    marked, winner, message = result
     return jsonify({
-        'marked': game.players[user_id]['marked'],
+        'marked': marked,
         'winner': winner,
         'message': message
     })
@@ -0,0 +1,317 @@
+"""Simulation and benchmark harness for the Bingo game engine.
+
+Runs many full games to measure throughput and, as a Monte Carlo
+simulation, how many calls it takes before someone wins.
+
+    python benchmark.py games --games 2000 --players 50
+    python benchmark.py games --games 20000 --players 100 --numpy
+    python benchmark.py memory --games 1000 --players 100
+    python benchmark.py queries --rows 1000000 --database-url sqlite:////tmp/bench.db
+"""
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict, List
+from cartelas import CARTELAS
+from game_logic import BingoGame, WIN_PATTERNS, FREE_SPACE
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the vectorized path
+    np = None
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _outcomes(calls_to_win: List[int], winners: List[int], players: int) -> Dict[str, float]:
+    """Summarize game outcomes for tuning prizes and house edge."""
+    games = len(calls_to_win)
+    return {
+        'calls_to_win_mean': sum(calls_to_win) / games,
+        'calls_to_win_p10': percentile(calls_to_win, 10),
+        'calls_to_win_p50': percentile(calls_to_win, 50),
+        'calls_to_win_p90': percentile(calls_to_win, 90),
+        'shared_win_rate': sum(1 for w in winners if w > 1) / games,
+        'player_win_rate': sum(winners) / (games * players),
+    }
+
+def simulate_python(games: int, players: int) -> Dict[str, float]:
+    """Play full games through BingoGame and measure calls, win checks and memory."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    pool = []
+    for game_id in range(1, games + 1):
+        game = BingoGame(game_id)
+        game.min_players = players  # Start once everyone has joined
+        for user_id in range(1, players + 1):
+            game.add_player(user_id, cartela_number=user_id)
+        pool.append(game)
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    draw_times = []
+    started = time.perf_counter()
+    for game in pool:
+        while game.status == "active":
+            t0 = time.perf_counter()
+            game.draw()
+            draw_times.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    check_times = []
+    for game in pool[:100]:
+        for user_id in game.players:
+            t0 = time.perf_counter()
+            game.check_winner(user_id)
+            check_times.append(time.perf_counter() - t0)
+
+    calls = sum(len(game.called_numbers) for game in pool)
+    result = {
+        'calls_per_sec': calls / elapsed,
+        'draw_p50_us': percentile(draw_times, 50) * 1e6,
+        'draw_p99_us': percentile(draw_times, 99) * 1e6,
+        'check_p50_us': percentile(check_times, 50) * 1e6,
+        'check_p99_us': percentile(check_times, 99) * 1e6,
+        'bytes_per_game': memory / games,
+    }
+    result.update(_outcomes(
+        [len(game.called_numbers) for game in pool],
+        [len(game.winner_ids) for game in pool],
+        players
+    ))
+    return result
+
+def measure_memory(games: int, players: int) -> Dict[str, float]:
+    """Measure with tracemalloc what open games and their players keep allocated.
+
+    bytes_per_seat counts only a seat (player state, cartela reservation
+    and line counters). bytes_per_join is what a player really costs in a
+    live game: the seat plus, for about 400 bytes, the player-joined entry
+    in the game's event log that SSE clients replay from and the persister
+    writes out. Only the seat is under 200 bytes; a join is not.
+    """
+    tracemalloc.start()
+
+    def allocated() -> int:
+        return tracemalloc.get_traced_memory()[0]
+
+    def open_games() -> List[BingoGame]:
+        pool = [BingoGame(game_id) for game_id in range(1, games + 1)]
+        for game in pool:
+            game.min_players = players + 1  # Keep them waiting
+        return pool
+
+    before = allocated()
+    seated = open_games()
+    empty = allocated()
+    for game in seated:
+        for user_id in range(1, players + 1):
+            game._seat_player(user_id, user_id)
+    seats = allocated()
+
+    joined = open_games()
+    before_joins = allocated()
+    for game in joined:
+        for user_id in range(1, players + 1):
+            game.add_player(user_id, cartela_number=user_id)
+    joins = allocated()
+    tracemalloc.stop()
+
+    return {
+        'bytes_per_game': (empty - before) / games,
+        'bytes_per_seat': (seats - empty) / (games * players),
+        'bytes_per_join': (joins - before_joins) / (games * players),
+    }
+
+def simulate_numpy(games: int, players: int, seed: int = None) -> Dict[str, float]:
+    """Play all games at once with boards as matrices and win checks as reductions."""
+    if np is None:
+        raise RuntimeError("NumPy is not installed; run without --numpy")
+
+    rng = np.random.default_rng(seed)
+    table = np.frombuffer(CARTELAS._boards, dtype=np.uint8).reshape(CARTELAS.size, 25)
+    cartelas = np.argsort(rng.random((games, CARTELAS.size)), axis=1)[:, :players]
+    boards = table[cartelas]  # (games, players, 25)
+    decks = (np.argsort(rng.random((games, 75)), axis=1) + 1).astype(np.uint8)
+    lines = np.array([[pattern >> i & 1 for i in range(25)] for pattern, _ in WIN_PATTERNS],
+                     dtype=np.uint8).T  # (25, 12)
+
+    marks = np.zeros(boards.shape, dtype=bool)
+    marks[..., FREE_SPACE] = True
+    active = np.ones(games, dtype=bool)
+    calls_to_win = np.full(games, 75)
+    winners = np.zeros(games, dtype=int)
+
+    check_times = []
+    started = time.perf_counter()
+    calls = 0
+    for step in range(75):
+        calls += int(active.sum())
+        marks |= boards == decks[:, step, None, None]
+
+        t0 = time.perf_counter()
+        won = ((marks.astype(np.uint8) @ lines) == 5).any(axis=2)  # (games, players)
+        check_times.append((time.perf_counter() - t0) / (games * players))
+
+        newly = active & won.any(axis=1)
+        calls_to_win[newly] = step + 1
+        winners[newly] = won[newly].sum(axis=1)
+        active &= ~newly
+        if not active.any():
+            break
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'calls_per_sec': calls / elapsed,
+        'check_p50_us': percentile(check_times, 50) * 1e6,
+        'check_p99_us': percentile(check_times, 99) * 1e6,
+        'bytes_per_game': (boards.nbytes + marks.nbytes + decks.nbytes) / games,
+    }
+    result.update(_outcomes(calls_to_win.tolist(), winners.tolist(), players))
+    return result
+
+def _explain(engine, statement) -> List[str]:
+    """Return the database's plan for a statement."""
+    from sqlalchemy import text
+    sql = str(statement.compile(engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN ANALYZE ' if engine.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN '
+    with engine.connect() as conn:
+        return [" ".join(str(part) for part in row) for row in conn.execute(text(prefix + sql))]
+
+def _time_query(engine, make_statement, samples: int) -> Dict[str, float]:
+    timings = []
+    with engine.connect() as conn:
+        for i in range(samples):
+            statement = make_statement(i)
+            t0 = time.perf_counter()
+            conn.execute(statement).first()
+            timings.append(time.perf_counter() - t0)
+    return {'p50_ms': percentile(timings, 50) * 1e3, 'p99_ms': percentile(timings, 99) * 1e3}
+
+SCRATCH_TABLE = 'benchmark_scratch'  # Marks a database created by benchmark_queries
+
+def benchmark_queries(database_url: str, rows: int, samples: int = 200):
+    """Load rows transactions and time the deposit-path lookups with and without their indexes.
+
+    Only runs against an empty database or one it created before, since it
+    fills the tables with fake users and drops indexes while timing.
+    """
+    from sqlalchemy import create_engine, func, insert, inspect, select, text
+    import migrations
+    from models import Transaction, User
+
+    engine = create_engine(database_url)
+    tables = inspect(engine).get_table_names()
+    if tables and SCRATCH_TABLE not in tables:
+        raise SystemExit(f"Refusing to benchmark {engine.url!r}: not empty and not a scratch database "
+                         f"from an earlier run. Point --database-url at a new database.")
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {SCRATCH_TABLE} (id INTEGER PRIMARY KEY)"))
+    migrations.upgrade(engine)
+    users = max(rows // 10, 1)
+
+    with engine.begin() as conn:
+        existing = conn.execute(select(func.count()).select_from(Transaction)).scalar()
+    if existing < rows:
+        print(f"Loading {users:,} users and {rows:,} transactions...")
+        started = datetime.utcnow() - timedelta(days=365)
+        with engine.begin() as conn:
+            conn.execute(insert(User), [
+                {'telegram_id': 10_000_000 + i, 'phone': f"09{i:08d}"} for i in range(1, users + 1)
+            ])
+            for chunk in range(0, rows, 50_000):
+                conn.execute(insert(Transaction), [
+                    {
+                        'user_id': random.randint(1, users),
+                        'type': random.choice(('deposit', 'withdraw', 'game_entry', 'win')),
+                        'status': random.choice(('pending', 'completed', 'completed', 'failed')),
+                        'amount': random.choice((10, 20, 50, 100)),
+                        'created_at': started + timedelta(seconds=i * 30),
+                    }
+                    for i in range(chunk, min(chunk + 50_000, rows))
+                ])
+
+    def phone_lookup(i):
+        return select(User.id).where(User.phone == f"09{(i * 7919) % users + 1:08d}")
+
+    def pending_deposit(i):
+        return (select(Transaction.id)
+                .where(Transaction.user_id == (i * 7919) % users + 1,
+                       Transaction.type == 'deposit',
+                       Transaction.status == 'pending',
+                       Transaction.amount == 100)
+                .order_by(Transaction.created_at.desc())
+                .limit(1))
+
+    indexes = [index for table in (User.__table__, Transaction.__table__) for index in table.indexes
+               if index.name in ('ix_user_phone', 'ix_transaction_user_type_status_created')]
+    for label in ('with indexes', 'without indexes'):
+        if label == 'without indexes':
+            with engine.begin() as conn:
+                for index in indexes:
+                    index.drop(conn, checkfirst=True)
+            engine.dispose()  # Don't reuse statements prepared against the old schema
+        for name, make_statement in (('phone lookup', phone_lookup), ('pending deposit', pending_deposit)):
+            print(f"{name} ({label})")
+            for line in _explain(engine, make_statement(0)):
+                print(f"  plan: {line}")
+            _print_result_values(_time_query(engine, make_statement, samples))
+
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(conn, checkfirst=True)
+
+def _print_result_values(result: Dict[str, float]):
+    for key, value in result.items():
+        print(f"  {key:<20} {value:,.3f}")
+
+def _print_result(title: str, result: Dict[str, float]):
+    print(title)
+    _print_result_values(result)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    games_parser = commands.add_parser('games', help='simulate full games')
+    games_parser.add_argument('--games', type=int, default=1000)
+    games_parser.add_argument('--players', type=int, default=50)
+    games_parser.add_argument('--numpy', action='store_true', help='use the vectorized NumPy path')
+    games_parser.add_argument('--seed', type=int, default=None, help='RNG seed for the NumPy path')
+
+    memory_parser = commands.add_parser('memory', help='measure bytes per open game, per seat and per join')
+    memory_parser.add_argument('--games', type=int, default=1000)
+    memory_parser.add_argument('--players', type=int, default=100)
+
+    queries_parser = commands.add_parser('queries', help='time the deposit-path lookups at scale')
+    queries_parser.add_argument('--database-url', required=True, help='a new, empty database')
+    queries_parser.add_argument('--rows', type=int, default=1_000_000)
+    queries_parser.add_argument('--samples', type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == 'games':
+        if not 1 <= args.players <= CARTELAS.size:
+            parser.error(f"--players must be between 1 and {CARTELAS.size}")
+        if args.numpy:
+            result = simulate_numpy(args.games, args.players, args.seed)
+        else:
+            result = simulate_python(args.games, args.players)
+        path = 'numpy' if args.numpy else 'python'
+        _print_result(f"{args.games} games x {args.players} players ({path})", result)
+    elif args.command == 'memory':
+        if not 1 <= args.players <= CARTELAS.size:
+            parser.error(f"--players must be between 1 and {CARTELAS.size}")
+        _print_result(f"{args.games} games x {args.players} players (memory)",
+                      measure_memory(args.games, args.players))
+    elif args.command == 'queries':
+        benchmark_queries(args.database_url, args.rows, args.samples)
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import os
 import logging
 import asyncio
 import json
-from datetime import datetime
+from typing import List, Optional
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import Command
 from aiogram.types import (
@@ -15,13 +15,26 @@ from aiogram.types import (
     WebAppInfo,
     CallbackQuery
 )
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from flask import Flask
-from database import db, init_db
-from models import User, Transaction
 import aiohttp
+import bot_db
+from notifications import Notifier
+from outbox import Job, Outbox
+from config import (
+    ADMIN_IDS,
+    GAME_PRICES,
+    HTTP_CONNECTIONS,
+    HTTP_TIMEOUT,
+    LEDGER_RECONCILE_INTERVAL,
+    OUTBOX_BATCH,
+    OUTBOX_LEASE,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETRY_DELAY,
+    TELEGRAM_CONNECTIONS
+)
 
 # Configure logging
 logging.basicConfig(
@@ -38,48 +51,47 @@ if not TOKEN:
 WEBAPP_URL = f"https://{os.getenv('REPLIT_SLUG')}.replit.app" if os.getenv('REPLIT_SLUG') else "http://0.0.0.0:5000"
 router = Router()
 
-# Initialize Flask app for database context
-app = Flask(__name__)
-init_db(app)
-
-# Game prices
-GAME_PRICES = [10, 20, 50, 100]
+# Long-lived clients owned by main(); handlers receive them as workflow data
+bot: Optional[Bot] = None
+http: Optional[aiohttp.ClientSession] = None
+notifier: Optional[Notifier] = None
+last_reconciliation = None
 
 @router.callback_query(lambda c: c.data.startswith('price_'))
-async def process_price_selection(callback_query: CallbackQuery):
-    """Handle price selection and create game"""
+async def process_price_selection(callback_query: CallbackQuery, http: aiohttp.ClientSession):
+    """Handle price selection and join the filling room for that price"""
     try:
         # Extract price from callback data
         price = int(callback_query.data.split('_')[1])
 
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
-            if not user or user.balance < price:
-                await callback_query.answer("Insufficient balance. Please deposit first.", show_alert=True)
-                return
-
-            # Create game through API
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{WEBAPP_URL}/game/create", json={'entry_price': price, 'user_id': user.id}) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        game_id = data['game_id']
-
-                        # Create WebApp button for cartela selection
-                        keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                            InlineKeyboardButton(
-                                text="Select Your Cartela",
-                                web_app=WebAppInfo(url=f"{WEBAPP_URL}/game/{game_id}/select_cartela")
-                            )
-                        ]])
-
-                        await callback_query.message.edit_text(
-                            f"Game created! Entry price: {price} Birr\n"
-                            f"Please select your cartela number:",
-                            reply_markup=keyboard
-                        )
-                    else:
-                        await callback_query.answer("Failed to create game. Please try again.", show_alert=True)
+        user = await bot_db.get_user(callback_query.from_user.id)
+        if not user or user.balance < price:
+            await callback_query.answer("Insufficient balance. Please deposit first.", show_alert=True)
+            return
+
+        # Join the price tier's room through the API
+        async with http.post(f"{WEBAPP_URL}/game/create", json={'entry_price': price}) as response:
+            if response.status == 200:
+                data = await response.json()
+                game_id = data['game_id']
+                players = data.get('players', 0)
+
+                # Create WebApp button for cartela selection
+                keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+                    InlineKeyboardButton(
+                        text="Select Your Cartela",
+                        web_app=WebAppInfo(url=f"{WEBAPP_URL}/game/{game_id}/select_cartela")
+                    )
+                ]])
+
+                await callback_query.message.edit_text(
+                    f"Joining game #{game_id} ({players} player{'s' if players != 1 else ''} waiting). "
+                    f"Entry price: {price} Birr\n"
+                    f"Please select your cartela number:",
+                    reply_markup=keyboard
+                )
+            else:
+                await callback_query.answer("Failed to find a game. Please try again.", show_alert=True)
     except Exception as e:
         logger.error(f"Error processing price selection: {e}")
         await callback_query.answer("Sorry, there was an error. Please try again.", show_alert=True)
@@ -95,7 +107,7 @@ async def setup_bot():
     """Setup bot and dispatcher"""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
-    bot = Bot(token=TOKEN)
+    bot = Bot(token=TOKEN, session=AiohttpSession(limit=TELEGRAM_CONNECTIONS))
 
     # Include router
     dp.include_router(router)
@@ -114,104 +126,89 @@ async def cmd_start(message: Message):
         args = message.text.split()[1:] if len(message.text.split()) > 1 else []
         referrer_id = int(args[0]) if args else None
 
-        with app.app_context():
-            # Check if user exists
-            user = User.query.filter_by(telegram_id=user_id).first()
+        user, created = await bot_db.register_user(user_id, username, referrer_id)
 
-            if not user:
-                # New user registration
-                user = User(
-                    telegram_id=user_id,
-                    username=username,
-                    referrer_id=referrer_id
-                )
-                db.session.add(user)
-                db.session.commit()
-                logger.info(f"New user registered: {user_id} ({username})")
-
-                keyboard = ReplyKeyboardMarkup(
-                    keyboard=[[KeyboardButton(text="📱 Share Phone Number", request_contact=True)]],
-                    resize_keyboard=True,
-                    one_time_keyboard=True
-                )
+        if created:
+            logger.info(f"New user registered: {user_id} ({username})")
 
-                await message.answer(
-                    "Welcome to Addis Bingo! 🎮\n\n"
-                    "Please share your phone number to complete registration.",
-                    reply_markup=keyboard
-                )
-            else:
-                # Returning user - show main menu
-                await show_main_menu(message)
+            keyboard = ReplyKeyboardMarkup(
+                keyboard=[[KeyboardButton(text="📱 Share Phone Number", request_contact=True)]],
+                resize_keyboard=True,
+                one_time_keyboard=True
+            )
+
+            await message.answer(
+                "Welcome to Addis Bingo! 🎮\n\n"
+                "Please share your phone number to complete registration.",
+                reply_markup=keyboard
+            )
+        else:
+            # Returning user - show main menu
+            await show_main_menu(message, user)
 
     except Exception as e:
         logger.error(f"Error in start command: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
 
-async def show_main_menu(message: Message):
+async def show_main_menu(message: Message, user: Optional[bot_db.UserRecord] = None):
     """Show main menu with balance and options"""
     try:
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-            if not user:
-                logger.error(f"User not found for main menu: {message.from_user.id}")
-                await message.answer("Please register first using /start")
-                return
+        if user is None:
+            user = await bot_db.get_user(message.from_user.id)
+        if not user:
+            logger.error(f"User not found for main menu: {message.from_user.id}")
+            await message.answer("Please register first using /start")
+            return
 
-            keyboard = ReplyKeyboardMarkup(
-                keyboard=[
-                    [KeyboardButton(text="🎮 Play Bingo")],
-                    [KeyboardButton(text="💰 Deposit"), KeyboardButton(text="💳 Withdraw")],
-                    [KeyboardButton(text="📊 My Stats")]
-                ],
-                resize_keyboard=True
-            )
+        keyboard = ReplyKeyboardMarkup(
+            keyboard=[
+                [KeyboardButton(text="🎮 Play Bingo")],
+                [KeyboardButton(text="💰 Deposit"), KeyboardButton(text="💳 Withdraw")],
+                [KeyboardButton(text="📊 My Stats")]
+            ],
+            resize_keyboard=True
+        )
 
-            await message.answer(
-                f"🎯 Main Menu\n\n"
-                f"💰 Balance: {user.balance:.2f} birr\n"
-                f"🎮 Games played: {user.games_played}\n"
-                f"🏆 Games won: {user.games_won}\n",
-                reply_markup=keyboard
-            )
+        await message.answer(
+            f"🎯 Main Menu\n\n"
+            f"💰 Balance: {user.balance:.2f} birr\n"
+            f"🎮 Games played: {user.games_played}\n"
+            f"🏆 Games won: {user.games_won}\n",
+            reply_markup=keyboard
+        )
     except Exception as e:
         logger.error(f"Error showing main menu: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
 
 @router.message(F.contact)
-async def process_phone_number(message: Message):
+async def process_phone_number(message: Message, bot: Bot):
     """Handle shared contact information"""
     if not message.contact or message.contact.user_id != message.from_user.id:
         await message.answer("Please share your own contact information.")
         return
 
     try:
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-            if not user:
-                await message.answer("Please use /start first!")
-                return
-
-            user.phone = message.contact.phone_number
-            db.session.commit()
-            logger.info(f"Phone number registered for user: {message.from_user.id}")
-
-            bot = Bot(token=TOKEN)
-            bot_info = await bot.get_me()
-            referral_link = f"https://t.me/{bot_info.username}?start={message.from_user.id}"
-
-            await message.answer(
-                "✅ Registration complete!\n\n"
-                f"Your referral link: {referral_link}\n\n"
-                "Share this link with friends and earn 20 birr when they:\n"
-                "1. Register and verify their phone number\n"
-                "2. Make their first deposit\n"
-                "3. Play their first game\n",
-                reply_markup=ReplyKeyboardRemove()
-            )
+        user = await bot_db.set_phone(message.from_user.id, message.contact.phone_number)
+        if not user:
+            await message.answer("Please use /start first!")
+            return
+        logger.info(f"Phone number registered for user: {message.from_user.id}")
+
+        bot_info = await bot.me()  # Cached by the Bot after the first call
+        referral_link = f"https://t.me/{bot_info.username}?start={message.from_user.id}"
+
+        await message.answer(
+            "✅ Registration complete!\n\n"
+            f"Your referral link: {referral_link}\n\n"
+            "Share this link with friends and earn 20 birr when they:\n"
+            "1. Register and verify their phone number\n"
+            "2. Make their first deposit\n"
+            "3. Play their first game\n",
+            reply_markup=ReplyKeyboardRemove()
+        )
 
-            # Show main menu
-            await show_main_menu(message)
+        # Show main menu
+        await show_main_menu(message, user)
     except Exception as e:
         logger.error(f"Error processing phone number: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
@@ -221,25 +218,23 @@ async def process_phone_number(message: Message):
 async def process_play_command(message: Message):
     """Handle play command - show game price options"""
     try:
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-
-            if not user:
-                await message.answer("Please register first using /start")
-                return
-
-            # Create buttons for each price option
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text=f"{price} Birr",
-                    callback_data=f"price_{price}"
-                )] for price in GAME_PRICES
-            ])
+        user = await bot_db.get_user(message.from_user.id)
+        if not user:
+            await message.answer("Please register first using /start")
+            return
 
-            await message.answer(
-                "Choose your game entry price:",
-                reply_markup=keyboard
-            )
+        # Create buttons for each price option
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text=f"{price} Birr",
+                callback_data=f"price_{price}"
+            )] for price in GAME_PRICES
+        ])
+
+        await message.answer(
+            "Choose your game entry price:",
+            reply_markup=keyboard
+        )
     except Exception as e:
         logger.error(f"Error processing play command: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
@@ -248,18 +243,17 @@ async def process_play_command(message: Message):
 async def process_deposit_command(message: Message, state: FSMContext):
     """Handle deposit command"""
     try:
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-            if not user:
-                await message.answer("Please register first using /start")
-                return
+        user = await bot_db.get_user(message.from_user.id)
+        if not user:
+            await message.answer("Please register first using /start")
+            return
 
-            await state.set_state(UserState.waiting_for_deposit_amount)
-            await message.answer(
-                "💰 Enter the amount you want to deposit (in birr):\n\n"
-                "Minimum: 10 birr\n"
-                "Maximum: 1000 birr\n"
-            )
+        await state.set_state(UserState.waiting_for_deposit_amount)
+        await message.answer(
+            "💰 Enter the amount you want to deposit (in birr):\n\n"
+            "Minimum: 10 birr\n"
+            "Maximum: 1000 birr\n"
+        )
     except Exception as e:
         logger.error(f"Error processing deposit command: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
@@ -279,29 +273,22 @@ async def process_deposit_amount(message: Message, state: FSMContext):
         # Store amount in state
         await state.update_data(deposit_amount=amount)
 
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-
-            # Create pending transaction
-            transaction = Transaction(
-                user_id=user.id,
-                type='deposit',
-                amount=amount,
-                status='pending'
-            )
-            db.session.add(transaction)
-            db.session.commit()
+        # Create pending transaction
+        user = await bot_db.create_deposit(message.from_user.id, amount)
+        if not user:
+            await message.answer("Please register first using /start")
+            return
 
-            await state.set_state(UserState.waiting_for_deposit_sms)
-            await message.answer(
-                f"✅ Amount confirmed: {amount} birr\n\n"
-                "Please complete your deposit:\n\n"
-                "1. Send money to one of these accounts:\n"
-                "   - CBE: 1000123456 (Abebe)\n"
-                "   - Telebirr: 0911111111\n"
-                "2. Wait for confirmation\n\n"
-                "⚠️ Your deposit will be processed automatically once received."
-            )
+        await state.set_state(UserState.waiting_for_deposit_sms)
+        await message.answer(
+            f"✅ Amount confirmed: {amount} birr\n\n"
+            "Please complete your deposit:\n\n"
+            "1. Send money to one of these accounts:\n"
+            "   - CBE: 1000123456 (Abebe)\n"
+            "   - Telebirr: 0911111111\n"
+            "2. Wait for confirmation\n\n"
+            "⚠️ Your deposit will be processed automatically once received."
+        )
     except ValueError:
         await message.answer("⚠️ Please enter a valid amount")
     except Exception as e:
@@ -309,97 +296,103 @@ async def process_deposit_amount(message: Message, state: FSMContext):
         await message.answer("Sorry, there was an error. Please try again later.")
 
 async def send_notification(user_id: int, message: str):
-    """Send a notification to a user through Telegram Bot API securely."""
-    try:
-        logger.info(f"Attempting to send notification to user {user_id}")
-        bot = Bot(token=TOKEN)  # Using environment variable
-
-        # Send message with HTML formatting
-        sent_message = await bot.send_message(
-            chat_id=user_id,
-            text=message,
-            parse_mode="HTML"  # Support HTML formatting
+    """Queue a notification to a user; the notifier sends it within Telegram's rate limits."""
+    if notifier is None:
+        raise RuntimeError("Notifier is not running")
+    notifier.send(user_id, message)
+
+async def process_deposit_confirmations(outbox: Outbox, jobs: List[Job]):
+    """Apply a batch of deposit webhooks from the outbox and notify the users"""
+    deposits = [
+        (job.payload.get('phone'), float(job.payload.get('amount', 0)), job.payload.get('idempotency_key'))
+        for job in jobs
+    ]
+    logger.info(f"Processing {len(jobs)} deposit confirmations")
+
+    # One transaction for the batch; an unmatched deposit doesn't affect the others
+    results = await bot_db.confirm_deposits(deposits)
+
+    done = []
+    for job, (phone, amount, key), result in zip(jobs, deposits, results):
+        if result.status == 'unmatched':
+            # The SMS may arrive before the user has entered the amount, so retry for a while
+            logger.warning(f"Deposit job {job.id} not applied (attempt {job.attempts}): {result.error}")
+            delay = min(OUTBOX_RETRY_DELAY * 2 ** (job.attempts - 1), 3600)
+            await asyncio.to_thread(outbox.retry, job, result.error, delay)
+            continue
+
+        done.append(job.id)
+        if result.status == 'duplicate':
+            logger.info(f"Deposit job {job.id} was already applied (key {key})")
+            continue
+
+        user = result.user
+        await send_notification(
+            user_id=user.telegram_id,
+            message=f"✅ <b>Deposit Approved!</b>\n\n"
+                   f"Amount: {amount:.2f} birr\n"
+                   f"New Balance: {user.balance:.2f} birr"
         )
-
-        logger.info(f"Successfully sent notification to user {user_id}: {message}")
-        return sent_message
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {user_id}: {e}")
-        raise
-
-async def process_deposit_confirmation(data: dict):
-    """Handle deposit confirmation from webhook"""
-    try:
-        # Extract data from webhook
-        received_amount = float(data.get('amount', 0))
-        received_phone = data.get('phone')
-
-        logger.info(f"Processing deposit confirmation: amount={received_amount}, phone={received_phone}")
-
-        with app.app_context():
-            # Find user by phone number
-            user = User.query.filter_by(phone=received_phone).first()
-            if not user:
-                error_msg = f"No user found with phone: {received_phone}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-
-            # Get pending transaction
-            transaction = Transaction.query.filter_by(
-                user_id=user.id,
-                type='deposit',
-                status='pending',
-                amount=received_amount
-            ).order_by(Transaction.created_at.desc()).first()
-
-            if transaction:
-                # Auto-approve the deposit
-                transaction.status = 'completed'
-                transaction.completed_at = datetime.utcnow()
-
-                # Update user balance
-                user.balance += received_amount
-                db.session.commit()
-
-                # Send notification using secure method
-                await send_notification(
-                    user_id=user.telegram_id,
-                    message=f"✅ <b>Deposit Approved!</b>\n\n"
-                           f"Amount: {received_amount:.2f} birr\n"
-                           f"New Balance: {user.balance:.2f} birr"
-                )
-                logger.info(f"Deposit approved for user {user.id}: {received_amount} birr")
-            else:
-                error_msg = f"No pending deposit found for user {user.id} with amount {received_amount}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-
-    except Exception as e:
-        logger.error(f"Error processing deposit confirmation: {e}")
-        raise
+        logger.info(f"Deposit approved for user {user.id}: {amount} birr")
+
+    await asyncio.to_thread(outbox.complete, done)
+
+async def process_game_results(outbox: Outbox, jobs: List[Job]):
+    """Send every player of the finished games their result"""
+    for job in jobs:
+        notifier.send_many((chat_id, text) for chat_id, text in job.payload['messages'])
+        logger.info(f"Queued results of game {job.payload['game_id']} for {len(job.payload['messages'])} players")
+    await asyncio.to_thread(outbox.complete, [job.id for job in jobs])
+
+async def reconcile_periodically():
+    """Check cached balances against the ledger on a fixed interval"""
+    global last_reconciliation
+    while True:
+        await asyncio.sleep(LEDGER_RECONCILE_INTERVAL)
+        try:
+            last_reconciliation = await bot_db.reconcile_ledger()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Error reconciling ledger: {e}")
+
+async def consume(outbox: Outbox, kind: str, process):
+    """Hand jobs of one kind queued by the web app to process, a batch at a time"""
+    while True:
+        try:
+            jobs = await asyncio.to_thread(outbox.claim, kind, OUTBOX_BATCH, OUTBOX_LEASE)
+            if not jobs:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+                continue
+            await process(outbox, jobs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Claimed jobs become available again when their lease runs out
+            logger.exception(f"Error processing {kind} jobs: {e}")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
 
 @router.message(F.text == "💳 Withdraw")
 async def process_withdraw_command(message: Message, state: FSMContext):
     """Handle withdraw command"""
     try:
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-            if not user:
-                await message.answer("Please register first using /start")
-                return
+        user = await bot_db.get_user(message.from_user.id)
+        if not user:
+            await message.answer("Please register first using /start")
+            return
 
-            if user.balance < 100:
-                await message.answer("⚠️ Minimum withdrawal amount is 100 birr")
-                return
+        if user.balance < 100:
+            await message.answer("⚠️ Minimum withdrawal amount is 100 birr")
+            return
 
-            await state.set_state(UserState.waiting_for_withdrawal)
-            await message.answer(
-                "💳 Withdrawal Rules:\n\n"
-                "1. Minimum: 100 birr\n"
-                "2. Must have played at least 5 games\n"
-                "3. Processing time: 24 hours\n\n"
-                "Reply with the amount you want to withdraw:"
-            )
+        await state.set_state(UserState.waiting_for_withdrawal)
+        await message.answer(
+            "💳 Withdrawal Rules:\n\n"
+            "1. Minimum: 100 birr\n"
+            "2. Must have played at least 5 games\n"
+            "3. Processing time: 24 hours\n\n"
+            "Reply with the amount you want to withdraw:"
+        )
     except Exception as e:
         logger.error(f"Error processing withdraw command: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
@@ -408,31 +401,52 @@ async def process_withdraw_command(message: Message, state: FSMContext):
 async def process_stats_command(message: Message):
     """Handle stats command"""
     try:
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-            if not user:
-                await message.answer("Please register first using /start")
-                return
-
-            # Get transaction history
-            transactions = Transaction.query.filter_by(user_id=user.id).order_by(Transaction.created_at.desc()).limit(5).all()
-
-            stats = (
-                f"📊 Your Stats\n\n"
-                f"💰 Current Balance: {user.balance:.2f} birr\n"
-                f"🎮 Games Played: {user.games_played}\n"
-                f"🏆 Games Won: {user.games_won}\n\n"
-                f"Recent Transactions:\n"
-            )
+        # User and transaction history in one round trip
+        user, transactions = await bot_db.get_stats(message.from_user.id, limit=5)
+        if not user:
+            await message.answer("Please register first using /start")
+            return
 
-            for tx in transactions:
-                stats += f"{'➕' if tx.amount > 0 else '➖'} {abs(tx.amount)} birr - {tx.type} ({tx.status})\n"
+        stats = (
+            f"📊 Your Stats\n\n"
+            f"💰 Current Balance: {user.balance:.2f} birr\n"
+            f"🎮 Games Played: {user.games_played}\n"
+            f"🏆 Games Won: {user.games_won}\n\n"
+            f"Recent Transactions:\n"
+        )
 
-            await message.answer(stats)
+        for tx in transactions:
+            stats += f"{'➕' if tx.amount > 0 else '➖'} {abs(tx.amount)} birr - {tx.type} ({tx.status})\n"
+
+        await message.answer(stats)
     except Exception as e:
         logger.error(f"Error processing stats command: {e}")
         await message.answer("Sorry, there was an error. Please try again later.")
 
+@router.message(Command("metrics"))
+async def cmd_metrics(message: Message):
+    """Show bot cache and notification counters to admins"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    sections = [("User cache", bot_db.cache_stats())]
+    if notifier is not None:
+        sections.append(("Notifications", notifier.stats()))
+    if last_reconciliation is not None:
+        sections.append(("Ledger", {
+            'users_checked': last_reconciliation.users_checked,
+            'ledger_total_cents': last_reconciliation.ledger_total,
+            'mismatched_balances': len(last_reconciliation.mismatches),
+        }))
+
+    text = "📈 Metrics"
+    for title, values in sections:
+        text += f"\n\n{title}\n" + "\n".join(
+            f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}"
+            for key, value in values.items()
+        )
+    await message.answer(text)
+
 @router.message(UserState.waiting_for_withdrawal)
 async def process_withdrawal_request(message: Message, state: FSMContext):
     """Handle withdrawal amount input"""
@@ -442,29 +456,18 @@ async def process_withdrawal_request(message: Message, state: FSMContext):
             await message.answer("⚠️ Minimum withdrawal amount is 100 birr")
             return
 
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=message.from_user.id).first()
-            if amount > user.balance:
-                await message.answer("⚠️ Insufficient balance")
-                return
-
-            # Create withdrawal transaction
-            transaction = Transaction(
-                user_id=user.id,
-                type='withdraw',
-                amount=-amount,  # Negative amount for withdrawals
-                status='pending',
-                withdrawal_phone=user.phone
-            )
-            db.session.add(transaction)
-            db.session.commit()
+        # Create withdrawal transaction
+        user, created = await bot_db.create_withdrawal(message.from_user.id, amount)
+        if not created:
+            await message.answer("⚠️ Insufficient balance")
+            return
 
-            await message.answer(
-                "✅ Withdrawal request received!\n\n"
-                f"Amount: {amount} birr\n"
-                "Status: Pending admin approval\n\n"
-                "You'll receive a notification once it's processed."
-            )
+        await message.answer(
+            "✅ Withdrawal request received!\n\n"
+            f"Amount: {amount} birr\n"
+            "Status: Pending admin approval\n\n"
+            "You'll receive a notification once it's processed."
+        )
     except ValueError:
         await message.answer("⚠️ Please enter a valid amount")
         return
@@ -477,15 +480,39 @@ async def process_withdrawal_request(message: Message, state: FSMContext):
 
 async def main():
     """Main entry point for the bot"""
+    global bot, http, notifier
+    deposits = results = reconciler = None
     try:
         logger.info("Starting bot...")
         bot, dp = await setup_bot()
-
-        # Start polling
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+        notifier = Notifier(bot)
+        notifier.start()
+        outbox = Outbox()
+        deposits = asyncio.create_task(consume(outbox, 'deposit', process_deposit_confirmations))
+        results = asyncio.create_task(consume(outbox, 'game-result', process_game_results))
+        reconciler = asyncio.create_task(reconcile_periodically())
+
+        # Start polling; http is passed to handlers that ask for it
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types(), http=http)
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
         raise
+    finally:
+        background = [task for task in (deposits, results, reconciler) if task is not None]
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if notifier is not None:
+            await notifier.stop()
+        if http is not None:
+            await http.close()
+        if bot is not None:
+            await bot.session.close()
+        bot = http = notifier = None
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,253 @@
+"""Async data access for the Telegram bot.
+
+Handlers await these functions instead of querying inside the event loop.
+Each call runs on a bounded thread pool in its own app context, so it
+gets its own pooled session and a slow query only ties up one pool
+thread, never the loop that serves every other update.
+
+User rows are cached per process by telegram_id for USER_CACHE_TTL
+seconds. Writes made here refresh the cached entry; balance changes made
+by the web process (game entries, prizes) become visible within the TTL.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import datetime
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+from config import BOT_DB_THREADS, USER_CACHE_SIZE, USER_CACHE_TTL
+from database import db, init_db
+import ledger
+from models import User, Transaction
+from user_cache import UserCache
+
+# Flask app for database context
+app = Flask(__name__)
+init_db(app)
+
+_executor = ThreadPoolExecutor(max_workers=BOT_DB_THREADS, thread_name_prefix="bot-db")
+_users = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+@dataclass(frozen=True)
+class UserRecord:
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    phone: Optional[str]
+    balance: float
+    games_played: int
+    games_won: int
+
+    @classmethod
+    def from_model(cls, user: User) -> 'UserRecord':
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            phone=user.phone,
+            balance=user.balance or 0.0,
+            games_played=user.games_played or 0,
+            games_won=user.games_won or 0
+        )
+
+@dataclass(frozen=True)
+class TransactionRecord:
+    type: str
+    amount: float
+    status: str
+
+@dataclass(frozen=True)
+class DepositResult:
+    status: str  # applied, duplicate, unmatched
+    user: Optional[UserRecord] = None
+    error: Optional[str] = None
+
+def _in_app_context(func, *args):
+    with app.app_context():
+        try:
+            return func(*args)
+        except Exception:
+            db.session.rollback()
+            raise
+
+async def _run(func, *args):
+    """Run a blocking database function on the pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(_in_app_context, func, *args))
+
+def _find_user(telegram_id: int) -> Optional[User]:
+    return User.query.filter_by(telegram_id=telegram_id).first()
+
+def _get_user(telegram_id: int) -> Optional[UserRecord]:
+    user = _find_user(telegram_id)
+    return UserRecord.from_model(user) if user else None
+
+def _register_user(telegram_id: int, username: Optional[str], referrer_id: Optional[int]) -> Tuple[UserRecord, bool]:
+    user = _find_user(telegram_id)
+    if user:
+        return UserRecord.from_model(user), False
+
+    user = User(telegram_id=telegram_id, username=username, referrer_id=referrer_id)
+    db.session.add(user)
+    db.session.commit()
+    return UserRecord.from_model(user), True
+
+def _set_phone(telegram_id: int, phone: str) -> Optional[UserRecord]:
+    user = _find_user(telegram_id)
+    if not user:
+        return None
+    user.phone = phone
+    db.session.commit()
+    return UserRecord.from_model(user)
+
+def _create_deposit(telegram_id: int, amount: float) -> Optional[UserRecord]:
+    user = _find_user(telegram_id)
+    if not user:
+        return None
+    db.session.add(Transaction(user_id=user.id, type='deposit', amount=amount, status='pending'))
+    db.session.commit()
+    return UserRecord.from_model(user)
+
+def _create_withdrawal(telegram_id: int, amount: float) -> Tuple[Optional[UserRecord], bool]:
+    user = _find_user(telegram_id)
+    if not user or amount > user.balance:
+        return (UserRecord.from_model(user) if user else None), False
+
+    db.session.add(Transaction(
+        user_id=user.id,
+        type='withdraw',
+        amount=-amount,  # Negative amount for withdrawals
+        status='pending',
+        withdrawal_phone=user.phone
+    ))
+    db.session.commit()
+    return UserRecord.from_model(user), True
+
+def _get_stats(telegram_id: int, limit: int) -> Tuple[Optional[UserRecord], List[TransactionRecord]]:
+    user = _find_user(telegram_id)
+    if not user:
+        return None, []
+    transactions = (Transaction.query
+                    .filter_by(user_id=user.id)
+                    .order_by(Transaction.created_at.desc())
+                    .limit(limit)
+                    .all())
+    return UserRecord.from_model(user), [TransactionRecord(tx.type, tx.amount, tx.status) for tx in transactions]
+
+def _deposit_applied(key: str) -> bool:
+    return Transaction.query.filter_by(transaction_id=key).first() is not None
+
+def _apply_deposit(phone: str, amount: float, key: Optional[str]) -> DepositResult:
+    if key is not None and _deposit_applied(key):
+        return DepositResult('duplicate')
+
+    user = User.query.filter_by(phone=phone).first()
+    if not user:
+        return DepositResult('unmatched', error=f"No user found with phone: {phone}")
+
+    # Lock the pending deposit so a concurrent webhook can't complete it too
+    transaction = Transaction.query.filter_by(
+        user_id=user.id,
+        type='deposit',
+        status='pending',
+        amount=amount
+    ).order_by(Transaction.created_at.desc()).with_for_update().first()
+    if not transaction:
+        return DepositResult('unmatched', error=f"No pending deposit found for user {user.id} with amount {amount}")
+
+    # Auto-approve the deposit; the unique transaction_id rejects a concurrent replay at flush
+    transaction.status = 'completed'
+    transaction.completed_at = datetime.utcnow()
+    transaction.transaction_id = key
+    transaction.deposit_phone = phone
+    db.session.flush()
+
+    cents = ledger.to_cents(amount)
+    balances = ledger.post('deposit', [
+        (ledger.USER, user.id, cents),
+        (ledger.DEPOSITS, None, -cents),
+    ], reference=f"transaction:{transaction.id}")
+    return DepositResult('applied', replace(UserRecord.from_model(user), balance=balances[user.id] / 100))
+
+def _confirm_deposits(deposits: List[Tuple[str, float, Optional[str]]]) -> List[DepositResult]:
+    results = []
+    for phone, amount, key in deposits:
+        # A savepoint per deposit, so one failure doesn't undo the batch
+        try:
+            with db.session.begin_nested():
+                results.append(_apply_deposit(phone, amount, key))
+        except IntegrityError:
+            results.append(DepositResult('duplicate'))  # Same key committed concurrently
+    db.session.commit()
+    return results
+
+def _cache(user: Optional[UserRecord], generation: Optional[int] = None) -> Optional[UserRecord]:
+    if user is not None:
+        _users.put(user.telegram_id, user, generation)
+    return user
+
+async def _write(telegram_id: int, func, *args):
+    # Invalidate first so a lookup already in flight can't cache the old row
+    _users.invalidate(telegram_id)
+    return await _run(func, *args)
+
+async def get_user(telegram_id: int) -> Optional[UserRecord]:
+    """Look up a user by Telegram id, from the cache when fresh."""
+    user = _users.get(telegram_id)
+    if user is not None:
+        return user
+    generation = _users.generation(telegram_id)
+    return _cache(await _run(_get_user, telegram_id), generation)
+
+async def register_user(telegram_id: int, username: Optional[str],
+                        referrer_id: Optional[int] = None) -> Tuple[UserRecord, bool]:
+    """Return the user, creating them first if needed; the flag is True for new users."""
+    user = _users.get(telegram_id)
+    if user is not None:
+        return user, False
+    generation = _users.generation(telegram_id)
+    user, created = await _run(_register_user, telegram_id, username, referrer_id)
+    return _cache(user, generation), created
+
+async def set_phone(telegram_id: int, phone: str) -> Optional[UserRecord]:
+    """Save a user's phone number."""
+    return _cache(await _write(telegram_id, _set_phone, telegram_id, phone))
+
+async def create_deposit(telegram_id: int, amount: float) -> Optional[UserRecord]:
+    """Record a pending deposit for the user."""
+    return await _run(_create_deposit, telegram_id, amount)
+
+async def create_withdrawal(telegram_id: int, amount: float) -> Tuple[Optional[UserRecord], bool]:
+    """Record a pending withdrawal; the flag is False if the balance is too low."""
+    user, created = await _write(telegram_id, _create_withdrawal, telegram_id, amount)
+    return _cache(user), created
+
+async def get_stats(telegram_id: int, limit: int = 5) -> Tuple[Optional[UserRecord], List[TransactionRecord]]:
+    """Return the user with their most recent transactions."""
+    # Always read through: the user row is fetched anyway, so refresh the cache with it
+    generation = _users.generation(telegram_id)
+    user, transactions = await _run(_get_stats, telegram_id, limit)
+    return _cache(user, generation), transactions
+
+async def confirm_deposits(deposits: List[Tuple[str, float, Optional[str]]]) -> List[DepositResult]:
+    """Apply (phone, amount, idempotency key) deposits in one transaction.
+
+    A deposit whose key was already applied is reported as a duplicate and
+    leaves balances alone.
+    """
+    results = await _run(_confirm_deposits, deposits)
+    for result in results:
+        if result.user is not None:
+            _users.invalidate(result.user.telegram_id)
+            _cache(result.user)
+    return results
+
+async def reconcile_ledger() -> ledger.Reconciliation:
+    """Check cached balances against the ledger."""
+    return await _run(ledger.reconcile)
+
+def cache_stats() -> Dict[str, float]:
+    """Hit/miss counters for the User cache."""
+    return _users.stats()
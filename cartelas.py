@@ -0,0 +1,95 @@
+import os
+import json
+import random
+import logging
+from array import array
+from typing import List, Optional, Tuple
+from config import CARTELA_SIZE
+
+logger = logging.getLogger(__name__)
+
+CARTELA_VERSION = 1
+CARTELA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cartelas.json')
+BOARD_SIZE = 25
+
+class CartelaTable:
+    """Read-only table of every cartela board, stored flat as 25 bytes per cartela.
+
+    Also indexes, once for every game, which cartelas hold each number, so
+    games keep no per-player board copies or number indexes.
+    """
+
+    def __init__(self, version: int, boards: bytes):
+        self.version = version
+        self._boards = boards
+        self.size = len(boards) // BOARD_SIZE
+        holders: List[List[Tuple[int, int]]] = [[] for _ in range(76)]
+        for index, number in enumerate(boards):
+            holders[number].append((index // BOARD_SIZE + 1, index % BOARD_SIZE))
+        self._holders = [tuple(h) for h in holders]  # number -> ((cartela_number, position), ...)
+
+    def __contains__(self, cartela_number: int) -> bool:
+        return 1 <= cartela_number <= self.size
+
+    def board(self, cartela_number: int) -> List[int]:
+        """Return the 25 numbers of a cartela, row by row."""
+        if cartela_number not in self:
+            raise KeyError(f"Unknown cartela number: {cartela_number}")
+        start = (cartela_number - 1) * BOARD_SIZE
+        return list(self._boards[start:start + BOARD_SIZE])
+
+    def position(self, cartela_number: int, number: int) -> Optional[int]:
+        """Return where a number sits on a cartela's board, or None if it isn't on it."""
+        if cartela_number not in self or not 1 <= number <= 75:
+            return None
+        start = (cartela_number - 1) * BOARD_SIZE
+        index = self._boards.find(number, start, start + BOARD_SIZE)
+        return index - start if index >= 0 else None
+
+    def holders(self, number: int) -> Tuple[Tuple[int, int], ...]:
+        """Return (cartela_number, position) for every cartela holding a number."""
+        return self._holders[number] if 1 <= number <= 75 else ()
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.version,
+            'size': self.size,
+            'boards': [self.board(n) for n in range(1, self.size + 1)]
+        }
+
+def generate_boards(count: int) -> bytes:
+    """Generate boards 1..count, each from its own RNG seeded with the cartela number."""
+    table = array('B')
+    for cartela_number in range(1, count + 1):
+        # A private generator per cartela keeps boards reproducible without
+        # touching the process-wide random state
+        rng = random.Random(cartela_number)
+        columns = [rng.sample(range(start, start + 15), 5) for start in (1, 16, 31, 46, 61)]
+        for row in range(5):
+            table.extend(column[row] for column in columns)
+    return table.tobytes()
+
+def load_cartelas(path: str = CARTELA_FILE) -> CartelaTable:
+    """Load the persisted cartela table, generating and saving it if missing."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        boards = bytes(number for board in data['boards'] for number in board)
+        table = CartelaTable(data['version'], boards)
+        if table.size != CARTELA_SIZE:
+            logger.warning(f"Cartela file has {table.size} boards, config expects {CARTELA_SIZE}")
+        return table
+    except FileNotFoundError:
+        pass
+
+    table = CartelaTable(CARTELA_VERSION, generate_boards(CARTELA_SIZE))
+    try:
+        with open(path, 'w') as f:
+            json.dump(table.to_dict(), f, separators=(',', ':'))
+        logger.info(f"Generated cartela table v{table.version} at {path}")
+    except OSError as e:
+        logger.warning(f"Could not persist cartela table: {e}")
+    return table
+
+# Shared by every game; generated once per process
+CARTELAS = load_cartelas()
@@ -3,14 +3,55 @@ import os
 # Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMIN_IDS = [int(id) for id in os.getenv("ADMIN_IDS", "").split(",") if id]
+WEBAPP_AUTH_MAX_AGE = 86400  # seconds a WebApp's signed initData is accepted for
 
 # Game Configuration
 CARTELA_SIZE = 100
 MIN_PLAYERS = 2
 GAME_PRICES = [10, 20, 50, 100]  # in birr
+LOBBY_COUNTDOWN = float(os.getenv("LOBBY_COUNTDOWN", "30"))  # seconds a room keeps filling once MIN_PLAYERS are in
 MIN_GAMES_FOR_WITHDRAWAL = 5
 MIN_WINS_FOR_WITHDRAWAL = 1
 REFERRAL_BONUS = 20  # in birr
+HOUSE_CUT = float(os.getenv("HOUSE_CUT", "0.1"))  # share of each pot kept by the house
+CALL_INTERVAL = float(os.getenv("CALL_INTERVAL", "5"))  # seconds between called numbers
+PERSIST_INTERVAL = 0.3  # seconds between write-behind flushes of live game state
+
+# Game Store Configuration
+GAME_STORE = os.getenv("GAME_STORE", "memory")  # memory (single worker) or sqlite (shared by workers)
+GAME_STORE_PATH = os.getenv("GAME_STORE_PATH", "games.sqlite3")
+FINISHED_GAME_TTL = 300  # seconds a finished game stays in the store for late readers
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() if GAME_STORE == "sqlite" else 1))
+LOBBY_SYNC_INTERVAL = 2  # seconds between lobby refreshes from a shared store
+
+# Streaming Configuration
+SSE_KEEPALIVE = 15  # seconds between keepalive comments on idle event streams
+WEB_CONNECTIONS = int(os.getenv("WEB_CONNECTIONS", "2000"))  # concurrent requests and event streams per web worker
+
+# Bot Configuration
+BOT_DB_THREADS = int(os.getenv("BOT_DB_THREADS", "8"))  # bot database threads; keep within the engine's pool
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))  # User rows cached by the bot
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))  # seconds before a cached User is re-read
+TELEGRAM_CONNECTIONS = 100  # pooled connections from the shared Bot to the Telegram API
+HTTP_CONNECTIONS = 20  # pooled connections from the bot to the web app
+HTTP_TIMEOUT = 10  # seconds for a bot request to the web app
+
+# Notification Configuration
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "8"))  # concurrent sends to Telegram
+NOTIFY_GLOBAL_RATE = 30  # messages per second across all chats
+NOTIFY_CHAT_RATE = 1  # messages per second to one chat
+NOTIFY_MAX_RETRIES = 5  # retries after flood control or network errors
+
+# Deposit Outbox Configuration
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")  # local queue shared by the web app and the bot
+OUTBOX_BATCH = 50  # deposits applied per database transaction
+OUTBOX_POLL_INTERVAL = 0.5  # seconds between checks of an empty outbox
+OUTBOX_LEASE = 60  # seconds a claimed job is hidden from other consumers
+OUTBOX_RETRY_DELAY = 5  # seconds before the first retry of a failed job; doubles each attempt
+OUTBOX_MAX_ATTEMPTS = 10  # attempts before a job is marked dead
+
+# Ledger Configuration
+LEDGER_RECONCILE_INTERVAL = float(os.getenv("LEDGER_RECONCILE_INTERVAL", "3600"))  # seconds between balance checks
 
 # Admin Panel Configuration
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
@@ -18,4 +18,5 @@ def init_db(app):
 
     with app.app_context():
         import models  # Import models here to avoid circular imports
-        db.create_all()
+        import migrations
+        migrations.upgrade(db.engine)
@@ -0,0 +1,132 @@
+import heapq
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Set, Tuple
+from config import CALL_INTERVAL
+from game_logic import BingoGame
+from game_store import GameStore
+
+logger = logging.getLogger(__name__)
+
+class GameCaller:
+    """Background caller that draws numbers for every open game at a fixed cadence.
+
+    A single thread services all games from a min-heap of due times, so the
+    number of calls depends on the number of games, never on how many
+    clients are polling them. Calls are timed from the game's own
+    last_call_time and made through the store, so callers in several
+    workers sharing a store never call the same number twice.
+    """
+
+    SYNC_EVERY = 5  # intervals between scans of the store for games started elsewhere
+
+    def __init__(self, store: GameStore, interval: float = CALL_INTERVAL,
+                 on_call: Optional[Callable[[BingoGame], None]] = None):
+        self.store = store
+        self.interval = interval
+        self.on_call = on_call  # Invoked after every number called
+        self._watched: Set[int] = set()
+        self._schedule: List[Tuple[float, int]] = []  # (due time, game_id) heap
+        self._wakeup = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._next_sync = 0.0
+
+    def watch(self, game_id: int):
+        """Start calling numbers for a game once it becomes active."""
+        with self._wakeup:
+            self._ensure_running()
+            if game_id in self._watched:
+                return
+            self._watched.add(game_id)
+            heapq.heappush(self._schedule, (time.monotonic(), game_id))
+            self._wakeup.notify()
+
+    def _ensure_running(self):
+        # Started lazily so the thread lives in the serving process, not in a
+        # parent that forks gunicorn workers.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="game-caller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if time.monotonic() >= self._next_sync:
+                self._sync()
+
+            with self._wakeup:
+                if not self._schedule:
+                    self._wakeup.wait(self.interval * self.SYNC_EVERY)
+                    continue
+                due, game_id = self._schedule[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._schedule)
+
+            try:
+                delay = self._tick(game_id)
+            except Exception as e:
+                logger.exception(f"Error calling number for game {game_id}: {e}")
+                delay = self.interval
+
+            with self._wakeup:
+                if delay is None:
+                    self._watched.discard(game_id)
+                else:
+                    heapq.heappush(self._schedule, (time.monotonic() + delay, game_id))
+
+    def _sync(self):
+        """Pick up open games created by other workers."""
+        self._next_sync = time.monotonic() + self.interval * self.SYNC_EVERY
+        try:
+            for game_id in self.store.game_ids():
+                if game_id not in self._watched:
+                    self.watch(game_id)
+        except Exception as e:
+            logger.exception(f"Error listing open games: {e}")
+
+    def _tick(self, game_id: int) -> Optional[float]:
+        """Call a number if the game is due; return seconds until it should be checked again."""
+        game = self.store.get(game_id)
+        if game is None or game.status == "finished":
+            return None
+        if game.status == "waiting":
+            if game.start_due():
+                started = self.store.update(game_id, self._start_if_due)
+                if started is not None and self.on_call:
+                    self.on_call(started)
+                return self.interval
+            if game.start_at is not None:
+                return max(min((game.start_at - datetime.utcnow()).total_seconds(), self.interval), 0.01)
+            return self.interval
+
+        if game.call_due(self.interval):
+            called = self.store.update(game_id, self._call_if_due)
+            if called is not None and self.on_call:
+                self.on_call(called)
+            game = called or self.store.get(game_id)
+            if game is None or game.status == "finished":
+                return None  # Finished elsewhere, and maybe already evicted
+
+        elapsed = (datetime.utcnow() - game.last_call_time).total_seconds()
+        return max(self.interval - elapsed, 0.01)
+
+    def _start_if_due(self, game: BingoGame) -> Optional[BingoGame]:
+        if not game.start_due() or not game.start_game():
+            return None
+        logger.info(f"Game {game.game_id} started with {len(game.players)} players")
+        return game
+
+    def _call_if_due(self, game: BingoGame) -> Optional[BingoGame]:
+        # Re-checked under the store's update so only one caller wins the call
+        if not game.call_due(self.interval):
+            return None
+        number, winners = game.draw()
+        if number:
+            logger.debug(f"Game {game.game_id} called {game.format_number(number)}")
+        if winners:
+            logger.info(f"Game {game.game_id} won by {sorted(winners)}")
+        return game
@@ -1,85 +1,252 @@
 import random
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+import hashlib
+import functools
+import secrets
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Set, Tuple
+from cartelas import CARTELAS
+
+FREE_SPACE = 12  # Board index of the free center square
+
+def _positions_mask(positions) -> int:
+    """Build a 25-bit mask with one bit per board position."""
+    mask = 0
+    for position in positions:
+        mask |= 1 << position
+    return mask
+
+# The 12 winning lines as board position masks: 5 rows, 5 columns, 2 diagonals
+WIN_PATTERNS: List[Tuple[int, str]] = (
+    [(_positions_mask(range(row * 5, row * 5 + 5)), "Winner - Row complete!") for row in range(5)]
+    + [(_positions_mask(range(col, 25, 5)), "Winner - Column complete!") for col in range(5)]
+    + [(_positions_mask([0, 6, 12, 18, 24]), "Winner - Diagonal complete!"),
+       (_positions_mask([4, 8, 12, 16, 20]), "Winner - Diagonal complete!")]
+)
+
+# Board position -> indexes into WIN_PATTERNS of the lines through it
+POSITION_LINES: List[List[int]] = [
+    [line for line, (pattern, _) in enumerate(WIN_PATTERNS) if pattern >> position & 1]
+    for position in range(25)
+]
+
+LINES = len(WIN_PATTERNS)
+
+def _locked(method):
+    """Run a BingoGame method under the game's lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class PlayerState:
+    """A player's seat: the cartela they hold and their marks as a board position bitmask.
+
+    The board itself lives in the shared cartela table, and the uncalled
+    squares left on each line are kept per cartela in the game.
+    """
+    __slots__ = ('cartela_number', 'marked_mask')
+
+    def __init__(self, cartela_number: int, marked_mask: int = 1 << FREE_SPACE):
+        self.cartela_number = cartela_number
+        self.marked_mask = marked_mask  # Center square is automatically marked
+
+    @property
+    def board(self) -> List[int]:
+        return CARTELAS.board(self.cartela_number)
 
 class BingoGame:
+    __slots__ = (
+        'game_id', 'entry_price', 'pool', 'players', 'cartela_owners', 'taken_mask', '_free', '_free_slots',
+        '_lines', 'called_numbers', 'called_mask', 'status', 'winner_id', 'winner_ids', 'created_at',
+        'finished_at', 'min_players', 'max_players', 'start_delay', 'start_at', 'last_call_time', 'seed',
+        'seed_commitment', '_deck', 'events', 'epoch', 'lock', '_changed',
+    )
+
     def __init__(self, game_id: int, entry_price: int = 10):
         self.game_id = game_id
         self.entry_price = entry_price
         self.pool = 0
-        self.players: Dict[int, dict] = {}  # user_id -> {board: List[int], marked: List[int]}
-        self.called_numbers: List[int] = []
+        self.players: Dict[int, PlayerState] = {}
+        self.cartela_owners: Dict[int, int] = {}  # cartela_number -> user_id
+        self.taken_mask = 0  # Bit n is set while cartela n is taken
+        # Free cartelas in no particular order, and each one's slot in that list,
+        # so a random or chosen cartela is taken by swapping it with the last
+        self._free = array('H', range(1, CARTELAS.size + 1))
+        self._free_slots = array('H', [0, *range(CARTELAS.size)])  # cartela_number -> slot in _free
+        # Uncalled squares left on each line of each taken cartela, LINES bytes per cartela number
+        self._lines = bytearray(LINES * (CARTELAS.size + 1))
+        self.called_numbers: List[int] = []  # In call order
+        self.called_mask = 0  # Bit n is set once number n has been called
         self.status = "waiting"  # waiting, active, finished
         self.winner_id = None
+        self.winner_ids: List[int] = []  # Everyone who completed a line on the winning call
         self.created_at = datetime.utcnow()
         self.finished_at = None
         self.min_players = 1  # Temporarily set to 1 for testing
         self.max_players = 100  # Maximum players allowed
+        self.start_delay = 0  # Seconds to keep filling once min_players are in; 0 starts at once
+        self.start_at: Optional[datetime] = None  # When the countdown ends
         self.last_call_time = None
+        # The call order is fixed by this seed; its hash is published up front
+        # and the seed revealed when the game ends so anyone can replay it
+        self.seed = secrets.token_hex(16)
+        self.seed_commitment = hashlib.sha256(self.seed.encode()).hexdigest()
+        self._deck = bytearray()  # Uncalled numbers, next call at the end
+        self.events: List[dict] = []  # {seq, type, data}, seq starts at 1 and has no gaps
+        # Names this event log; a version cursor from another log (e.g. one
+        # lost in a restart) is recognised as stale by its epoch
+        self.epoch = secrets.token_hex(4)
+        # Every public method that reads or changes game state runs under this
+        # lock; stores also hold it around multi-step updates
+        self.lock = threading.RLock()
+        self._changed = threading.Condition(self.lock)
 
     def generate_board(self, cartela_number: int) -> List[int]:
-        """Generate a 5x5 BINGO board with consistent numbers based on cartela number."""
-        # Use cartela number as seed for random number generation
-        random.seed(cartela_number)
+        """Return the 5x5 BINGO board for a cartela number from the shared cartela table."""
+        # Center square (index 12) is the free space and is marked automatically
+        return CARTELAS.board(cartela_number)
+
+    @_locked
+    def add_player(self, user_id: int, cartela_number: int = None) -> List[int]:
+        """Add a player and generate their board.
 
-        # Generate numbers for each column with proper ranges
-        b_numbers = random.sample(range(1, 16), 5)
-        i_numbers = random.sample(range(16, 31), 5)
-        n_numbers = random.sample(range(31, 46), 5)
-        g_numbers = random.sample(range(46, 61), 5)
-        o_numbers = random.sample(range(61, 76), 5)
+        Returns an empty list if the player is already in, the game is full
+        or has started, or the cartela is unknown or taken. Cartelas are
+        public, so a late joiner could otherwise pick one that already
+        holds a line of called numbers.
+        """
+        if (self.status != "waiting" or user_id in self.players
+                or len(self.players) >= self.max_players):
+            return []
+
+        if cartela_number is None:
+            cartela_number = self.random_free_cartela()
+            if cartela_number is None:
+                return []
+        elif cartela_number not in CARTELAS or cartela_number in self.cartela_owners:
+            return []
 
-        # Reset random seed
-        random.seed()
+        board = self._seat_player(user_id, cartela_number)
+        self.pool += self.entry_price
+        self._emit('player-joined', players=len(self.players), pool=self.pool)
 
-        board = []
-        for i in range(5):
-            board.extend([b_numbers[i], i_numbers[i], n_numbers[i], g_numbers[i], o_numbers[i]])
+        # Auto-start once the room is full, or once min_players are in and the countdown has run
+        if len(self.players) >= self.min_players:
+            if len(self.players) >= self.max_players or not self.start_delay:
+                self.start_game()
+            elif self.start_at is None:
+                self.start_at = datetime.utcnow() + timedelta(seconds=self.start_delay)
+                self._emit('countdown', start_at=self.start_at.isoformat(), players=len(self.players))
 
-        # Make center square (index 12) a free space by marking it automatically
         return board
 
-    def add_player(self, user_id: int, cartela_number: int = None) -> List[int]:
-        """Add a player and generate their board."""
-        if user_id in self.players or len(self.players) >= self.max_players:
-            return []
+    @_locked
+    def remove_player(self, user_id: int) -> bool:
+        """Take a player out of a game that has not started and free their cartela."""
+        if self.status != "waiting" or user_id not in self.players:
+            return False
 
-        if cartela_number is None:
-            # Generate a random unused cartela number
-            used_cartelas = set(p.get('cartela_number', 0) for p in self.players.values())
-            available = [n for n in range(1, 101) if n not in used_cartelas]
-            cartela_number = random.choice(available) if available else 0
+        player = self.players.pop(user_id)
+        self._release_cartela(player.cartela_number)
+        self.pool -= self.entry_price
+        if self.start_at is not None and len(self.players) < self.min_players:
+            self.start_at = None  # Countdown restarts once enough players are back
+        self._emit('player-left', players=len(self.players), pool=self.pool)
+        return True
+
+    def random_free_cartela(self) -> Optional[int]:
+        """Pick a random cartela nobody holds, or None if all are taken."""
+        return random.choice(self._free) if self._free else None
+
+    def taken_cartelas_hex(self) -> str:
+        """Taken cartelas as a hex bitmask (bit n for cartela n), for the selection page."""
+        return format(self.taken_mask, 'x')
 
+    def _reserve_cartela(self, cartela_number: int, user_id: int):
+        slot = self._free_slots[cartela_number]
+        last = self._free.pop()
+        if last != cartela_number:
+            self._free[slot] = last
+            self._free_slots[last] = slot
+        self.cartela_owners[cartela_number] = user_id
+        self.taken_mask |= 1 << cartela_number
+
+    def _release_cartela(self, cartela_number: int):
+        del self.cartela_owners[cartela_number]
+        self.taken_mask &= ~(1 << cartela_number)
+        self._free_slots[cartela_number] = len(self._free)
+        self._free.append(cartela_number)
+
+    def _seat_player(self, user_id: int, cartela_number: int) -> List[int]:
+        """Give a player their cartela and count what is left on each of its lines."""
         board = self.generate_board(cartela_number)
-        self.players[user_id] = {
-            'board': board,
-            'marked': [board[12]],  # Center square is automatically marked
-            'cartela_number': cartela_number
-        }
-        self.pool += self.entry_price
 
-        # Auto-start if we reach minimum players
-        if len(self.players) >= self.min_players:
-            self.start_game()
+        start = cartela_number * LINES
+        lines = self._lines
+        lines[start:start + LINES] = b'\x05' * LINES
+        for position, number in enumerate(board):
+            if position == FREE_SPACE or self.is_called(number):
+                for line in POSITION_LINES[position]:
+                    lines[start + line] -= 1
 
+        self._reserve_cartela(cartela_number, user_id)
+        self.players[user_id] = PlayerState(cartela_number)
         return board
 
+    @_locked
     def call_number(self) -> Optional[str]:
         """Call the next random number if the game is active."""
+        number, _ = self.draw()
+        return self.format_number(number) if number else None
+
+    @_locked
+    def draw(self) -> Tuple[Optional[int], Set[int]]:
+        """Call the next number and return it with the players it made winners.
+
+        Only boards holding the called number are touched: each of their lines
+        through that square counts down, and a line reaching zero is a win.
+        Winners end the game immediately.
+        """
         if self.status != "active":
-            return None
+            return None, set()
 
-        # Get list of uncalled numbers
-        available = [n for n in range(1, 76) if n not in self.called_numbers]
-        if not available:
+        if not self._deck:
             self.status = "finished"  # End game if all numbers are called
-            return None
+            self.finished_at = datetime.utcnow()
+            self._emit('game-finished', winner_id=None, seed=self.seed)
+            return None, set()
 
         # Call a new number
-        number = random.choice(available)
-        self.called_numbers.append(number)
+        number = self._deck.pop()
+        winners = self._record_call(number)
         self.last_call_time = datetime.utcnow()
-        return self.format_number(number)
+        self._emit('number-called', number=number, label=self.format_number(number),
+                   count=len(self.called_numbers))
+
+        if winners:
+            self.end_game(*sorted(winners))
+        return number, winners
+
+    def _record_call(self, number: int) -> Set[int]:
+        """Record a called number and return the players it completed a line for."""
+        self.called_numbers.append(number)
+        self.called_mask |= 1 << number
+
+        # Only the cartelas holding the number are visited, from the shared index
+        winners = set()
+        lines, taken = self._lines, self.taken_mask
+        for cartela_number, position in CARTELAS.holders(number):
+            if position == FREE_SPACE or not taken >> cartela_number & 1:
+                continue
+            start = cartela_number * LINES
+            for line in POSITION_LINES[position]:
+                lines[start + line] -= 1
+                if lines[start + line] == 0:
+                    winners.add(self.cartela_owners[cartela_number])
+        return winners
 
     @staticmethod
     def format_number(number: int) -> str:
@@ -96,6 +263,11 @@ class BingoGame:
             prefix = "O"
         return f"{prefix}-{number}"
 
+    def is_called(self, number: int) -> bool:
+        """Check whether a number has been called."""
+        return 1 <= number <= 75 and bool(self.called_mask >> number & 1)
+
+    @_locked
     def mark_number(self, user_id: int, number: int) -> bool:
         """Mark a number on a player's board."""
         if user_id not in self.players:
@@ -103,58 +275,190 @@ class BingoGame:
 
         player = self.players[user_id]
         # Only allow marking numbers that are both on the player's board and have been called
-        if number in player['board'] and number in self.called_numbers:
-            if number not in player['marked']:
-                player['marked'].append(number)
-                player['marked'].sort()  # Keep marked numbers sorted
-            return True
-        return False
+        position = CARTELAS.position(player.cartela_number, number)
+        if position is None or not self.is_called(number):
+            return False
+        # Marks concern only their player, so they stay out of the broadcast event log
+        player.marked_mask |= 1 << position
+        return True
 
+    @_locked
+    def marked_numbers(self, user_id: int) -> List[int]:
+        """Return the numbers a player has marked, sorted."""
+        player = self.players[user_id]
+        board, marked = player.board, player.marked_mask
+        return sorted(board[i] for i in range(25) if marked >> i & 1)
+
+    @_locked
     def check_winner(self, user_id: int) -> Tuple[bool, str]:
         """Check if a player has won."""
         if user_id not in self.players:
             return False, "Player not in game"
 
-        player = self.players[user_id]
-        marked = set(player['marked'])
-        board = player['board']
-
-        # Validate that all marked numbers are actually on the board and have been called
-        for num in marked:
-            if num not in board and num != board[12]:  # Allow center free space
-                return False, "Invalid marked numbers detected"
-            if num not in self.called_numbers and num != board[12]:  # Allow center free space
-                return False, "Number has not been called yet"
-
-        # Check rows
-        for i in range(0, 25, 5):
-            if all(board[i + j] in marked for j in range(5)):
-                return True, "Winner - Row complete!"
-
-        # Check columns
-        for i in range(5):
-            if all(board[i + j*5] in marked for j in range(5)):
-                return True, "Winner - Column complete!"
-
-        # Check diagonals
-        if all(board[i] in marked for i in [0, 6, 12, 18, 24]):
-            return True, "Winner - Diagonal complete!"
-        if all(board[i] in marked for i in [4, 8, 12, 16, 20]):
-            return True, "Winner - Diagonal complete!"
+        # Marks are validated against the board and the called numbers in
+        # mark_number, so a win check is just a mask comparison per line
+        marked = self.players[user_id].marked_mask
+        for pattern, message in WIN_PATTERNS:
+            if marked & pattern == pattern:
+                return True, message
 
         return False, "Keep playing"
 
+    def start_due(self) -> bool:
+        """Check whether a waiting game's countdown has run out."""
+        return self.status == "waiting" and self.start_at is not None and datetime.utcnow() >= self.start_at
+
+    def call_due(self, interval: float) -> bool:
+        """Check whether an active game is due for its next call."""
+        if self.status != "active":
+            return False
+        if self.last_call_time is None:
+            return True
+        return (datetime.utcnow() - self.last_call_time).total_seconds() >= interval
+
+    @staticmethod
+    def call_sequence(seed: str) -> List[int]:
+        """Return the full order in which a game with this seed calls numbers."""
+        deck = list(range(1, 76))
+        random.Random(seed).shuffle(deck)
+        return deck
+
+    def verify_calls(self) -> bool:
+        """Check the seed against its commitment and the calls made against the seed."""
+        if hashlib.sha256(self.seed.encode()).hexdigest() != self.seed_commitment:
+            return False
+        sequence = self.call_sequence(self.seed)
+        return self.called_numbers == sequence[:len(self.called_numbers)]
+
+    @_locked
     def start_game(self) -> bool:
         """Start the game if enough players have joined."""
-        if len(self.players) < self.min_players:
+        if self.status != "waiting" or len(self.players) < self.min_players:
             return False
+        self._deck = bytearray(reversed(self.call_sequence(self.seed)))
         self.status = "active"
+        self._emit('game-started', players=len(self.players), pool=self.pool,
+                   seed_commitment=self.seed_commitment)
         # Call first number automatically when game starts
         self.call_number() 
         return True
 
-    def end_game(self, winner_id: int):
-        """End the game and set the winner."""
-        self.winner_id = winner_id
+    @_locked
+    def end_game(self, *winner_ids: int):
+        """End the game and set the winner(s)."""
+        if self.status == "finished":
+            return
+        self.winner_ids = list(winner_ids)
+        self.winner_id = winner_ids[0] if winner_ids else None
         self.status = "finished"
-        self.finished_at = datetime.utcnow()
\ No newline at end of file
+        self.finished_at = datetime.utcnow()
+        self._emit('winner', winner_id=self.winner_id, winner_ids=self.winner_ids, pool=self.pool)
+        self._emit('game-finished', winner_id=self.winner_id, seed=self.seed)
+
+    @_locked
+    def to_state(self) -> dict:
+        """Snapshot the durable parts of the game as plain data."""
+        return {
+            'game_id': self.game_id,
+            'entry_price': self.entry_price,
+            'pool': self.pool,
+            'status': self.status,
+            'winner_id': self.winner_id,
+            'winner_ids': list(self.winner_ids),
+            'seed': self.seed,
+            'called_numbers': list(self.called_numbers),
+            'players': {
+                user_id: {'cartela_number': player.cartela_number, 'marked': self.marked_numbers(user_id)}
+                for user_id, player in list(self.players.items())
+            },
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'last_call_time': self.last_call_time,
+            'min_players': self.min_players,
+            'max_players': self.max_players,
+            'start_delay': self.start_delay,
+            'start_at': self.start_at,
+            'events': list(self.events),
+            'epoch': self.epoch,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'BingoGame':
+        """Rebuild a game from to_state() output, replaying its calls."""
+        game = cls(state['game_id'], state['entry_price'])
+        game.seed = state['seed'] or game.seed
+        game.seed_commitment = hashlib.sha256(game.seed.encode()).hexdigest()
+        game.created_at = state['created_at']
+
+        for user_id, player in state['players'].items():
+            game._seat_player(user_id, player['cartela_number'])
+        for number in state['called_numbers']:
+            game._record_call(number)
+        for user_id, player in state['players'].items():
+            seat = game.players[user_id]
+            for number in player['marked']:
+                seat.marked_mask |= 1 << CARTELAS.position(seat.cartela_number, number)
+
+        game._deck = bytearray(n for n in reversed(game.call_sequence(game.seed)) if not game.is_called(n))
+        game.pool = state['pool']
+        game.status = state['status']
+        game.winner_id = state['winner_id']
+        game.winner_ids = list(state.get('winner_ids') or ([state['winner_id']] if state['winner_id'] else []))
+        game.finished_at = state['finished_at']
+        game.last_call_time = state['last_call_time']
+        game.min_players = state.get('min_players', game.min_players)
+        game.max_players = state.get('max_players', game.max_players)
+        game.start_delay = state.get('start_delay', game.start_delay)
+        game.start_at = state.get('start_at')
+        game.events = list(state.get('events', []))
+        game.epoch = state.get('epoch') or game.epoch
+        return game
+
+    def _emit(self, event_type: str, **data):
+        """Append an event to the game's log and wake up anyone streaming it."""
+        with self._changed:
+            self.events.append({'seq': len(self.events) + 1, 'type': event_type, 'data': data})
+            self._changed.notify_all()
+
+    @property
+    def version(self) -> int:
+        """Bumped by every change to the game: the sequence number of its last event."""
+        return len(self.events)
+
+    @_locked
+    def changes_since(self, version: int, user_id: Optional[int] = None, epoch: Optional[str] = None) -> dict:
+        """Summarize what changed after version for a polling client.
+
+        Only calls made since then are listed, so the size depends on how
+        long ago the client polled, not on how far the game has got. Marks
+        aren't in the event log; user_id's marks are always sent whole, at
+        most 25 numbers. A cursor from another epoch or beyond the log gets
+        the full lists with reset set.
+        """
+        reset = epoch != self.epoch or not 0 <= version <= len(self.events)
+        if reset:
+            calls = list(self.called_numbers)
+        else:
+            calls = [event['data']['number'] for event in self.events[version:]
+                     if event['type'] == 'number-called']
+        return {
+            'epoch': self.epoch,
+            'version': len(self.events),
+            'reset': reset,
+            'status': self.status,
+            'players': len(self.players),
+            'calls': calls,
+            'call_count': len(self.called_numbers),
+            'marks': self.marked_numbers(user_id) if user_id in self.players else [],
+            'winner_ids': list(self.winner_ids),
+        }
+
+    def events_since(self, seq: int) -> List[dict]:
+        """Return all events after the given sequence number."""
+        return self.events[max(seq, 0):]
+
+    def wait_for_events(self, seq: int, timeout: float) -> List[dict]:
+        """Block until there are events after seq or the timeout expires."""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > seq, timeout)
+            return self.events_since(seq)
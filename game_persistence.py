@@ -0,0 +1,235 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import selectinload
+from config import PERSIST_INTERVAL
+from cartelas import CARTELAS
+from database import db
+from game_logic import BingoGame
+from models import Game, GameCall, GameEvent, GameParticipant
+from outbox import Outbox
+from settlement import result_messages, settle_game
+
+logger = logging.getLogger(__name__)
+
+def split_called_mask(numbers) -> Tuple[int, int]:
+    """Pack called numbers into the (called_low, called_high) columns."""
+    low = high = 0
+    for n in numbers:
+        if n <= 63:
+            low |= 1 << (n - 1)
+        else:
+            high |= 1 << (n - 64)
+    return low, high
+
+def _marked_mask(cartela_number: int, marked) -> int:
+    board = CARTELAS.board(cartela_number)
+    mask = 0
+    for number in marked:
+        mask |= 1 << board.index(number)
+    return mask
+
+def _marked_numbers(cartela_number: int, mask: int):
+    board = CARTELAS.board(cartela_number)
+    return [board[i] for i in range(25) if mask >> i & 1]
+
+class GamePersister:
+    """Write-behind mirror of live games into the Game and GameParticipant tables.
+
+    Request handlers and the caller only mark a game dirty. A background
+    thread wakes every PERSIST_INTERVAL seconds and writes one snapshot per
+    dirty game, so bursts of calls and marks on a game coalesce into one
+    write and no request waits on the database. Each game is written in its
+    own savepoint, so one that fails is retried without holding back the
+    rest. Finished games are settled in the same savepoint, and once that
+    commits their players' result messages are queued in the outbox for
+    the bot to send.
+    """
+
+    def __init__(self, app, interval: float = PERSIST_INTERVAL, outbox: Optional[Outbox] = None):
+        self.app = app
+        self.interval = interval
+        self.outbox = outbox
+        self._dirty: Dict[int, BingoGame] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def mark_dirty(self, game: BingoGame):
+        """Queue a game to be written on the next flush."""
+        with self._lock:
+            self._dirty[game.game_id] = game
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="game-persister", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write every dirty game, each in its own savepoint of one transaction."""
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+        if not batch:
+            return
+
+        failed = []
+        results: Dict[int, List[Tuple[int, str]]] = {}  # game_id -> result messages of games settled now
+        with self.app.app_context():
+            for game_id, game in batch.items():
+                try:
+                    with db.session.begin_nested():
+                        messages = self._write(game.to_state())
+                    if messages:
+                        results[game_id] = messages
+                except Exception as e:
+                    # Rolled back to the savepoint; the other games still commit
+                    logger.exception(f"Error persisting game {game_id}: {e}")
+                    failed.append(game_id)
+            try:
+                db.session.commit()
+                logger.debug(f"Persisted {len(batch) - len(failed)} games")
+            except Exception as e:
+                db.session.rollback()
+                logger.exception(f"Error persisting games: {e}")
+                failed, results = list(batch), {}
+        self._queue_results(results)
+
+        # Retry on the next flush unless the game was queued again meanwhile
+        with self._lock:
+            for game_id in failed:
+                self._dirty.setdefault(game_id, batch[game_id])
+
+    def _queue_results(self, results: Dict[int, List[Tuple[int, str]]]):
+        if self.outbox is None:
+            return
+        for game_id, messages in results.items():
+            try:
+                self.outbox.append('game-result', {'game_id': game_id, 'messages': messages}, key=f"game:{game_id}")
+            except Exception as e:
+                # The game is settled either way; only the messages are lost
+                logger.exception(f"Error queueing results of game {game_id}: {e}")
+
+    @staticmethod
+    def _write(state: dict) -> Optional[List[Tuple[int, str]]]:
+        """Write one game; returns its players' result messages if this settled it.
+
+        Each worker flushes its own copy of a game, so a snapshot is only
+        written if it has seen at least as many events as the row already
+        holds, and a finished game is never written back as open.
+        """
+        game_id = state['game_id']
+        row = db.session.get(Game, game_id, with_for_update=True)  # Serializes flushes of the game
+        if row is None:
+            row = Game(id=game_id, created_at=state['created_at'])
+            db.session.add(row)
+            first_event = 0
+        else:
+            first_event = (db.session.query(db.func.max(GameEvent.seq))
+                           .filter(GameEvent.game_id == game_id).scalar() or 0)
+            stale = (row.status == 'finished' and state['status'] != 'finished') or (
+                row.epoch == state['epoch'] and len(state['events']) < first_event)
+            if stale:
+                logger.info(f"Skipped a stale snapshot of game {game_id} "
+                            f"({len(state['events'])} events, row has {first_event}, status {row.status})")
+                return None
+        row.status = state['status']
+        row.entry_price = state['entry_price']
+        row.pool = state['pool']
+        row.seed = state['seed']
+        row.called_low, row.called_high = split_called_mask(state['called_numbers'])
+        row.winner_id = state['winner_id']
+        row.winner_ids = state['winner_ids']
+        row.min_players = state['min_players']
+        row.max_players = state['max_players']
+        row.start_delay = state['start_delay']
+        row.start_at = state['start_at']
+        row.epoch = state['epoch']
+        row.finished_at = state['finished_at']
+
+        # Players who left are deleted first, so their cartela can be taken by a new row
+        participants = {p.user_id: p for p in GameParticipant.query.filter_by(game_id=game_id)}
+        for user_id in set(participants) - set(state['players']):
+            db.session.delete(participants.pop(user_id))
+        db.session.flush()  # Also makes sure the Game row exists before its calls
+
+        for user_id, player in state['players'].items():
+            participant = participants.get(user_id)
+            if participant is None:
+                participant = GameParticipant(
+                    game_id=game_id,
+                    user_id=user_id,
+                    cartela_number=player['cartela_number']
+                )
+                db.session.add(participant)
+            participant.marked_mask = _marked_mask(player['cartela_number'], player['marked'])
+
+        # Only calls made since the last flush are inserted
+        first_seq = (db.session.query(db.func.max(GameCall.seq))
+                     .filter(GameCall.game_id == game_id).scalar() or 0)
+        new_calls = [
+            {'game_id': game_id, 'seq': seq, 'number': number}
+            for seq, number in enumerate(state['called_numbers'][first_seq:], start=first_seq + 1)
+        ]
+        if new_calls:
+            db.session.execute(db.insert(GameCall), new_calls)
+
+        # Likewise the event log, so clients' version cursors survive a restart
+        new_events = [
+            {'game_id': game_id, 'seq': event['seq'], 'type': event['type'], 'data': event['data']}
+            for event in state['events'][first_event:]
+        ]
+        if new_events:
+            db.session.execute(db.insert(GameEvent), new_events)
+
+        # Pay out a finished game in the same transaction that records it as finished
+        if state['status'] == 'finished':
+            db.session.flush()
+            settlement = settle_game(state)
+            if settlement is not None:
+                return result_messages(state, settlement)
+        return None
+
+def load_active_games(app) -> Dict[int, BingoGame]:
+    """Rebuild every waiting or active game from the database."""
+    games = {}
+    with app.app_context():
+        rows = (Game.query
+                .options(selectinload(Game.participants), selectinload(Game.calls), selectinload(Game.events))
+                .filter(Game.status.in_(["waiting", "active"]))
+                .all())
+        for row in rows:
+            state = {
+                'game_id': row.id,
+                'entry_price': int(row.entry_price),
+                'pool': row.pool,
+                'status': row.status,
+                'winner_id': row.winner_id,
+                'winner_ids': row.winner_ids or [],
+                'seed': row.seed,
+                'called_numbers': [call.number for call in row.calls],
+                'players': {
+                    p.user_id: {'cartela_number': p.cartela_number,
+                                'marked': _marked_numbers(p.cartela_number, p.marked_mask)}
+                    for p in row.participants
+                },
+                'created_at': row.created_at,
+                'finished_at': row.finished_at,
+                'last_call_time': None,
+                'events': [{'seq': e.seq, 'type': e.type, 'data': e.data} for e in row.events],
+            }
+            # Rows written before these columns existed keep the BingoGame defaults
+            for key in ('min_players', 'max_players', 'start_delay', 'start_at', 'epoch'):
+                if getattr(row, key) is not None:
+                    state[key] = getattr(row, key)
+            games[row.id] = BingoGame.from_state(state)
+    if games:
+        logger.info(f"Restored {len(games)} games from the database")
+    return games
+
+def last_game_id(app) -> int:
+    """Return the highest game id ever persisted."""
+    with app.app_context():
+        return db.session.query(db.func.max(Game.id)).scalar() or 0
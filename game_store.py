@@ -0,0 +1,436 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import closing
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from config import FINISHED_GAME_TTL, GAME_STORE, GAME_STORE_PATH
+from game_logic import BingoGame
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+SWEEP_INTERVAL = 60  # seconds between sweeps for finished games to evict
+
+class GameStoreConflict(Exception):
+    """Raised when an update keeps losing the compare-and-set race."""
+
+class GameStore(ABC):
+    """Where live games are kept between requests.
+
+    Reads get a snapshot of the game. Every change goes through update(),
+    which applies the mutation atomically with respect to other updates of
+    the same game, in this process and, for shared stores, in other workers.
+    Finished games are evicted FINISHED_GAME_TTL seconds after they end;
+    the database keeps the record.
+    """
+
+    @abstractmethod
+    def next_id(self) -> int:
+        """Allocate a new, never reused game id."""
+
+    @abstractmethod
+    def reserve_ids(self, last_id: int):
+        """Make sure next_id() only hands out ids above last_id."""
+
+    @abstractmethod
+    def add(self, game: BingoGame):
+        pass
+
+    @abstractmethod
+    def get(self, game_id: int) -> Optional[BingoGame]:
+        pass
+
+    @abstractmethod
+    def update(self, game_id: int, mutate: Callable[[BingoGame], T]) -> T:
+        pass
+
+    @abstractmethod
+    def game_ids(self, statuses: Tuple[str, ...] = ("waiting", "active")) -> List[int]:
+        pass
+
+    @abstractmethod
+    def wait_for_events(self, game_id: int, seq: int, timeout: float) -> List[dict]:
+        """Block until the game has events after seq or the timeout expires."""
+
+    def __contains__(self, game_id: int) -> bool:
+        return self.get(game_id) is not None
+
+class InMemoryGameStore(GameStore):
+    """Games live as objects in this process; only valid with a single worker."""
+
+    def __init__(self, finished_ttl: float = FINISHED_GAME_TTL):
+        self.finished_ttl = finished_ttl
+        self._games: Dict[int, BingoGame] = {}
+        self._finished: Dict[int, float] = {}  # game_id -> when it was seen finished
+        self._next_sweep = 0.0
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._last_id += 1
+            return self._last_id
+
+    def reserve_ids(self, last_id: int):
+        with self._lock:
+            self._last_id = max(self._last_id, last_id)
+
+    def add(self, game: BingoGame):
+        self._games[game.game_id] = game
+        self._sweep()
+
+    def get(self, game_id: int) -> Optional[BingoGame]:
+        return self._games.get(game_id)
+
+    def update(self, game_id: int, mutate: Callable[[BingoGame], T]) -> T:
+        game = self._games[game_id]
+        with game.lock:
+            result = mutate(game)
+            finished = game.status == "finished"
+        if finished:
+            with self._lock:
+                self._finished.setdefault(game_id, time.monotonic())
+        self._sweep()
+        return result
+
+    def _sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + SWEEP_INTERVAL
+            expired = [g for g, finished_at in self._finished.items() if now - finished_at >= self.finished_ttl]
+            for game_id in expired:
+                del self._finished[game_id]
+                self._games.pop(game_id, None)
+        if expired:
+            logger.debug(f"Evicted {len(expired)} finished games")
+
+    def game_ids(self, statuses: Tuple[str, ...] = ("waiting", "active")) -> List[int]:
+        return [game_id for game_id, game in list(self._games.items()) if game.status in statuses]
+
+    def wait_for_events(self, game_id: int, seq: int, timeout: float) -> List[dict]:
+        game = self._games.get(game_id)
+        return game.wait_for_events(seq, timeout) if game else []
+
+def _encode_state(game: BingoGame) -> str:
+    """Serialize a game without its event log, which is stored row by row."""
+    def default(value):
+        if isinstance(value, datetime):
+            return {'__datetime__': value.isoformat()}
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+    state = game.to_state()
+    del state['events']
+    return json.dumps(state, default=default, separators=(',', ':'))
+
+def _decode_state(data: str, events: List[dict]) -> BingoGame:
+    def object_hook(value):
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        return value
+    state = json.loads(data, object_hook=object_hook)
+    state['players'] = {int(user_id): player for user_id, player in state['players'].items()}
+    state['events'] = events
+    return BingoGame.from_state(state)
+
+class SQLiteGameStore(GameStore):
+    """Games shared by every worker through one SQLite database in WAL mode.
+
+    Each game row holds the game without its event log, plus a version;
+    events are appended to their own table, so a write costs the game
+    state and its new events, never the whole log. update() mutates a
+    private copy and writes it back only if the version is unchanged,
+    retrying on conflict; readers only ever see committed games. Decoded
+    games are cached per process by version, so a read only costs a
+    version lookup when nothing changed.
+
+    Connections are opened on first use, one per thread and process: the
+    store is built when app.py is imported, before gunicorn forks its
+    workers, and an SQLite connection must not be used across a fork.
+
+    Event streams wait on a condition per game instead of polling. A
+    process that commits a change wakes its own waiters and sends the game
+    id as a datagram to every other process waiting on the store, through
+    the Unix sockets in <path>.notify/.
+    """
+
+    MAX_RETRIES = 20
+
+    def __init__(self, path: str = GAME_STORE_PATH, finished_ttl: float = FINISHED_GAME_TTL):
+        self.path = path
+        self.finished_ttl = finished_ttl
+        self._local = threading.local()
+        self._cache: Dict[int, Tuple[int, str, BingoGame]] = {}  # game_id -> (version, state, game)
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._next_sweep = 0.0
+        self._changed: Dict[int, threading.Condition] = {}  # game_id -> notified when it changes
+        self._notify_dir = f"{path}.notify"
+        self._listener: Optional[Tuple[int, str]] = None  # (pid, socket path) of this process's listener
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            self._create_tables(conn)
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(games)")]
+        if columns and 'finished_at' not in columns:
+            # Live games only; they are restored from the database on startup
+            logger.warning("Dropping game store tables from an older layout")
+            conn.execute("DROP TABLE games")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS games (
+                id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                finished_at REAL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_games_status ON games (status)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS game_events (
+                game_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                PRIMARY KEY (game_id, seq)
+            ) WITHOUT ROWID""")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('game_id', 0)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection inherited through fork belongs to the parent; leave it alone
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def _game_lock(self, game_id: int) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(game_id, threading.Lock())
+
+    def next_id(self) -> int:
+        row = self._connection().execute(
+            "UPDATE counters SET value = value + 1 WHERE name = 'game_id' RETURNING value"
+        ).fetchone()
+        return row[0]
+
+    def reserve_ids(self, last_id: int):
+        self._connection().execute(
+            "UPDATE counters SET value = MAX(value, ?) WHERE name = 'game_id'", (last_id,)
+        )
+
+    def add(self, game: BingoGame):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            created = conn.execute(
+                "INSERT OR IGNORE INTO games (id, status, version, state) VALUES (?, ?, 1, ?)",
+                (game.game_id, game.status, _encode_state(game))
+            ).rowcount
+            if created:
+                self._append_events(conn, game.game_id, game.events)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if created:
+            self._publish(game.game_id)
+        self._sweep()
+
+    @staticmethod
+    def _append_events(conn: sqlite3.Connection, game_id: int, events: List[dict]):
+        conn.executemany(
+            "INSERT INTO game_events (game_id, seq, event) VALUES (?, ?, ?)",
+            [(game_id, event['seq'], json.dumps(event, separators=(',', ':'))) for event in events]
+        )
+
+    def _load(self, game_id: int) -> Optional[Tuple[int, str, BingoGame]]:
+        conn = self._connection()
+        row = conn.execute("SELECT version FROM games WHERE id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        cached = self._cache.get(game_id)
+        if cached and cached[0] == row[0]:
+            return cached
+
+        # Read the row and the events it has not seen in one snapshot
+        known = list(cached[2].events) if cached else []
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT version, state FROM games WHERE id = ?", (game_id,)).fetchone()
+            new_events = conn.execute(
+                "SELECT event FROM game_events WHERE game_id = ? AND seq > ? ORDER BY seq",
+                (game_id, len(known))
+            ).fetchall() if row else []
+        finally:
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        events = known + [json.loads(event) for event, in new_events]
+        loaded = (row[0], row[1], _decode_state(row[1], events))
+        self._cache[game_id] = loaded
+        return loaded
+
+    def get(self, game_id: int) -> Optional[BingoGame]:
+        loaded = self._load(game_id)
+        return loaded[2] if loaded else None
+
+    def update(self, game_id: int, mutate: Callable[[BingoGame], T]) -> T:
+        with self._game_lock(game_id):
+            for _ in range(self.MAX_RETRIES):
+                loaded = self._load(game_id)
+                if loaded is None:
+                    raise KeyError(game_id)
+                version, state, published = loaded
+
+                # Readers may hold the published game, so the mutation runs on a copy
+                game = _decode_state(state, list(published.events))
+                result = mutate(game)
+                new_state = _encode_state(game)
+                finished_at = time.time() if game.status == "finished" else None
+
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    updated = conn.execute(
+                        "UPDATE games SET state = ?, status = ?, version = version + 1, "
+                        "finished_at = COALESCE(finished_at, ?) WHERE id = ? AND version = ?",
+                        (new_state, game.status, finished_at, game_id, version)
+                    ).rowcount
+                    if updated:
+                        self._append_events(conn, game_id, game.events[len(published.events):])
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+
+                if updated:
+                    self._cache[game_id] = (version + 1, new_state, game)
+                    self._publish(game_id)
+                    self._sweep()
+                    return result
+                logger.debug(f"Version conflict updating game {game_id}, retrying")
+        raise GameStoreConflict(f"Could not update game {game_id} after {self.MAX_RETRIES} attempts")
+
+    def _sweep(self):
+        """Delete games that finished more than finished_ttl ago and uncache finished games."""
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [row[0] for row in conn.execute(
+                "DELETE FROM games WHERE status = 'finished' AND finished_at < ? RETURNING id",
+                (time.time() - self.finished_ttl,)
+            )]
+            conn.executemany("DELETE FROM game_events WHERE game_id = ?", [(game_id,) for game_id in expired])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        for game_id, (_, _, game) in list(self._cache.items()):
+            if game.status == "finished":
+                self._cache.pop(game_id, None)
+        with self._locks_guard:
+            for game_id in [g for g in self._locks if g not in self._cache]:
+                del self._locks[game_id]
+            for game_id in [g for g in self._changed if g not in self._cache]:
+                del self._changed[game_id]
+        if expired:
+            logger.debug(f"Evicted {len(expired)} finished games")
+
+    def game_ids(self, statuses: Tuple[str, ...] = ("waiting", "active")) -> List[int]:
+        placeholders = ",".join("?" for _ in statuses)
+        rows = self._connection().execute(
+            f"SELECT id FROM games WHERE status IN ({placeholders})", statuses
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def wait_for_events(self, game_id: int, seq: int, timeout: float) -> List[dict]:
+        self._listen()
+        deadline = time.monotonic() + timeout
+        changed = self._condition(game_id)
+        with changed:
+            while True:
+                game = self.get(game_id)
+                remaining = deadline - time.monotonic()
+                if game is None or len(game.events) > seq or remaining <= 0:
+                    return game.events_since(seq) if game else []
+                changed.wait(remaining)
+
+    def _condition(self, game_id: int) -> threading.Condition:
+        with self._locks_guard:
+            return self._changed.setdefault(game_id, threading.Condition())
+
+    def _wake(self, game_id: int):
+        with self._locks_guard:
+            changed = self._changed.get(game_id)
+        if changed is not None:
+            with changed:
+                changed.notify_all()
+
+    def _publish(self, game_id: int):
+        """Wake everyone waiting on a game, in this process and in the others."""
+        self._wake(game_id)
+        try:
+            names = os.listdir(self._notify_dir)
+        except FileNotFoundError:
+            return  # Nobody has waited on this store yet
+        own = self._listener[1] if self._listener and self._listener[0] == os.getpid() else None
+        message = str(game_id).encode()
+        with closing(socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)) as sender:
+            sender.setblocking(False)
+            for name in names:
+                address = os.path.join(self._notify_dir, name)
+                if address == own:
+                    continue
+                try:
+                    sender.sendto(message, address)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Its process is gone
+                    try:
+                        os.unlink(address)
+                    except FileNotFoundError:
+                        pass
+                except BlockingIOError:
+                    pass  # Its queue is full; its streams still recheck every keepalive
+
+    def _listen(self):
+        """Start this process's listener for changes committed by other processes, once per process."""
+        with self._locks_guard:
+            if self._listener and self._listener[0] == os.getpid():
+                return
+            os.makedirs(self._notify_dir, exist_ok=True)
+            address = os.path.join(self._notify_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(address)
+            self._listener = (os.getpid(), address)
+        threading.Thread(target=self._receive, args=(receiver,), name="game-store-listener", daemon=True).start()
+
+    def _receive(self, receiver: socket.socket):
+        while True:
+            data = receiver.recv(64)
+            try:
+                game_id = int(data)
+            except ValueError:
+                continue
+            self._wake(game_id)
+
+def create_game_store() -> GameStore:
+    """Build the store selected by the GAME_STORE setting."""
+    if GAME_STORE == "sqlite":
+        logger.info(f"Using shared SQLite game store at {GAME_STORE_PATH}")
+        return SQLiteGameStore(GAME_STORE_PATH)
+    return InMemoryGameStore()
@@ -0,0 +1,46 @@
+# The only gunicorn settings: picked up automatically by the gunicorn
+# commands in .replit and loaded explicitly by main.py
+from config import WEB_CONNECTIONS, WEB_WORKERS
+
+bind = "0.0.0.0:5000"
+
+# Event streams spend their lives waiting for the next game event, so
+# each request runs in a greenlet rather than a thread: an open /events
+# stream costs a few KB, and /mark or /game/<id>/state never queue behind
+# the streams. A worker serves up to WEB_CONNECTIONS requests and streams
+# at once; raise WEB_WORKERS with the shared sqlite store for more.
+worker_class = "gevent"
+worker_connections = WEB_CONNECTIONS
+
+# More than one worker needs GAME_STORE=sqlite so every worker sees every game
+workers = WEB_WORKERS
+
+def _gevent_wait_callback(conn, timeout=None):
+    # Lets other greenlets run while psycopg2 waits on PostgreSQL
+    from psycopg2 import OperationalError, extensions
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state}")
+
+def post_worker_init(worker):
+    # Runs after gevent has patched the worker (post_fork runs before), so
+    # the game services' threads, locks and sockets are cooperative
+    from psycopg2 import extensions
+    extensions.set_wait_callback(_gevent_wait_callback)
+
+    # Resume open games as soon as the worker is up instead of on its first request
+    from app import start_game_services
+    start_game_services()
+
+def worker_exit(server, worker):
+    # Don't lose the last PERSIST_INTERVAL of game changes on a restart
+    from app import stop_game_services
+    stop_game_services()
@@ -0,0 +1,116 @@
+"""Double-entry ledger of money movements, in integer cents.
+
+Every posting is a set of LedgerEntry legs that sum to zero: a deposit
+credits the user and debits external:deposits, a game entry debits the
+user and credits the game's pot. The ledger is append-only and is the
+source of truth; User.balance_cents is a cache of the sum of the user's
+legs, updated in the same transaction as the posting and checked by
+reconcile().
+"""
+import uuid
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple, Union
+from sqlalchemy import func, insert, select, update
+from database import db
+from models import LedgerEntry, User
+
+logger = logging.getLogger(__name__)
+
+USER = 'user'
+DEPOSITS = 'external:deposits'
+WITHDRAWALS = 'external:withdrawals'
+OPENING = 'equity:opening'
+
+Leg = Tuple[str, Optional[int], int]  # (account, user_id for USER legs, amount in cents)
+
+class InsufficientFunds(Exception):
+    """Raised when a posting would take a user's balance below zero."""
+
+    def __init__(self, user_id: int, cents: int):
+        super().__init__(f"User {user_id} cannot cover {cents / 100:.2f}")
+        self.user_id = user_id
+        self.cents = cents
+
+def to_cents(amount: Union[int, float, str, Decimal]) -> int:
+    """Convert an amount in birr to whole cents, rounding half up."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def game_account(game_id: int) -> str:
+    return f"game:{game_id}"
+
+def post(kind: str, legs: List[Leg], reference: Optional[str] = None) -> Dict[int, int]:
+    """Record a posting in the current session and update the users' cached balances.
+
+    Returns the new balance in cents of every user in the posting. Raises
+    InsufficientFunds, leaving the session to be rolled back, if a debit
+    exceeds a user's balance. The caller commits.
+    """
+    if sum(cents for _, _, cents in legs) != 0:
+        raise ValueError(f"Posting {kind} does not balance: {legs}")
+
+    balances = {}
+    for account, user_id, cents in legs:
+        if account != USER:
+            continue
+        statement = update(User).where(User.id == user_id).values(balance_cents=User.balance_cents + cents)
+        if cents < 0:
+            statement = statement.where(User.balance_cents >= -cents)
+        row = db.session.execute(
+            statement.returning(User.balance_cents).execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            raise InsufficientFunds(user_id, -cents)
+        balances[user_id] = row[0]
+
+    posting_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    db.session.execute(insert(LedgerEntry), [
+        {
+            'posting_id': posting_id,
+            'account': account,
+            'user_id': user_id if account == USER else None,
+            'amount_cents': cents,
+            'kind': kind,
+            'reference': reference,
+            'created_at': now,
+        }
+        for account, user_id, cents in legs
+    ])
+    return balances
+
+@dataclass
+class Reconciliation:
+    users_checked: int = 0
+    ledger_total: int = 0  # Sum of every leg; anything but 0 means an unbalanced posting
+    mismatches: List[Tuple[int, int, int]] = field(default_factory=list)  # (user_id, cached, ledger)
+
+    @property
+    def ok(self) -> bool:
+        return self.ledger_total == 0 and not self.mismatches
+
+def reconcile(batch_size: int = 1000) -> Reconciliation:
+    """Check every cached balance against the ledger in one streaming aggregate pass."""
+    sums = (select(LedgerEntry.user_id, func.sum(LedgerEntry.amount_cents).label('cents'))
+            .where(LedgerEntry.account == USER)
+            .group_by(LedgerEntry.user_id)
+            .subquery())
+    statement = (select(User.id, User.balance_cents, func.coalesce(sums.c.cents, 0))
+                 .outerjoin(sums, sums.c.user_id == User.id)
+                 .execution_options(yield_per=batch_size))
+
+    report = Reconciliation()
+    for user_id, cached, ledger in db.session.execute(statement):
+        report.users_checked += 1
+        if cached != ledger:
+            report.mismatches.append((user_id, cached, int(ledger)))
+    report.ledger_total = int(db.session.execute(select(func.coalesce(func.sum(LedgerEntry.amount_cents), 0))).scalar())
+
+    if report.ok:
+        logger.info(f"Ledger reconciled: {report.users_checked} balances match")
+    else:
+        logger.error(f"Ledger reconciliation failed: total {report.ledger_total}, "
+                     f"{len(report.mismatches)} mismatched balances, first {report.mismatches[:10]}")
+    return report
@@ -0,0 +1,73 @@
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+from game_logic import BingoGame
+from game_store import GameStore
+
+class Lobby:
+    """Precomputed list of open rooms served by /game/list.
+
+    Rooms are updated one at a time as games are opened, joined, started
+    and finished, and the JSON body and its ETag are rendered at most once
+    per change, however many clients poll. sync() folds in rooms changed by
+    other workers when the store is shared.
+    """
+
+    def __init__(self, sync_interval: Optional[float] = None):
+        self.sync_interval = sync_interval  # None when every change goes through update()
+        self._rooms: Dict[int, dict] = {}
+        self._keys: Dict[int, Tuple] = {}  # game_id -> fields the room entry is derived from
+        self._version = 0
+        self._rendered: Optional[Tuple[int, bytes, str]] = None  # (version, body, etag)
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, game: BingoGame):
+        """Refresh one room's entry; cheap when nothing the lobby shows has changed."""
+        key = (game.status, len(game.players), game.start_at)
+        with self._lock:
+            if self._keys.get(game.game_id) == key:
+                return
+            if game.status == "finished":
+                self._rooms.pop(game.game_id, None)
+            else:
+                self._rooms[game.game_id] = {
+                    'id': game.game_id,
+                    'entry_price': game.entry_price,
+                    'status': game.status,
+                    'players': len(game.players),
+                    'max_players': game.max_players,
+                    'start_at': game.start_at.isoformat() if game.start_at else None,
+                    'taken_cartelas': game.taken_cartelas_hex(),
+                }
+            self._keys[game.game_id] = key
+            self._version += 1
+
+    def sync(self, store: GameStore, force: bool = False):
+        """Pick up rooms changed elsewhere, at most every sync_interval seconds."""
+        now = time.monotonic()
+        if not force and (self.sync_interval is None or now < self._next_sync):
+            return
+        self._next_sync = now + (self.sync_interval or 0)
+        open_ids = set(store.game_ids())
+        for game_id in open_ids:
+            game = store.get(game_id)
+            if game is not None:
+                self.update(game)
+        with self._lock:
+            for game_id in [g for g in self._rooms if g not in open_ids]:
+                del self._rooms[game_id]
+                self._keys.pop(game_id, None)
+                self._version += 1
+
+    def snapshot(self) -> Tuple[bytes, str]:
+        """Return the lobby as a JSON body and its ETag."""
+        with self._lock:
+            if self._rendered is None or self._rendered[0] != self._version:
+                rooms = [self._rooms[game_id] for game_id in sorted(self._rooms)]
+                body = json.dumps(rooms, separators=(',', ':')).encode()
+                etag = hashlib.sha1(body).hexdigest()
+                self._rendered = (self._version, body, etag)
+            return self._rendered[1], self._rendered[2]
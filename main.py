@@ -1,6 +1,5 @@
 import os
 import asyncio
-from app import app
 from bot import main as bot_main
 from multiprocessing import Process
 import signal
@@ -10,29 +9,28 @@ def signal_handler(sig, frame):
     print('Shutting down gracefully...')
     sys.exit(0)
 
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+
 def run_flask():
-    # Use gunicorn configuration
-    from gunicorn.app.base import BaseApplication
+    # Same settings as the gunicorn command line, from gunicorn.conf.py
+    from gunicorn.app.base import Application
 
-    class FlaskApplication(BaseApplication):
-        def __init__(self, app, options=None):
+    class FlaskApplication(Application):
+        def __init__(self, options=None):
             self.options = options or {}
-            self.application = app
             super().__init__()
 
         def load_config(self):
+            self.load_config_from_file(GUNICORN_CONFIG)
             for key, value in self.options.items():
                 self.cfg.set(key.lower(), value)
 
         def load(self):
-            return self.application
-
-    options = {
-        'bind': '0.0.0.0:5000',
-        'workers': 1,
-        'reload': True
-    }
-    FlaskApplication(app, options).run()
+            # Imported in the worker, once gevent has patched it
+            from app import app
+            return app
+
+    FlaskApplication({'reload': True}).run()
 
 def run_bot():
     asyncio.run(bot_main())
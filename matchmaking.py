@@ -0,0 +1,59 @@
+import logging
+import threading
+from typing import Callable, Dict, Optional
+from config import LOBBY_COUNTDOWN, MIN_PLAYERS
+from game_logic import BingoGame
+from game_store import GameStore
+
+logger = logging.getLogger(__name__)
+
+class Matchmaker:
+    """Fills one shared room per entry price instead of opening a game per request.
+
+    Joiners are routed into the price tier's filling room. A room starts as
+    soon as it is full, or LOBBY_COUNTDOWN seconds after MIN_PLAYERS are in
+    (the GameCaller starts it when the countdown runs out); the next joiner
+    then gets a fresh room.
+    """
+
+    def __init__(self, store: GameStore, on_create: Optional[Callable[[BingoGame], None]] = None,
+                 min_players: int = MIN_PLAYERS, countdown: float = LOBBY_COUNTDOWN):
+        self.store = store
+        self.on_create = on_create  # Invoked with every room opened, e.g. to watch and persist it
+        self.min_players = min_players
+        self.countdown = countdown
+        self._filling: Dict[int, int] = {}  # entry price -> id of the room being filled
+        self._lock = threading.Lock()
+
+    def room_for(self, entry_price: int) -> BingoGame:
+        """Return the open room for a price tier, opening one if none has a free seat."""
+        with self._lock:
+            game_id = self._filling.get(entry_price)
+            game = self.store.get(game_id) if game_id is not None else None
+            if not self._has_seat(game, entry_price):
+                game = self._find_room(entry_price) or self._open_room(entry_price)
+                self._filling[entry_price] = game.game_id
+            return game
+
+    @staticmethod
+    def _has_seat(game: Optional[BingoGame], entry_price: int) -> bool:
+        return (game is not None and game.status == "waiting" and game.entry_price == entry_price
+                and len(game.players) < game.max_players)
+
+    def _find_room(self, entry_price: int) -> Optional[BingoGame]:
+        # A room another worker opened for this tier, oldest first
+        for game_id in sorted(self.store.game_ids(("waiting",))):
+            game = self.store.get(game_id)
+            if self._has_seat(game, entry_price):
+                return game
+        return None
+
+    def _open_room(self, entry_price: int) -> BingoGame:
+        game = BingoGame(self.store.next_id(), entry_price)
+        game.min_players = self.min_players
+        game.start_delay = self.countdown
+        self.store.add(game)
+        if self.on_create:
+            self.on_create(game)
+        logger.info(f"Opened room {game.game_id} for entry price {entry_price}")
+        return game
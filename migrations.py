@@ -0,0 +1,262 @@
+"""Versioned schema migrations, applied in order by init_db at startup.
+
+The schema_version table records every migration that has run. Each
+migration runs in its own transaction and is written to be safe on both
+a fresh database and one created by the old db.create_all() startup.
+Append new migrations to MIGRATIONS; never edit one that has shipped.
+
+Migrations never read models.py: the tables and indexes they create are
+frozen below as they were when the migration was written, so replaying
+them on a fresh database builds the same schema an upgraded one has.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import (
+    JSON, BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    UniqueConstraint, inspect, text
+)
+from sqlalchemy.engine import Connection, Engine
+from cartelas import CARTELAS
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_ID = 7411  # Postgres advisory lock held while migrating
+
+def _columns(conn: Connection, table: str) -> List[str]:
+    return [column['name'] for column in inspect(conn).get_columns(table)]
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    if column not in _columns(conn, table):
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+_schema = MetaData()
+
+# Migration 1: the tables the app created with db.create_all() before migrations
+_user = Table(
+    'user', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('telegram_id', BigInteger, unique=True, nullable=False),
+    Column('username', String(64)),
+    Column('phone', String(20)),
+    Column('balance', Float),
+    Column('games_played', Integer),
+    Column('games_won', Integer),
+    Column('created_at', DateTime),
+    Column('referrer_id', BigInteger),
+)
+_game = Table(
+    'game', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('status', String(20)),
+    Column('entry_price', Float, nullable=False),
+    Column('pool', Float),
+    Column('called_numbers', String),
+    Column('winner_id', Integer, ForeignKey('user.id')),
+    Column('created_at', DateTime),
+    Column('finished_at', DateTime),
+)
+_game_participant = Table(
+    'game_participant', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('game_id', Integer, ForeignKey('game.id'), nullable=False),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('cartela_number', Integer, nullable=False),
+    Column('marked_numbers', String),
+    Column('created_at', DateTime),
+    UniqueConstraint('game_id', 'cartela_number', name='unique_cartela_per_game'),
+)
+_transaction = Table(
+    'transaction', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('type', String(20)),
+    Column('amount', Float, nullable=False),
+    Column('status', String(20)),
+    Column('created_at', DateTime),
+    Column('completed_at', DateTime),
+    Column('deposit_phone', String(20)),
+    Column('transaction_id', String(100)),
+    Column('sms_text', Text),
+    Column('withdrawal_phone', String(20)),
+    Column('withdrawal_status', String(20)),
+    Column('admin_note', Text),
+)
+
+# Migration 2
+_game_call = Table(
+    'game_call', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('game_id', Integer, ForeignKey('game.id'), nullable=False),
+    Column('seq', Integer, nullable=False),
+    Column('number', Integer, nullable=False),
+    Column('called_at', DateTime),
+    UniqueConstraint('game_id', 'seq', name='unique_call_seq_per_game'),
+    Index('ix_game_call_number', 'number', 'game_id'),
+)
+
+# Migration 5
+_ledger_entry = Table(
+    'ledger_entry', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('posting_id', String(32), nullable=False),
+    Column('account', String(40), nullable=False),
+    Column('user_id', Integer, ForeignKey('user.id')),
+    Column('amount_cents', BigInteger, nullable=False),
+    Column('kind', String(20), nullable=False),
+    Column('reference', String(100)),
+    Column('created_at', DateTime),
+)
+
+# Migration 7
+_game_event = Table(
+    'game_event', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('game_id', Integer, ForeignKey('game.id'), nullable=False),
+    Column('seq', Integer, nullable=False),
+    Column('type', String(20), nullable=False),
+    Column('data', JSON, nullable=False),
+    UniqueConstraint('game_id', 'seq', name='unique_event_seq_per_game'),
+)
+
+def _create_index(conn: Connection, name: str, table: str, columns: str, unique: bool = False):
+    # Plain DDL: an Index built on the frozen tables would stay attached to them
+    # and be created along with the table by an earlier migration
+    conn.execute(text(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'))
+
+def _create_tables(conn: Connection):
+    """Baseline: create the pre-migration tables that are missing."""
+    for table in (_user, _game, _game_participant, _transaction):
+        table.create(conn, checkfirst=True)
+
+def _game_state_columns(conn: Connection):
+    """Move called and marked numbers out of comma-separated strings into masks and GameCall rows."""
+    _game_call.create(conn, checkfirst=True)
+    _add_column(conn, 'game', 'seed', 'VARCHAR(64)')
+    _add_column(conn, 'game', 'called_low', 'BIGINT NOT NULL DEFAULT 0')
+    _add_column(conn, 'game', 'called_high', 'BIGINT NOT NULL DEFAULT 0')
+    _add_column(conn, 'game_participant', 'marked_mask', 'INTEGER NOT NULL DEFAULT 4096')
+
+    if 'called_numbers' in _columns(conn, 'game'):
+        rows = conn.execute(text("SELECT id, called_numbers FROM game WHERE called_numbers <> ''")).fetchall()
+        for game_id, called in rows:
+            numbers = [int(n) for n in called.split(',') if n]
+            # Bit n-1 of called_low for numbers 1-63, bit n-64 of called_high for 64-75
+            low = sum(1 << (n - 1) for n in set(numbers) if n <= 63)
+            high = sum(1 << (n - 64) for n in set(numbers) if n > 63)
+            conn.execute(text("UPDATE game SET called_low = :low, called_high = :high WHERE id = :id"),
+                         {'low': low, 'high': high, 'id': game_id})
+            conn.execute(text("DELETE FROM game_call WHERE game_id = :id"), {'id': game_id})
+            conn.execute(_game_call.insert(), [
+                {'game_id': game_id, 'seq': seq, 'number': number}
+                for seq, number in enumerate(numbers, start=1)
+            ])
+        conn.execute(text('ALTER TABLE game DROP COLUMN called_numbers'))
+
+    if 'marked_numbers' in _columns(conn, 'game_participant'):
+        rows = conn.execute(text(
+            "SELECT id, cartela_number, marked_numbers FROM game_participant WHERE marked_numbers <> ''"
+        )).fetchall()
+        for participant_id, cartela_number, marked in rows:
+            if cartela_number not in CARTELAS:
+                continue
+            board = CARTELAS.board(cartela_number)
+            mask = 0
+            for number in (int(n) for n in marked.split(',') if n):
+                if number in board:
+                    mask |= 1 << board.index(number)
+            conn.execute(text("UPDATE game_participant SET marked_mask = :mask WHERE id = :id"),
+                         {'mask': mask, 'id': participant_id})
+        conn.execute(text('ALTER TABLE game_participant DROP COLUMN marked_numbers'))
+
+def _hot_lookup_indexes(conn: Connection):
+    """Index User.phone and Transaction(user_id, type, status, created_at) for the deposit path."""
+    _create_index(conn, 'ix_user_phone', 'user', 'phone')
+    _create_index(conn, 'ix_transaction_user_type_status_created', 'transaction',
+                  'user_id, type, status, created_at')
+
+def _deposit_idempotency_index(conn: Connection):
+    """Unique index on Transaction.transaction_id, the idempotency key of a deposit SMS."""
+    _create_index(conn, 'ux_transaction_transaction_id', 'transaction', 'transaction_id', unique=True)
+
+def _ledger(conn: Connection):
+    """Create the ledger, move User.balance into integer balance_cents and open every balance in the ledger."""
+    _ledger_entry.create(conn, checkfirst=True)
+    _create_index(conn, 'ix_ledger_entry_user', 'ledger_entry', 'user_id')
+    _create_index(conn, 'ix_ledger_entry_posting', 'ledger_entry', 'posting_id')
+
+    if 'balance_cents' not in _columns(conn, 'user'):
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN balance_cents BIGINT NOT NULL DEFAULT 0'))
+    if 'balance' not in _columns(conn, 'user'):
+        return
+
+    conn.execute(text('UPDATE "user" SET balance_cents = CAST(ROUND(COALESCE(balance, 0) * 100) AS BIGINT)'))
+    # One opening posting per funded user: the user's leg and its equity counterpart
+    for account, user_id, sign in (('user', 'id', ''), ('equity:opening', 'NULL', '-')):
+        conn.execute(text(
+            "INSERT INTO ledger_entry (posting_id, account, user_id, amount_cents, kind, reference, created_at) "
+            f"SELECT 'opening' || id, '{account}', {user_id}, {sign}balance_cents, 'opening', 'migration:5', :now "
+            'FROM "user" WHERE balance_cents <> 0'
+        ), {'now': datetime.utcnow()})
+    conn.execute(text('ALTER TABLE "user" DROP COLUMN balance'))
+
+def _game_settlement(conn: Connection):
+    """Add Game.settled_at and index ledger entries by reference."""
+    _add_column(conn, 'game', 'settled_at', 'TIMESTAMP')
+    # Games that finished before settlement existed have nothing in the ledger to pay out
+    conn.execute(text("UPDATE game SET settled_at = finished_at WHERE status = 'finished' AND settled_at IS NULL"))
+    _create_index(conn, 'ix_ledger_entry_reference', 'ledger_entry', 'reference')
+
+def _game_room_columns(conn: Connection):
+    """Persist the room settings, winners and event log a restarted game needs."""
+    _add_column(conn, 'game', 'winner_ids', 'JSON')
+    _add_column(conn, 'game', 'min_players', 'INTEGER')
+    _add_column(conn, 'game', 'max_players', 'INTEGER')
+    _add_column(conn, 'game', 'start_delay', 'FLOAT')
+    _add_column(conn, 'game', 'start_at', 'TIMESTAMP')
+    _add_column(conn, 'game', 'epoch', 'VARCHAR(16)')
+    _game_event.create(conn, checkfirst=True)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create missing tables", _create_tables),
+    (2, "game state masks and GameCall rows", _game_state_columns),
+    (3, "indexes for phone and pending transaction lookups", _hot_lookup_indexes),
+    (4, "unique deposit idempotency key", _deposit_idempotency_index),
+    (5, "ledger in integer cents with cached balances", _ledger),
+    (6, "game settlement", _game_settlement),
+    (7, "game room settings and event log", _game_room_columns),
+]
+
+def current_version(conn: Connection) -> int:
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def upgrade(engine: Engine):
+    """Apply every migration newer than the database's schema version."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Workers and the bot start together; only one may migrate at a time
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {'id': MIGRATION_LOCK_ID})
+        try:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"
+            ))
+            conn.commit()
+
+            version = current_version(conn)
+            conn.commit()
+            for number, description, migrate in MIGRATIONS:
+                if number <= version:
+                    continue
+                with conn.begin():
+                    migrate(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_version (version, description, applied_at) "
+                             "VALUES (:version, :description, :applied_at)"),
+                        {'version': number, 'description': description, 'applied_at': datetime.utcnow()}
+                    )
+                logger.info(f"Applied migration {number}: {description}")
+        finally:
+            if engine.dialect.name == 'postgresql':
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': MIGRATION_LOCK_ID})
+                conn.commit()
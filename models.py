@@ -6,24 +6,47 @@ class User(db.Model):
     telegram_id = db.Column(db.BigInteger, unique=True, nullable=False)
     username = db.Column(db.String(64))
     phone = db.Column(db.String(20))
-    balance = db.Column(db.Float, default=0.0)
+    balance_cents = db.Column(db.BigInteger, default=0, nullable=False)  # Cache of the user's ledger legs
     games_played = db.Column(db.Integer, default=0)
     games_won = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     referrer_id = db.Column(db.BigInteger, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_user_phone', 'phone'),  # Deposit webhooks look users up by phone
+    )
+
+    @property
+    def balance(self) -> float:
+        """Balance in birr. Change it only through ledger.post()."""
+        return (self.balance_cents or 0) / 100
+
 class Game(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.String(20), default='waiting')  # waiting, active, finished
     entry_price = db.Column(db.Float, nullable=False)
     pool = db.Column(db.Float, default=0.0)
-    called_numbers = db.Column(db.String, default='')  # Store as comma-separated numbers
+    # Called numbers as a 75-bit mask split over two BIGINTs: bit n-1 of
+    # called_low for numbers 1-63, bit n-64 of called_high for 64-75.
+    # The call order lives in GameCall.
+    called_low = db.Column(db.BigInteger, default=0, nullable=False)
+    called_high = db.Column(db.BigInteger, default=0, nullable=False)
+    seed = db.Column(db.String(64))  # Seed of the call order, see BingoGame.call_sequence
     winner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    winner_ids = db.Column(db.JSON)  # Everyone who completed a line on the winning call
+    min_players = db.Column(db.Integer)
+    max_players = db.Column(db.Integer)
+    start_delay = db.Column(db.Float)  # Countdown once min_players are in, see BingoGame.add_player
+    start_at = db.Column(db.DateTime)  # When the countdown ends
+    epoch = db.Column(db.String(16))  # Names the event log in GameEvent, see BingoGame.epoch
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     finished_at = db.Column(db.DateTime)
+    settled_at = db.Column(db.DateTime)  # Set once the pot has been paid out, see settlement.py
 
     # Relationships
     participants = db.relationship('GameParticipant', backref='game', lazy=True)
+    calls = db.relationship('GameCall', backref='game', lazy=True, order_by='GameCall.seq')
+    events = db.relationship('GameEvent', lazy=True, order_by='GameEvent.seq')
     winner = db.relationship('User', backref='won_games', lazy=True)
 
 class GameParticipant(db.Model):
@@ -31,13 +54,37 @@ class GameParticipant(db.Model):
     game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     cartela_number = db.Column(db.Integer, nullable=False)
-    marked_numbers = db.Column(db.String, default='')  # Store as comma-separated numbers
+    marked_mask = db.Column(db.Integer, default=1 << 12, nullable=False)  # Bit i = board position i marked
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint('game_id', 'cartela_number', name='unique_cartela_per_game'),
     )
 
+class GameCall(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1 for the first call of the game
+    number = db.Column(db.Integer, nullable=False)
+    called_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('game_id', 'seq', name='unique_call_seq_per_game'),
+        db.Index('ix_game_call_number', 'number', 'game_id'),
+    )
+
+class GameEvent(db.Model):
+    """One entry of a game's event log, see BingoGame.events. Appended, never updated."""
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1 for the first event of the game
+    type = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('game_id', 'seq', name='unique_event_seq_per_game'),
+    )
+
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -55,4 +102,28 @@ class Transaction(db.Model):
     # For withdrawals
     withdrawal_phone = db.Column(db.String(20))
     withdrawal_status = db.Column(db.String(20))  # pending, approved, rejected
-    admin_note = db.Column(db.Text)
\ No newline at end of file
+    admin_note = db.Column(db.Text)
+
+    __table_args__ = (
+        # Pending deposit lookup: filter by user, type and status, newest first
+        db.Index('ix_transaction_user_type_status_created', 'user_id', 'type', 'status', 'created_at'),
+        # Idempotency key of the deposit SMS; a replayed webhook can't apply twice
+        db.Index('ux_transaction_transaction_id', 'transaction_id', unique=True),
+    )
+
+class LedgerEntry(db.Model):
+    """One leg of a ledger posting; the legs of a posting sum to zero. Never updated or deleted."""
+    id = db.Column(db.Integer, primary_key=True)
+    posting_id = db.Column(db.String(32), nullable=False)
+    account = db.Column(db.String(40), nullable=False)  # user, game:<id>, house, external:deposits, ...
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Set on user legs
+    amount_cents = db.Column(db.BigInteger, nullable=False)  # Positive credits the account
+    kind = db.Column(db.String(20), nullable=False)  # deposit, withdraw, game_entry, refund, win, opening
+    reference = db.Column(db.String(100))  # e.g. transaction:<id> or game:<id>
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_ledger_entry_user', 'user_id'),
+        db.Index('ix_ledger_entry_posting', 'posting_id'),
+        db.Index('ix_ledger_entry_reference', 'reference'),  # Settlement sums a game's entries
+    )
@@ -0,0 +1,205 @@
+"""Queued, rate-limited delivery of Telegram notifications.
+
+Telegram allows roughly 30 messages a second per bot and one a second per
+chat. The Notifier keeps a queue of chats with pending messages and a
+fixed pool of workers that send them within both limits. Messages queued
+for a chat that is still waiting are merged into one message, and a
+RetryAfter from Telegram pauses every worker for the time it asks for.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError
+)
+from config import NOTIFY_CHAT_RATE, NOTIFY_GLOBAL_RATE, NOTIFY_MAX_RETRIES, NOTIFY_WORKERS
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit for one message
+CHAT_TIMES_LIMIT = 10000  # per-chat send times kept before idle ones are pruned
+
+class TokenBucket:
+    """Allows rate events per second with bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def take(self) -> float:
+        """Take a token; return 0 on success or the seconds to wait before trying again."""
+        now = self.clock()
+        if now < self.updated:  # Paused
+            return self.updated - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """Hand out nothing for the next seconds, then refill from empty."""
+        self.tokens = 0
+        self.updated = max(self.updated, self.clock() + seconds)
+
+class Notifier:
+    """Worker pool that delivers queued messages through a shared Bot."""
+
+    def __init__(self, bot, workers: int = NOTIFY_WORKERS, global_rate: float = NOTIFY_GLOBAL_RATE,
+                 chat_rate: float = NOTIFY_CHAT_RATE, max_retries: int = NOTIFY_MAX_RETRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.bot = bot
+        self.workers = workers
+        self.chat_interval = 1 / chat_rate
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock)
+        self._chat_next: Dict[int, float] = {}  # chat_id -> earliest time of its next send
+        self._pending: Dict[int, Tuple[float, List[str]]] = {}  # chat_id -> (first queued, messages)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._latencies = deque(maxlen=1000)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        for chat_id in self._pending:  # Anything sent before start()
+            self._queue.put_nowait(chat_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10):
+        """Stop the workers, first giving them drain_timeout seconds to empty the queue."""
+        if drain_timeout and self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {len(self._pending)} undelivered notifications on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def send(self, chat_id: int, text: str):
+        """Queue a message; merged with any message still waiting for the same chat."""
+        if chat_id in self._pending:
+            # Split again at send time if the merged text gets too long
+            self._pending[chat_id][1].append(text)
+            self.coalesced += 1
+            return
+        self._pending[chat_id] = (self.clock(), [text])
+        if self._queue is not None:
+            self._queue.put_nowait(chat_id)
+
+    def send_many(self, messages: Iterable[Tuple[int, str]]):
+        """Queue (chat_id, text) pairs, e.g. results for every player in a game."""
+        for chat_id, text in messages:
+            self.send(chat_id, text)
+
+    def stats(self) -> Dict[str, float]:
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))] * 1e3
+
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else len(self._pending),
+            'pending_chats': len(self._pending),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'coalesced': self.coalesced,
+            'latency_p50_ms': percentile(50),
+            'latency_p99_ms': percentile(99),
+        }
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._queue.get()
+            try:
+                await self._deliver(chat_id)
+            except Exception as e:
+                logger.exception(f"Unexpected error notifying chat {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _wait_for_slot(self, chat_id: int):
+        # Reserve the chat's slot before sleeping so a second worker queues behind it
+        now = self.clock()
+        slot = max(now, self._chat_next.get(chat_id, now))
+        self._chat_next[chat_id] = slot + self.chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        while True:
+            delay = self._global.take()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _take_message(self, chat_id: int) -> Tuple[float, str]:
+        queued_at, texts = self._pending.pop(chat_id)
+        batch, length = [], 0
+        for text in texts:
+            if batch and length + len(text) + 2 > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(text)
+            length += len(text) + 2
+        rest = texts[len(batch):]
+        if rest:
+            self._pending[chat_id] = (queued_at, rest)
+            self._queue.put_nowait(chat_id)
+        return queued_at, "\n\n".join(batch)
+
+    async def _deliver(self, chat_id: int):
+        await self._wait_for_slot(chat_id)
+        if chat_id not in self._pending:
+            return
+        queued_at, text = self._take_message(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+                self.sent += 1
+                self._latencies.append(self.clock() - queued_at)
+                break
+            except TelegramRetryAfter as e:
+                # Flood control applies to the whole bot, so every worker backs off
+                logger.warning(f"Telegram asked to retry after {e.retry_after}s (chat {chat_id})")
+                self._global.pause(e.retry_after)
+                delay = e.retry_after
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Transient error notifying chat {chat_id}: {e}")
+                delay = min(2 ** attempt, 30)
+            except TelegramAPIError as e:
+                # Blocked bot, deleted account, bad markup: retrying won't help
+                logger.error(f"Failed to notify chat {chat_id}: {e}")
+                self.failed += 1
+                break
+            if attempt == self.max_retries:
+                logger.error(f"Giving up on chat {chat_id} after {attempt + 1} attempts")
+                self.failed += 1
+                break
+            self.retried += 1
+            await asyncio.sleep(delay)
+            await self._wait_for_slot(chat_id)
+
+        self._prune_chat_times()
+
+    def _prune_chat_times(self):
+        if len(self._chat_next) > CHAT_TIMES_LIMIT:
+            now = self.clock()
+            for chat_id in [c for c, t in self._chat_next.items() if t <= now]:
+                del self._chat_next[chat_id]
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from config import OUTBOX_MAX_ATTEMPTS, OUTBOX_PATH
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    payload: dict
+    attempts: int
+
+class Outbox:
+    """Durable job queue in a local SQLite file shared by the web workers and the bot.
+
+    Producers append and return at once. A consumer claims a batch under a
+    lease; jobs it neither completes nor reschedules before the lease runs
+    out (e.g. because it crashed) are claimed again. Jobs that keep failing
+    are kept with status 'dead' for an admin to look at. A job appended
+    with a key is only queued once while it is in the outbox.
+
+    Connections are opened on first use, one per thread and process, so an
+    outbox built before gunicorn forks never shares a connection with its workers.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            self._create_tables(conn)
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                claimed_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )""")
+        if 'key' not in [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]:
+            conn.execute("ALTER TABLE jobs ADD COLUMN key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_kind_status ON jobs (kind, status, available_at)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_kind_key ON jobs (kind, key)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection inherited through fork belongs to the parent; leave it alone
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # An acknowledged webhook must survive a power cut
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def append(self, kind: str, payload: dict, key: Optional[str] = None) -> Tuple[int, bool]:
+        """Queue a job; returns (job id, created), where created is False if key was already queued."""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "INSERT INTO jobs (kind, key, payload, available_at, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, key) DO NOTHING RETURNING id",
+            (kind, key, json.dumps(payload), now, now)
+        ).fetchone()
+        if row is not None:
+            return row[0], True
+        row = conn.execute("SELECT id FROM jobs WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return row[0], False
+
+    def claim(self, kind: str, limit: int, lease: float) -> List[Job]:
+        """Claim up to limit due jobs for lease seconds, oldest first."""
+        now = time.time()
+        rows = self._connection().execute("""
+            UPDATE jobs SET claimed_until = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM jobs
+                WHERE kind = ? AND status = 'pending' AND available_at <= ?
+                  AND (claimed_until IS NULL OR claimed_until < ?)
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, payload, attempts""",
+            (now + lease, kind, now, now, limit)
+        ).fetchall()
+        return sorted((Job(row[0], json.loads(row[1]), row[2]) for row in rows), key=lambda job: job.id)
+
+    def complete(self, job_ids: List[int]):
+        if not job_ids:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN")
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+        conn.execute("COMMIT")
+
+    def retry(self, job: Job, error: str, delay: float):
+        """Make a failed job due again after delay, or mark it dead after max_attempts."""
+        if job.attempts >= self.max_attempts:
+            logger.error(f"Outbox job {job.id} failed {job.attempts} times, giving up: {error}")
+            status = 'dead'
+        else:
+            status = 'pending'
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, available_at = ?, claimed_until = NULL, last_error = ? WHERE id = ?",
+            (status, time.time() + delay, error, job.id)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
@@ -0,0 +1,122 @@
+"""Pays out finished games.
+
+Entry fees are moved into the game's pot account when players join (see
+app.post_entry). Settlement empties the pot in one transaction per game:
+the winners share it minus HOUSE_CUT, or, if the deck ran out without a
+winner, every player gets their entry back. Player stats and Transaction
+rows are written with bulk statements, so the number of round trips does
+not grow with the number of players. Game.settled_at makes it idempotent.
+result_messages() words the outcome for each player; the bot sends them.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, ROUND_DOWN
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, select, update
+from config import HOUSE_CUT
+from database import db
+import ledger
+from models import Game, LedgerEntry, Transaction, User
+
+logger = logging.getLogger(__name__)
+
+HOUSE = 'house'
+
+@dataclass
+class Settlement:
+    game_id: int
+    pot_cents: int
+    house_cents: int = 0
+    payouts: Dict[int, int] = field(default_factory=dict)  # user_id -> cents paid out
+
+def _paid_entries(game_id: int) -> Dict[int, int]:
+    """Net cents each user has paid into the game, from the ledger."""
+    rows = db.session.execute(
+        select(LedgerEntry.user_id, func.sum(LedgerEntry.amount_cents))
+        .where(LedgerEntry.reference == f"game:{game_id}", LedgerEntry.account == ledger.USER)
+        .group_by(LedgerEntry.user_id)
+    )
+    return {user_id: -int(cents) for user_id, cents in rows if cents < 0}
+
+def settle_game(state: dict, house_cut: float = HOUSE_CUT) -> Optional[Settlement]:
+    """Settle a finished game from its to_state() snapshot in the current session.
+
+    Returns None if the game was already settled. The Game row must exist;
+    the caller commits.
+    """
+    game_id = state['game_id']
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(Game).where(Game.id == game_id, Game.settled_at.is_(None)).values(settled_at=now)
+    ).rowcount
+    if not claimed:
+        return None
+
+    paid = _paid_entries(game_id)
+    pot = sum(paid.values())
+    settlement = Settlement(game_id, pot)
+    winners = sorted(set(state['winner_ids']) & set(state['players']))
+
+    if winners:
+        kind = 'win'
+        cut = int((Decimal(pot) * Decimal(str(house_cut))).to_integral_value(rounding=ROUND_DOWN))
+        share, remainder = divmod(pot - cut, len(winners))
+        settlement.house_cents = cut + remainder  # Odd cents of a split pot go to the house
+        settlement.payouts = {user_id: share for user_id in winners}
+    else:
+        kind = 'refund'
+        settlement.payouts = dict(paid)
+
+    if pot:
+        legs = [(ledger.game_account(game_id), None, -pot)]
+        legs += [(ledger.USER, user_id, cents) for user_id, cents in settlement.payouts.items() if cents]
+        if settlement.house_cents:
+            legs.append((HOUSE, None, settlement.house_cents))
+        ledger.post(kind, legs, reference=f"game:{game_id}")
+
+    players = list(state['players'])
+    if players:
+        db.session.execute(
+            update(User).where(User.id.in_(players))
+            .values(games_played=func.coalesce(User.games_played, 0) + 1)
+            .execution_options(synchronize_session=False)
+        )
+    if winners:
+        db.session.execute(
+            update(User).where(User.id.in_(winners))
+            .values(games_won=func.coalesce(User.games_won, 0) + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    transactions = [
+        {'user_id': user_id, 'type': kind, 'amount': cents / 100, 'status': 'completed',
+         'created_at': now, 'completed_at': now}
+        for user_id, cents in settlement.payouts.items() if cents
+    ]
+    if transactions:
+        db.session.execute(insert(Transaction), transactions)
+
+    logger.info(f"Settled game {game_id}: pot {pot / 100:.2f}, {kind} to {sorted(settlement.payouts)}, "
+                f"house {settlement.house_cents / 100:.2f}")
+    return settlement
+
+def result_messages(state: dict, settlement: Settlement) -> List[Tuple[int, str]]:
+    """(telegram_id, text) telling every player of a settled game how it ended."""
+    game_id = state['game_id']
+    players = list(state['players'])
+    telegram_ids = dict(db.session.execute(select(User.id, User.telegram_id).where(User.id.in_(players))).all())
+    winners = set(state['winner_ids'])
+    messages = []
+    for user_id in players:
+        if user_id not in telegram_ids:
+            continue
+        amount = settlement.payouts.get(user_id, 0) / 100
+        if user_id in winners:
+            text = f"🎉 <b>BINGO!</b> You won game #{game_id}.\n\n{amount:.2f} birr has been added to your balance."
+        elif not winners:
+            text = f"Game #{game_id} ended without a winner.\n\nYour {amount:.2f} birr entry was refunded."
+        else:
+            text = f"Game #{game_id} is over. Better luck next time!"
+        messages.append((telegram_ids[user_id], text))
+    return messages
@@ -0,0 +1,21 @@
+// Signs the page's session in as the Telegram user who opened the WebApp.
+// Resolves to true once the server has verified Telegram's initData.
+const authenticated = (window.Telegram && Telegram.WebApp.initData)
+    ? fetch('/auth', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ init_data: Telegram.WebApp.initData })
+    }).then(response => response.ok).catch(() => false)
+    : Promise.resolve(false);
+
+function whenAuthenticated(action) {
+    authenticated.then(ok => {
+        if (ok) {
+            action();
+        } else {
+            alert('Please open this page from the Bingo bot in Telegram.');
+        }
+    });
+}
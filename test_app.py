@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import tempfile
+from itertools import count
+from urllib.parse import urlencode
+
+# app.py builds its database, outbox and store at import; point them at scratch files
+_scratch = tempfile.mkdtemp(prefix="bingo-app-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'app.db')}"
+os.environ["OUTBOX_PATH"] = os.path.join(_scratch, "outbox.sqlite3")
+
+import pytest
+import app as webapp
+import ledger
+from database import db
+from game_logic import BingoGame
+from game_store import GameStoreConflict
+from models import User
+from webapp_auth import sign_init_data
+
+BOT_TOKEN = "123456:test-token"
+_telegram_ids = count(1000)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(webapp, "TELEGRAM_BOT_TOKEN", BOT_TOKEN)
+    webapp.app.config["TESTING"] = True
+    return webapp.app.test_client()
+
+def init_data(telegram_id, auth_date=None, token=BOT_TOKEN):
+    fields = {'auth_date': str(auth_date or int(time.time())),
+              'user': json.dumps({'id': telegram_id, 'first_name': 'Player'})}
+    return urlencode(dict(fields, hash=sign_init_data(fields, token)))
+
+def make_user(balance_cents=10_000):
+    """Create a registered user with a funded balance; returns (user_id, telegram_id)."""
+    telegram_id = next(_telegram_ids)
+    with webapp.app.app_context():
+        user = User(telegram_id=telegram_id)
+        db.session.add(user)
+        db.session.flush()
+        if balance_cents:
+            ledger.post('deposit', [(ledger.USER, user.id, balance_cents), (ledger.DEPOSITS, None, -balance_cents)])
+        db.session.commit()
+        return user.id, telegram_id
+
+def login(client, telegram_id):
+    return client.post('/auth', json={'init_data': init_data(telegram_id)})
+
+def balance(user_id):
+    with webapp.app.app_context():
+        return db.session.get(User, user_id).balance
+
+def open_room(min_players=10, max_players=100, entry_price=10):
+    game = BingoGame(webapp.game_store.next_id(), entry_price)
+    game.min_players = min_players
+    game.max_players = max_players
+    webapp.game_store.add(game)
+    webapp.lobby.update(game)
+    return game.game_id
+
+def start(game_id):
+    def start_now(game):
+        game.min_players = len(game.players)
+        return game.start_game()
+    assert webapp.game_store.update(game_id, start_now)
+
+def test_auth_accepts_only_signed_recent_init_data_of_a_registered_user(client):
+    user_id, telegram_id = make_user()
+    assert client.post('/auth', json={'init_data': init_data(telegram_id, token="999:other")}).status_code == 401
+    assert client.post('/auth', json={'init_data': init_data(telegram_id, auth_date=1)}).status_code == 401
+    tampered = init_data(telegram_id).replace(str(telegram_id), str(telegram_id + 1), 1)
+    assert client.post('/auth', json={'init_data': tampered}).status_code == 401
+    assert login(client, next(_telegram_ids)).status_code == 403  # Never pressed /start
+
+    response = login(client, telegram_id)
+    assert response.status_code == 200 and response.get_json() == {'user_id': user_id}
+    with client.session_transaction() as session:
+        assert session['user_id'] == user_id
+
+def test_unverified_sessions_are_never_charged(client):
+    victim_id, _ = make_user()
+    game_id = open_room()
+
+    # A session id written by hand, or sent to /game/create, identifies nobody
+    with client.session_transaction() as session:
+        session['user_id'] = victim_id
+    assert client.post(f'/game/{game_id}/join', json={'cartela_number': 1}).status_code == 401
+    client.post('/game/create', json={'entry_price': 10, 'user_id': victim_id})
+    with client.session_transaction() as session:
+        assert 'telegram_id' not in session
+    assert client.get(f'/game/{game_id}').status_code == 302
+    assert balance(victim_id) == 100
+    assert not webapp.game_store.get(game_id).players
+
+def test_verified_user_is_charged_once_on_join(client):
+    user_id, telegram_id = make_user()
+    game_id = open_room()
+    login(client, telegram_id)
+
+    response = client.post(f'/game/{game_id}/join', json={'cartela_number': 7})
+    assert response.status_code == 200 and response.get_json() == {'game_id': game_id, 'cartela_number': 7}
+    assert client.post(f'/game/{game_id}/join', json={'cartela_number': 8}).get_json()['cartela_number'] == 7
+    assert balance(user_id) == 90
+    assert webapp.game_store.get(game_id).players[user_id].cartela_number == 7
+
+def read_events(body):
+    """Split an SSE body into (id, event, data) frames."""
+    frames = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if 'event' in fields:
+            frames.append((fields['id'], fields['event'], json.loads(fields['data'])))
+    return frames
+
+def test_event_stream_replays_from_the_last_event_id(client):
+    game_id = open_room(min_players=2)
+    webapp.game_store.update(game_id, lambda g: g.add_player(1, 1))
+    webapp.game_store.update(game_id, lambda g: g.add_player(2, 2))
+    webapp.game_store.update(game_id, lambda g: g.end_game(1))
+    game = webapp.game_store.get(game_id)
+    expected = [(f"{game.epoch}:{e['seq']}", e['type'], e['data']) for e in game.events]
+
+    response = client.get(f'/game/{game_id}/events', headers={'Last-Event-ID': f"{game.epoch}:2"})
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert body.startswith('retry: 2000\n\n')
+    assert read_events(body) == expected[2:]  # Only what came after event 2, ending at game-finished
+    assert read_events(client.get(f'/game/{game_id}/events?since={game.epoch}:0').get_data(as_text=True)) == expected
+
+def test_event_stream_resets_a_cursor_from_another_epoch(client):
+    game_id = open_room()
+    webapp.game_store.update(game_id, lambda g: g.add_player(1, 1))
+    game = webapp.game_store.get(game_id)
+
+    response = client.get(f'/game/{game_id}/events', headers={'Last-Event-ID': 'lost:5'}, buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks) == b'retry: 2000\n\n'
+    assert read_events(next(chunks).decode()) == [(f"{game.epoch}:1", 'reset', {})]
+    response.close()
+    assert client.get(f'/game/{game_id}/events?since=nonsense').status_code == 400
+
+def test_deposit_key_ignores_unset_tasker_variables_and_non_text_sms():
+    assert webapp.deposit_key({'transaction_id': 'FT2401', 'sms': 'x'}) == 'FT2401'
+    sms_key = webapp.deposit_key({'transaction_id': '%txid', 'sms': 'Received 50 ETB'})
+    assert sms_key == webapp.deposit_key({'sms': 'Received 50 ETB'}) and sms_key.startswith('sha256:')
+    assert webapp.deposit_key({'transaction_id': '%txid', 'sms': '%SMSRB'}) is None
+    assert webapp.deposit_key({'sms': 12345}) == webapp.deposit_key({'sms': '12345'})
+
+def test_deposit_webhook_queues_once_and_answers_replays(client):
+    sms = {'amount': 50, 'phone': '0911000001', 'sms': 'You have received 50.00 ETB, Ref FT5001'}
+    first = client.post('/webhook/deposit', json=sms)
+    assert first.status_code == 202 and first.get_json()['status'] == 'queued'
+    key = first.get_json()['idempotency_key']
+
+    # A Tasker retry before the bot applied it finds the same job
+    retry = client.post('/webhook/deposit', json=sms)
+    assert retry.status_code == 202 and retry.get_json()['job_id'] == first.get_json()['job_id']
+
+    # Once applied, replays are answered as duplicates
+    user_id, _ = make_user(balance_cents=0)
+    with webapp.app.app_context():
+        db.session.add(webapp.Transaction(user_id=user_id, type='deposit', amount=50,
+                                          status='completed', transaction_id=key))
+        db.session.commit()
+    replay = client.post('/webhook/deposit', json=sms)
+    assert replay.status_code == 200 and replay.get_json() == {'status': 'duplicate', 'idempotency_key': key}
+
+    assert client.post('/webhook/deposit', json={'amount': 50}).status_code == 400
+    assert client.post('/webhook/deposit', json=dict(sms, amount='-5')).status_code == 400
+
+def lobby_room(response, game_id):
+    return next(room for room in response.get_json() if room['id'] == game_id)
+
+def test_game_list_is_revalidated_by_etag(client):
+    user_id, telegram_id = make_user()
+    game_id = open_room(entry_price=20)
+
+    listed = client.get('/game/list')
+    etag = listed.headers['ETag']
+    assert listed.status_code == 200 and etag and listed.headers['Cache-Control'] == 'no-cache'
+    assert lobby_room(listed, game_id)['players'] == 0
+
+    unchanged = client.get('/game/list', headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304 and unchanged.data == b'' and unchanged.headers['ETag'] == etag
+
+    login(client, telegram_id)
+    client.post(f'/game/{game_id}/join', json={'cartela_number': 3})
+    changed = client.get('/game/list', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert lobby_room(changed, game_id)['players'] == 1
+
+def test_join_refuses_a_taken_cartela_before_charging(client):
+    first_id, first_telegram = make_user()
+    second_id, second_telegram = make_user()
+    game_id = open_room()
+    login(client, first_telegram)
+    client.post(f'/game/{game_id}/join', json={'cartela_number': 5})
+
+    login(client, second_telegram)
+    assert client.post(f'/game/{game_id}/join', json={'cartela_number': 5}).status_code == 409
+    assert client.post(f'/game/{game_id}/join', json={'cartela_number': 0}).status_code == 400
+    assert balance(first_id) == 90 and balance(second_id) == 100
+    assert list(webapp.game_store.get(game_id).players) == [first_id]
+
+def test_join_refunds_when_the_room_filled_up(client):
+    seated = [make_user() for _ in range(2)]
+    late_id, late_telegram = make_user()
+    game_id = open_room(max_players=2)
+    for cartela, (_, telegram_id) in enumerate(seated, start=1):
+        login(client, telegram_id)
+        client.post(f'/game/{game_id}/join', json={'cartela_number': cartela})
+
+    login(client, late_telegram)
+    assert client.post(f'/game/{game_id}/join', json={'cartela_number': 9}).status_code == 409
+    assert balance(late_id) == 100
+    with webapp.app.app_context():
+        kinds = [tx.type for tx in webapp.Transaction.query.filter_by(user_id=late_id).order_by(webapp.Transaction.id)]
+    assert kinds == ['game_entry', 'refund']
+    assert late_id not in webapp.game_store.get(game_id).players
+
+def test_join_refunds_when_seating_fails(client, monkeypatch):
+    user_id, telegram_id = make_user()
+    game_id = open_room()
+    login(client, telegram_id)
+
+    def update(game_id, mutate):
+        raise GameStoreConflict(f"Could not update game {game_id}")
+    monkeypatch.setattr(webapp.game_store, 'update', update)
+    with pytest.raises(GameStoreConflict):
+        client.post(f'/game/{game_id}/join', json={'cartela_number': 4})
+    assert balance(user_id) == 100
+
+def test_leave_refunds_and_frees_the_cartela(client):
+    user_id, telegram_id = make_user()
+    game_id = open_room()
+    login(client, telegram_id)
+    client.post(f'/game/{game_id}/join', json={'cartela_number': 11})
+
+    response = client.post(f'/game/{game_id}/leave')
+    assert response.status_code == 200 and response.get_json() == {'game_id': game_id, 'left': True}
+    assert balance(user_id) == 100
+    assert 11 not in webapp.game_store.get(game_id).cartela_owners
+    assert client.post(f'/game/{game_id}/leave').status_code == 404
+
+    # Once the game has started the entry stays in the pot
+    client.post(f'/game/{game_id}/join', json={'cartela_number': 11})
+    start(game_id)
+    assert client.post(f'/game/{game_id}/leave').status_code == 409
+    assert balance(user_id) == 90
+
+def test_state_reports_changes_since_the_clients_version(client):
+    user_id, telegram_id = make_user()
+    game_id = open_room()
+    login(client, telegram_id)
+    client.post(f'/game/{game_id}/join', json={'cartela_number': 12})
+    game = webapp.game_store.get(game_id)
+
+    state = client.get(f'/game/{game_id}/state?since=0&epoch={game.epoch}').get_json()
+    assert state == {
+        'epoch': game.epoch, 'version': 1, 'reset': False, 'status': 'waiting', 'players': 1,
+        'calls': [], 'call_count': 0, 'marks': game.marked_numbers(user_id), 'winner_ids': [],
+    }
+
+    start(game_id)
+    game = webapp.game_store.get(game_id)
+    state = client.get(f'/game/{game_id}/state?since=1&epoch={game.epoch}').get_json()
+    assert state['status'] == 'active' and state['calls'] == game.called_numbers and not state['reset']
+    assert client.get(f'/game/{game_id}/state?since=1&epoch=lost').get_json()['reset']
+    assert client.get(f'/game/{game_id}/state?since=x').status_code == 400
+
+def test_selection_page_and_lobby_share_the_taken_cartelas_bitmap(client):
+    _, telegram_id = make_user()
+    game_id = open_room()
+    login(client, telegram_id)
+    client.post(f'/game/{game_id}/join', json={'cartela_number': 6})
+
+    taken = lobby_room(client.get('/game/list'), game_id)['taken_cartelas']
+    assert int(taken, 16) == 1 << 6
+    page = client.get(f'/game/{game_id}/select_cartela').get_data(as_text=True)
+    assert f'data-taken="{taken}"' in page
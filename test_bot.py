@@ -0,0 +1,159 @@
+import os
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+# bot.py needs a token and builds the bot_db database at import; keep both local
+_scratch = tempfile.mkdtemp(prefix="bingo-bot-")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test-token")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'bot.db')}"
+os.environ["OUTBOX_PATH"] = os.path.join(_scratch, "outbox.sqlite3")
+
+import pytest
+import bot as telegram_bot
+from notifications import Notifier
+
+class FakeBot:
+    """Records sent messages and whether its HTTP session was closed."""
+
+    def __init__(self):
+        self.sent = []
+        self.session = SimpleNamespace(closed=False, close=self._close)
+
+    async def _close(self):
+        self.session.closed = True
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append((chat_id, text))
+
+class FakeDispatcher:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.polled = None
+
+    def resolve_used_update_types(self):
+        return []
+
+    async def start_polling(self, bot, allowed_updates, http):
+        # What handlers get is the single Bot and session main() owns
+        self.polled = (bot, http, telegram_bot.bot, telegram_bot.http, telegram_bot.notifier)
+        if self.fail:
+            raise RuntimeError("polling failed")
+
+@pytest.fixture
+def lifecycle(monkeypatch):
+    fake_bot, dispatcher = FakeBot(), FakeDispatcher()
+
+    async def setup_bot():
+        return fake_bot, dispatcher
+
+    async def idle(*args):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(telegram_bot, 'setup_bot', setup_bot)
+    monkeypatch.setattr(telegram_bot, 'consume', idle)
+    monkeypatch.setattr(telegram_bot, 'reconcile_periodically', idle)
+    return fake_bot, dispatcher
+
+def test_main_shares_one_bot_and_session_and_closes_them(lifecycle):
+    fake_bot, dispatcher = lifecycle
+    asyncio.run(telegram_bot.main())
+
+    polled_bot, polled_http, bot, http, notifier = dispatcher.polled
+    assert polled_bot is bot is fake_bot and polled_http is http
+    assert isinstance(notifier, Notifier)
+    assert http.closed and fake_bot.session.closed
+    assert telegram_bot.bot is telegram_bot.http is telegram_bot.notifier is None
+
+def test_main_closes_the_session_when_polling_fails(lifecycle):
+    fake_bot, dispatcher = lifecycle
+    dispatcher.fail = True
+    with pytest.raises(RuntimeError):
+        asyncio.run(telegram_bot.main())
+
+    http = dispatcher.polled[1]
+    assert http.closed and fake_bot.session.closed
+    assert telegram_bot.http is None
+
+def test_send_notification_goes_through_the_notifier(monkeypatch):
+    fake_bot = FakeBot()
+
+    async def go():
+        notifier = Notifier(fake_bot, workers=1, global_rate=1000, chat_rate=1000)
+        monkeypatch.setattr(telegram_bot, 'notifier', notifier)
+        notifier.start()
+        await telegram_bot.send_notification(42, "You won!")
+        assert fake_bot.sent == []  # Queued, not sent inline
+        await notifier.stop()
+
+    asyncio.run(go())
+    assert fake_bot.sent == [(42, "You won!")]
+
+    monkeypatch.setattr(telegram_bot, 'notifier', None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(telegram_bot.send_notification(42, "lost"))
+
+class FakeResponse:
+    def __init__(self, status, payload):
+        self.status = status
+        self.payload = payload
+
+    async def json(self):
+        return self.payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeHttp:
+    def __init__(self, response):
+        self.response = response
+        self.posts = []
+
+    def post(self, url, json=None):
+        self.posts.append((url, json))
+        return self.response
+
+class FakeCallbackQuery:
+    def __init__(self, data, telegram_id=7):
+        self.data = data
+        self.from_user = SimpleNamespace(id=telegram_id)
+        self.answers = []
+        self.edits = []
+        self.message = SimpleNamespace(edit_text=self._edit_text)
+
+    async def _edit_text(self, text, reply_markup=None):
+        self.edits.append((text, reply_markup))
+
+    async def answer(self, text, show_alert=False):
+        self.answers.append(text)
+
+def with_balance(monkeypatch, balance):
+    async def get_user(telegram_id):
+        return SimpleNamespace(balance=balance)
+    monkeypatch.setattr(telegram_bot.bot_db, 'get_user', get_user)
+
+def test_price_selection_joins_through_the_shared_session(monkeypatch):
+    with_balance(monkeypatch, 50)
+    http = FakeHttp(FakeResponse(200, {'game_id': 12, 'players': 3}))
+    query = FakeCallbackQuery('price_20')
+
+    asyncio.run(telegram_bot.process_price_selection(query, http))
+    assert http.posts == [(f"{telegram_bot.WEBAPP_URL}/game/create", {'entry_price': 20})]
+    [(text, keyboard)] = query.edits
+    assert text.startswith("Joining game #12 (3 players waiting). Entry price: 20 Birr")
+    assert keyboard.inline_keyboard[0][0].web_app.url.endswith("/game/12/select_cartela")
+
+def test_price_selection_needs_the_balance_and_a_room(monkeypatch):
+    with_balance(monkeypatch, 5)
+    http = FakeHttp(FakeResponse(200, {'game_id': 12}))
+    query = FakeCallbackQuery('price_20')
+    asyncio.run(telegram_bot.process_price_selection(query, http))
+    assert http.posts == [] and query.answers == ["Insufficient balance. Please deposit first."]
+
+    with_balance(monkeypatch, 50)
+    query = FakeCallbackQuery('price_20')
+    asyncio.run(telegram_bot.process_price_selection(query, FakeHttp(FakeResponse(503, {}))))
+    assert query.edits == [] and query.answers == ["Failed to find a game. Please try again."]
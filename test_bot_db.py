@@ -0,0 +1,125 @@
+import os
+import asyncio
+import tempfile
+from itertools import count
+
+# bot_db builds its Flask app and database at import; point it at a scratch file
+_scratch = tempfile.mkdtemp(prefix="bingo-bot-db-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'bot.db')}"
+
+import bot_db
+import ledger
+from database import db
+from models import Transaction, User
+
+_telegram_ids = count(5000)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def user_with_pending_deposits(*amounts):
+    """Register a user with a phone and pending deposits; returns (telegram_id, phone)."""
+    telegram_id = next(_telegram_ids)
+    phone = f"09{telegram_id:08d}"
+    run(bot_db.register_user(telegram_id, f"user{telegram_id}"))
+    run(bot_db.set_phone(telegram_id, phone))
+    for amount in amounts:
+        run(bot_db.create_deposit(telegram_id, amount))
+    return telegram_id, phone
+
+def deposits_of(telegram_id):
+    with bot_db.app.app_context():
+        user = User.query.filter_by(telegram_id=telegram_id).first()
+        return user.balance, sorted(tx.status for tx in Transaction.query.filter_by(user_id=user.id))
+
+def test_a_replayed_key_is_applied_once():
+    telegram_id, phone = user_with_pending_deposits(50, 50)
+
+    [first] = run(bot_db.confirm_deposits([(phone, 50, 'FT1001')]))
+    assert first.status == 'applied' and first.user.balance == 50
+    [replay] = run(bot_db.confirm_deposits([(phone, 50, 'FT1001')]))
+    assert replay.status == 'duplicate' and replay.user is None
+    assert deposits_of(telegram_id) == (50, ['completed', 'pending'])
+
+def test_identical_keys_in_one_batch_are_applied_once():
+    telegram_id, phone = user_with_pending_deposits(20, 20)
+
+    results = run(bot_db.confirm_deposits([(phone, 20, 'FT2001'), (phone, 20, 'FT2001')]))
+    assert [r.status for r in results] == ['applied', 'duplicate']
+    assert deposits_of(telegram_id) == (20, ['completed', 'pending'])
+
+def test_a_concurrent_replay_is_a_duplicate_and_the_batch_still_commits(monkeypatch):
+    telegram_id, phone = user_with_pending_deposits(30, 40)
+    run(bot_db.confirm_deposits([(phone, 30, 'FT3001')]))
+
+    # Another bot process committed FT3001 after this one checked for it
+    monkeypatch.setattr(bot_db, '_deposit_applied', lambda key: False)
+    results = run(bot_db.confirm_deposits([(phone, 40, 'FT3001'), (phone, 40, 'FT3002')]))
+    assert [r.status for r in results] == ['duplicate', 'applied']
+    assert results[1].user.balance == 70
+    assert deposits_of(telegram_id) == (70, ['completed', 'completed'])
+
+def test_unmatched_deposits_leave_balances_alone():
+    telegram_id, phone = user_with_pending_deposits(10)
+
+    results = run(bot_db.confirm_deposits([('0900000000', 10, 'FT4001'), (phone, 99, 'FT4002')]))
+    assert [r.status for r in results] == ['unmatched', 'unmatched']
+    assert deposits_of(telegram_id) == (0, ['pending'])
+
+def test_register_user_creates_once_and_serves_repeats_from_the_cache():
+    telegram_id = next(_telegram_ids)
+    user, created = run(bot_db.register_user(telegram_id, "alice"))
+    assert created and user.telegram_id == telegram_id and user.balance == 0
+
+    hits = bot_db.cache_stats()['hits']
+    again, created = run(bot_db.register_user(telegram_id, "renamed"))
+    assert not created and again == user
+    assert run(bot_db.get_user(telegram_id)) == user
+    assert bot_db.cache_stats()['hits'] == hits + 2
+    assert run(bot_db.get_user(next(_telegram_ids))) is None
+
+def test_writes_refresh_the_cached_user():
+    telegram_id = next(_telegram_ids)
+    run(bot_db.register_user(telegram_id, "bob"))
+    assert run(bot_db.get_user(telegram_id)).phone is None
+
+    assert run(bot_db.set_phone(telegram_id, "0912345678")).phone == "0912345678"
+    assert run(bot_db.get_user(telegram_id)).phone == "0912345678"
+    assert run(bot_db.set_phone(next(_telegram_ids), "0900000001")) is None
+
+def test_withdrawals_need_the_balance():
+    telegram_id, phone = user_with_pending_deposits(100)
+    run(bot_db.confirm_deposits([(phone, 100, 'FT6001')]))
+
+    user, created = run(bot_db.create_withdrawal(telegram_id, 150))
+    assert not created and user.balance == 100
+    user, created = run(bot_db.create_withdrawal(telegram_id, 60))
+    assert created
+
+    user, transactions = run(bot_db.get_stats(telegram_id))
+    assert user.balance == 100  # Pending withdrawals aren't deducted until paid out
+    assert sorted((t.type, t.amount, t.status) for t in transactions) == [
+        ('deposit', 100, 'completed'), ('withdraw', -60, 'pending')]
+
+def test_get_stats_reads_through_the_cache():
+    telegram_id = next(_telegram_ids)
+    user, _ = run(bot_db.register_user(telegram_id, "carol"))
+
+    # The web process credits the user; only the cached row is stale
+    with bot_db.app.app_context():
+        ledger.post('deposit', [(ledger.USER, user.id, 2500), (ledger.DEPOSITS, None, -2500)])
+        db.session.commit()
+    assert run(bot_db.get_user(telegram_id)).balance == 0
+    assert run(bot_db.get_stats(telegram_id))[0].balance == 25
+    assert run(bot_db.get_user(telegram_id)).balance == 25
+
+def test_calls_run_concurrently_off_the_event_loop():
+    telegram_ids = [next(_telegram_ids) for _ in range(8)]
+
+    async def register_all():
+        return await asyncio.gather(*(bot_db.register_user(t, None) for t in telegram_ids))
+
+    results = run(register_all())
+    assert [user.telegram_id for user, created in results] == telegram_ids
+    assert all(created for _, created in results)
+    assert run(bot_db.reconcile_ledger()).ok
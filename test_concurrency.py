@@ -0,0 +1,94 @@
+import random
+import threading
+from cartelas import CARTELAS
+from game_logic import BingoGame, WIN_PATTERNS
+from game_store import InMemoryGameStore, SQLiteGameStore
+
+def hammer(target, args_list):
+    """Run target once per args tuple, all threads released together."""
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+
+    def run(index, args):
+        barrier.wait()
+        results[index] = target(*args)
+
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def assert_event_log_is_gapless(game):
+    assert [event['seq'] for event in game.events] == list(range(1, len(game.events) + 1))
+
+def test_each_cartela_is_taken_once():
+    game = BingoGame(1, entry_price=10)
+    game.min_players = 1000  # Stay open for every joiner
+
+    # 200 players fight over 50 cartelas
+    boards = hammer(game.add_player, [(user_id, user_id % 50 + 1) for user_id in range(200)])
+
+    assert sum(1 for board in boards if board) == 50
+    assert sorted(game.cartela_owners) == list(range(1, 51))
+    assert all(game.players[user_id].cartela_number == cartela
+               for cartela, user_id in game.cartela_owners.items())
+    assert game.pool == 50 * 10
+    assert sum(1 for event in game.events if event['type'] == 'player-joined') == 50
+    assert_event_log_is_gapless(game)
+
+def test_random_cartelas_never_collide_and_room_never_overfills():
+    game = BingoGame(1)
+    game.min_players = 1000
+    game.max_players = CARTELAS.size // 2
+    hammer(game.add_player, [(user_id,) for user_id in range(CARTELAS.size)])
+
+    assert len(game.players) == game.max_players
+    assert len(game.cartela_owners) == game.max_players
+
+def test_joins_marks_and_calls_at_once_produce_one_consistent_finish():
+    game = BingoGame(1)
+    game.min_players = 30  # Starts part-way through the joins
+    game.max_players = 60
+    game.add_player(0)
+    assert game.status == "waiting"
+
+    def caller():
+        while game.status != "finished":
+            game.draw()
+
+    def joiner(user_id):
+        game.add_player(user_id)
+
+    def marker(seed):
+        rng = random.Random(seed)
+        for _ in range(500):
+            game.mark_number(rng.choice(list(game.players)), rng.randint(1, 75))
+
+    jobs = [(caller, ())] * 4 + [(joiner, (u,)) for u in range(1, 80)] + [(marker, (s,)) for s in range(8)]
+    hammer(lambda job, args: job(*args), jobs)
+
+    assert game.status == "finished"
+    assert len(game.called_numbers) == len(set(game.called_numbers))
+    assert game.verify_calls()
+    assert len(game.players) == game.min_players  # Everyone after the start was refused
+    assert [event['type'] for event in game.events].count('game-finished') == 1
+    assert_event_log_is_gapless(game)
+
+    # Every declared winner really holds a line of called numbers
+    for user_id in game.winner_ids:
+        board = game.players[user_id].board
+        called = {i for i, number in enumerate(board) if game.is_called(number)} | {12}
+        assert any(all(pattern >> i & 1 == 0 or i in called for i in range(25)) for pattern, _ in WIN_PATTERNS)
+
+def test_game_ids_are_unique_under_contention(tmp_path):
+    memory = InMemoryGameStore()
+    path = str(tmp_path / "games.sqlite3")
+    workers = [SQLiteGameStore(path), SQLiteGameStore(path)]
+
+    memory_ids = hammer(memory.next_id, [()] * 100)
+    sqlite_ids = hammer(lambda store: store.next_id(), [(workers[i % 2],) for i in range(100)])
+
+    assert sorted(memory_ids) == list(range(1, 101))
+    assert len(set(sqlite_ids)) == 100
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+import pytest
+import game_caller
+import game_logic
+from game_caller import GameCaller
+from game_logic import BingoGame
+from game_store import InMemoryGameStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2026, 1, 1, 12, 0)
+
+    def advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    fake_datetime = type('FakeDatetime', (datetime,), {'utcnow': classmethod(lambda cls: clock.now)})
+    monkeypatch.setattr(game_logic, 'datetime', fake_datetime)
+    monkeypatch.setattr(game_caller, 'datetime', fake_datetime)
+    return clock
+
+def active_game(store):
+    game = BingoGame(store.next_id())
+    game.min_players = 2
+    store.add(game)
+    store.update(game.game_id, lambda g: g.add_player(1))
+    store.update(game.game_id, lambda g: g.add_player(2))
+    return game.game_id
+
+def test_tick_calls_on_the_games_own_cadence(clock):
+    store = InMemoryGameStore()
+    game_id = active_game(store)
+    assert len(store.get(game_id).called_numbers) == 1  # Called on start
+    caller = GameCaller(store, interval=5)
+
+    assert caller._tick(game_id) == 5
+    clock.advance(3)
+    assert caller._tick(game_id) == pytest.approx(2)
+    assert len(store.get(game_id).called_numbers) == 1
+
+    clock.advance(2)
+    assert caller._tick(game_id) == 5
+    assert len(store.get(game_id).called_numbers) == 2
+
+    store.update(game_id, lambda g: g.end_game())
+    assert caller._tick(game_id) is None
+
+class CalledElsewhereStore(InMemoryGameStore):
+    """Another worker makes the due call, finishes the game, and it is evicted before we re-read it."""
+
+    racing = False
+
+    def update(self, game_id, mutate):
+        if not self.racing:
+            return super().update(game_id, mutate)
+        super().update(game_id, lambda g: g.end_game())
+        self._games.pop(game_id)
+        return None
+
+def test_tick_drops_a_game_evicted_while_it_was_called(clock):
+    store = CalledElsewhereStore()
+    game_id = active_game(store)
+    caller = GameCaller(store, interval=5)
+    clock.advance(5)
+    store.racing = True
+
+    assert caller._tick(game_id) is None
+    assert caller._tick(game_id) is None  # Already gone when the tick starts
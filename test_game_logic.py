@@ -0,0 +1,179 @@
+from cartelas import CARTELAS, CARTELA_VERSION, generate_boards
+from game_logic import BingoGame, WIN_PATTERNS, FREE_SPACE
+
+def make_game(*user_ids):
+    """Create a game that has not started, so no numbers are called yet."""
+    game = BingoGame(1)
+    game.min_players = len(user_ids) + 1
+    for cartela, user_id in enumerate(user_ids, start=1):
+        game.add_player(user_id, cartela_number=cartela)
+    return game
+
+def start(game):
+    """Start a game created by make_game."""
+    game.min_players = 1
+    assert game.start_game()
+
+def force_call(game, number):
+    """Record a specific number as called."""
+    game.called_numbers.append(number)
+    game.called_mask |= 1 << number
+
+def test_win_patterns_cover_rows_columns_and_diagonals():
+    assert len(WIN_PATTERNS) == 12
+    assert all(bin(pattern).count('1') == 5 for pattern, _ in WIN_PATTERNS)
+
+def test_mark_requires_called_number_on_board():
+    game = make_game(1)
+    board = game.players[1].board
+    off_board = next(n for n in range(1, 76) if n not in board)
+
+    assert not game.mark_number(1, board[0])  # not called yet
+    force_call(game, board[0])
+    force_call(game, off_board)
+    assert game.mark_number(1, board[0])
+    assert not game.mark_number(1, off_board)
+    assert game.marked_numbers(1) == sorted([board[0], board[FREE_SPACE]])
+
+def test_row_column_and_diagonal_wins():
+    lines = {
+        "Winner - Row complete!": [5, 6, 7, 8, 9],
+        "Winner - Column complete!": [2, 7, 17, 22],  # 12 is the free space
+        "Winner - Diagonal complete!": [0, 6, 18, 24],
+    }
+    for message, positions in lines.items():
+        game = make_game(1)
+        board = game.players[1].board
+        assert game.check_winner(1) == (False, "Keep playing")
+        for position in positions:
+            force_call(game, board[position])
+            game.mark_number(1, board[position])
+        assert game.check_winner(1) == (True, message)
+
+def test_check_winner_unknown_player():
+    assert make_game(1).check_winner(2) == (False, "Player not in game")
+
+def has_called_line(game, user_id):
+    """Brute-force check for a line of called numbers on a player's board."""
+    board = game.players[user_id].board
+    covered = [i == FREE_SPACE or game.is_called(n) for i, n in enumerate(board)]
+    return any(all(covered[i] for i in range(25) if pattern >> i & 1) for pattern, _ in WIN_PATTERNS)
+
+def test_draw_finds_exactly_the_players_with_a_complete_line():
+    for _ in range(20):
+        game = make_game(*range(1, 31))
+        start(game)
+        while game.status == "active":
+            number, winners = game.draw()
+        assert winners
+        assert game.winner_ids == sorted(winners)
+        assert {u for u in game.players if has_called_line(game, u)} == winners
+
+def test_joining_a_started_game_is_refused():
+    game = make_game(1)
+    start(game)
+    board = game.generate_board(2)
+    for number in board[0:5]:
+        if not game.is_called(number):
+            force_call(game, number)
+    assert game.add_player(2, cartela_number=2) == []
+    assert game.status == "active" and 2 not in game.players and 2 not in game.cartela_owners
+
+def test_cartela_table_matches_generator_and_column_ranges():
+    assert CARTELAS.version == CARTELA_VERSION
+    assert CARTELAS._boards == generate_boards(CARTELAS.size)
+    for cartela_number in range(1, CARTELAS.size + 1):
+        board = CARTELAS.board(cartela_number)
+        assert len(set(board)) == 25
+        assert all(15 * (i % 5) < n <= 15 * (i % 5) + 15 for i, n in enumerate(board))
+
+def test_add_player_rejects_unknown_cartela():
+    game = make_game()
+    assert game.add_player(1, cartela_number=CARTELAS.size + 1) == []
+    assert game.add_player(1, cartela_number=0) == []
+
+def test_calls_follow_the_committed_seed():
+    game = make_game(1, 2)
+    start(game)
+    while game.status == "active":
+        game.draw()
+    assert game.verify_calls()
+    assert game.called_numbers == BingoGame.call_sequence(game.seed)[:len(game.called_numbers)]
+    assert game.events[-1]['data']['seed'] == game.seed
+
+    game.seed = BingoGame(2).seed
+    assert not game.verify_calls()
+
+def test_state_round_trip_resumes_the_same_game():
+    game = make_game(1, 2, 3)
+    start(game)
+    for _ in range(5):
+        game.draw()
+    number = game.called_numbers[0]
+    for user_id in game.players:
+        game.mark_number(user_id, number)
+
+    restored = BingoGame.from_state(game.to_state())
+    assert restored.to_state() == game.to_state()
+    assert restored.verify_calls()
+    while game.status == "active":
+        assert restored.draw() == game.draw()
+    assert restored.winner_ids == game.winner_ids
+
+def test_free_cartelas_follow_joins_and_leaves():
+    game = make_game(1, 2)
+    assert game.cartela_owners == {1: 1, 2: 2}
+    assert game.taken_cartelas_hex() == format(0b110, 'x')
+    assert len(game._free) == CARTELAS.size - 2 and 1 not in game._free
+    assert all(game._free_slots[n] == slot for slot, n in enumerate(game._free))
+
+    assert game.remove_player(1)
+    assert game.pool == game.entry_price and 1 not in game.cartela_owners
+    assert game.add_player(3, cartela_number=1)
+    assert all(game._free_slots[n] == slot for slot, n in enumerate(game._free))
+
+    # Random picks drain the free list without ever repeating a cartela
+    game.min_players = game.max_players = CARTELAS.size + 1
+    for user_id in range(10, 10 + CARTELAS.size - 2):
+        assert game.add_player(user_id)
+    assert game.random_free_cartela() is None and not game.add_player(999)
+    assert game.taken_mask == sum(1 << n for n in range(1, CARTELAS.size + 1))
+
+def test_players_cannot_leave_a_started_game():
+    game = make_game(1)
+    start(game)
+    assert not game.remove_player(1)
+
+def test_seats_stay_compact():
+    from benchmark import measure_memory
+    game = make_game(1)
+    assert not hasattr(game, '__dict__') and not hasattr(game.players[1], '__dict__')
+    memory = measure_memory(20, 100)
+    assert memory['bytes_per_seat'] < 200
+    assert memory['bytes_per_join'] < 700  # The seat plus its player-joined event
+
+def test_changes_since_lists_only_new_calls_and_own_marks():
+    game = make_game(1, 2)
+    start(game)
+    first = game.called_numbers[0]
+    version = game.version
+
+    game.draw()
+    second = game.called_numbers[1]
+    for user_id in (1, 2):
+        for number in (first, second):
+            game.mark_number(user_id, number)
+    marked = game.marked_numbers(1)
+
+    # Marks never enter the shared log, so they don't bump the version
+    assert game.version == version + 1
+    changes = game.changes_since(version, user_id=1, epoch=game.epoch)
+    assert changes['calls'] == [second] and changes['marks'] == marked
+    assert changes['version'] == game.version and not changes['reset']
+    assert game.changes_since(game.version, user_id=1, epoch=game.epoch)['calls'] == []
+
+    # A cursor out of range or from another event log gets everything
+    for cursor, epoch in ((-1, game.epoch), (game.version, 'restarted')):
+        full = game.changes_since(cursor, user_id=1, epoch=epoch)
+        assert full['reset'] and full['calls'] == [first, second]
+    assert BingoGame.from_state(game.to_state()).epoch == game.epoch
@@ -0,0 +1,168 @@
+import pytest
+from flask import Flask
+from database import db, init_db
+from game_logic import BingoGame
+from game_persistence import GamePersister, _marked_mask, _marked_numbers, load_active_games, split_called_mask
+import ledger
+from models import Game, GameCall, GameParticipant, User
+from outbox import Outbox
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'persistence.db'}")
+    app = Flask(__name__)
+    init_db(app)
+    return app
+
+def waiting_game(game_id):
+    game = BingoGame(game_id)
+    game.min_players = 10
+    return game
+
+def test_called_and_marked_masks_round_trip():
+    low, high = split_called_mask([1, 63, 64, 75])
+    assert (low, high) == (1 | 1 << 62, 1 | 1 << 11)
+    assert split_called_mask([]) == (0, 0)
+
+    board = BingoGame(1).generate_board(7)
+    marked = [board[0], board[12], board[24]]
+    assert _marked_mask(7, marked) == 1 | 1 << 12 | 1 << 24
+    assert _marked_numbers(7, _marked_mask(7, marked)) == marked
+
+class BrokenGame:
+    game_id = 99
+
+    def to_state(self):
+        raise RuntimeError("cannot snapshot")
+
+def test_a_leaver_is_deleted_and_their_cartela_can_be_reused(app):
+    persister = GamePersister(app)
+    game = waiting_game(1)
+    game.add_player(1, cartela_number=5)
+    persister._dirty[1] = game
+    persister.flush()
+
+    game.remove_player(1)
+    game.add_player(2, cartela_number=5)
+    persister._dirty[1] = game
+    persister.flush()
+
+    assert not persister._dirty
+    with app.app_context():
+        rows = GameParticipant.query.filter_by(game_id=1).all()
+        assert [(p.user_id, p.cartela_number) for p in rows] == [(2, 5)]
+    assert list(load_active_games(app)[1].players) == [2]
+
+def test_one_failing_game_does_not_hold_back_the_others(app):
+    persister = GamePersister(app)
+    persister._dirty = {99: BrokenGame(), 2: waiting_game(2)}
+    persister.flush()
+
+    with app.app_context():
+        assert db.session.get(Game, 2) is not None
+    assert list(persister._dirty) == [99]  # Retried on the next flush
+
+def test_room_settings_winners_and_events_survive_a_restart(app):
+    persister = GamePersister(app)
+    game = waiting_game(3)
+    game.max_players = 40
+    game.start_delay = 30
+    game.add_player(1, cartela_number=7)
+    for user_id in range(2, 11):
+        game.add_player(user_id)
+    assert game.start_at is not None
+    persister._dirty[3] = game
+    persister.flush()
+
+    restored = load_active_games(app)[3]
+    assert (restored.min_players, restored.max_players, restored.start_delay, restored.start_at) == \
+        (10, 40, 30, game.start_at)
+    assert restored.events == game.events and restored.epoch == game.epoch
+    assert restored.changes_since(game.version, 1, game.epoch)['reset'] is False
+
+    game.start_game()
+    game.end_game(1)
+    persister._dirty[3] = game
+    persister.flush()
+    with app.app_context():
+        row = db.session.get(Game, 3)
+        assert row.winner_ids == [1]
+        assert len(row.events) == len(game.events)
+
+def test_settled_game_queues_a_result_for_every_player(app, tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    persister = GamePersister(app, outbox=outbox)
+    game = waiting_game(4)
+    game.min_players = 3
+    with app.app_context():
+        for telegram_id in (101, 102, 103):
+            user = User(telegram_id=telegram_id)
+            db.session.add(user)
+            db.session.flush()
+            ledger.post('deposit', [(ledger.USER, user.id, 1000), (ledger.DEPOSITS, None, -1000)])
+            ledger.post('game_entry', [(ledger.USER, user.id, -1000), (ledger.game_account(4), None, 1000)],
+                        reference="game:4")
+            game.add_player(user.id)
+        db.session.commit()
+    winner = next(iter(game.players))
+    game.end_game(winner)
+    persister._dirty[4] = game
+    persister.flush()
+
+    [job] = outbox.claim('game-result', 10, 60)
+    messages = dict(job.payload['messages'])
+    assert sorted(messages) == [101, 102, 103]
+    assert "You won game #4" in messages[101] and "Better luck" in messages[102]
+
+    persister._dirty[4] = game  # Flushed again: already settled, nothing new to send
+    persister.flush()
+    outbox.complete([job.id])
+    assert outbox.claim('game-result', 10, 60) == []
+
+def test_calls_are_appended_across_flushes_and_restored_in_order(app):
+    persister = GamePersister(app)
+    game = waiting_game(5)
+    game.min_players = 1
+    game.add_player(1, cartela_number=3)
+    for _ in range(3):
+        game.draw()
+    persister._dirty[5] = game
+    persister.flush()
+    for _ in range(2):
+        game.draw()
+    persister._dirty[5] = game
+    persister.flush()
+
+    with app.app_context():
+        rows = GameCall.query.filter_by(game_id=5).order_by(GameCall.seq).all()
+        assert [(c.seq, c.number) for c in rows] == list(enumerate(game.called_numbers, start=1))
+        row = db.session.get(Game, 5)
+        assert (row.called_low, row.called_high) == split_called_mask(game.called_numbers)
+
+    restored = load_active_games(app)[5]
+    assert restored.called_numbers == game.called_numbers
+    assert restored.called_mask == game.called_mask
+    assert restored.draw() == game.draw()
+
+def test_a_stale_copy_never_reopens_a_finished_game(app):
+    persister = GamePersister(app)
+    game = waiting_game(6)
+    game.min_players = 2
+    game.add_player(1)
+    game.add_player(2)
+    stale = BingoGame.from_state(game.to_state())  # Another worker's older copy
+    game.draw()
+    game.end_game(1)
+    persister._dirty[6] = game
+    persister.flush()
+
+    stale.draw()  # Fewer events than the row, and still active
+    persister._dirty[6] = stale
+    persister.flush()
+
+    with app.app_context():
+        row = db.session.get(Game, 6)
+        assert row.status == 'finished' and row.settled_at is not None
+        assert len(row.events) == len(game.events)
+    assert 6 not in load_active_games(app)
+    assert not persister._dirty  # Dropped, not retried
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from game_logic import BingoGame
+from game_store import InMemoryGameStore, SQLiteGameStore
+
+def new_game(store):
+    game = BingoGame(store.next_id())
+    game.min_players = 20  # Starts on the last join
+    store.add(game)
+    return game.game_id
+
+def join_concurrently(store, game_id, user_ids):
+    threads = [
+        threading.Thread(target=store.update, args=(game_id, lambda g, u=u: g.add_player(u)))
+        for u in user_ids
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_in_memory_store_updates():
+    store = InMemoryGameStore()
+    store.reserve_ids(41)
+    game_id = new_game(store)
+    assert game_id == 42
+
+    join_concurrently(store, game_id, range(1, 21))
+    game = store.get(game_id)
+    assert len(game.players) == 20 and game.pool == 200
+    assert store.game_ids() == [game_id]
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "games.sqlite3")
+    worker_a, worker_b = SQLiteGameStore(path), SQLiteGameStore(path)
+    game_id = new_game(worker_a)
+    assert worker_b.next_id() == game_id + 1
+
+    # Both "workers" join players into the same game at once
+    threads = [
+        threading.Thread(target=join_concurrently, args=(worker_a, game_id, range(1, 11))),
+        threading.Thread(target=join_concurrently, args=(worker_b, game_id, range(11, 21))),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for store in (worker_a, worker_b):
+        game = store.get(game_id)
+        assert sorted(game.players) == list(range(1, 21))
+        assert game.pool == 200 and game.status == "active"
+        assert len(game.called_numbers) == 1  # started exactly once
+
+    worker_a.update(game_id, lambda g: g.draw())
+    assert worker_b.get(game_id).called_numbers == worker_a.get(game_id).called_numbers
+    assert worker_b.wait_for_events(game_id, 0, timeout=0)[-1]['type'] == 'number-called'
+
+def test_sqlite_update_publishes_only_committed_games(tmp_path):
+    path = str(tmp_path / "games.sqlite3")
+    worker_a, worker_b = SQLiteGameStore(path), SQLiteGameStore(path)
+    game_id = new_game(worker_a)
+    seen_by_reader = worker_a.get(game_id)
+
+    # worker_b commits first, so worker_a's first attempt loses and is retried
+    attempts = []
+
+    def join(game):
+        attempts.append(game)
+        if len(attempts) == 1:
+            worker_b.update(game_id, lambda g: g.add_player(2))
+        return game.add_player(1)
+
+    assert worker_a.update(game_id, join)
+    assert len(attempts) == 2 and all(g is not seen_by_reader for g in attempts)
+    assert seen_by_reader.events == []  # The losing attempt's event never leaked
+    events = worker_a.get(game_id).events
+    assert [e['seq'] for e in events] == [1, 2] and worker_b.get(game_id).events == events
+
+def test_finished_games_are_evicted(tmp_path, monkeypatch):
+    import game_store
+    monkeypatch.setattr(game_store, 'SWEEP_INTERVAL', 0)
+    for store in (InMemoryGameStore(finished_ttl=0), SQLiteGameStore(str(tmp_path / "g.sqlite3"), finished_ttl=0)):
+        game_id = new_game(store)
+        other_id = new_game(store)
+        store.update(game_id, lambda g: g.end_game())
+        store.update(other_id, lambda g: g.add_player(1))
+        assert game_id not in store and other_id in store
+
+def test_forked_worker_opens_its_own_connection(tmp_path):
+    store = SQLiteGameStore(str(tmp_path / "games.sqlite3"))
+    game_id = new_game(store)  # The parent has a connection open before forking
+    parent_conn = store._connection()
+
+    pid = os.fork()
+    if pid == 0:  # Like a gunicorn worker forked after app.py was imported
+        try:
+            ok = store._connection() is not parent_conn and store.update(game_id, lambda g: g.add_player(1))
+            os._exit(0 if ok else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store._connection() is parent_conn
+    assert list(store.get(game_id).players) == [1]
+
+def test_sqlite_waiters_are_woken_by_another_worker(tmp_path):
+    path = str(tmp_path / "games.sqlite3")
+    worker_a, worker_b = SQLiteGameStore(path), SQLiteGameStore(path)
+    game_id = new_game(worker_a)
+    worker_b.wait_for_events(game_id, 0, timeout=0)  # Starts worker_b's listener
+
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(
+        (worker_b.wait_for_events(game_id, 0, timeout=10), time.monotonic())))
+    waiter.start()
+    time.sleep(0.1)
+    committed = time.monotonic()
+    worker_a.update(game_id, lambda g: g.add_player(1))
+    waiter.join()
+
+    events, woken_at = woken[0]
+    assert [e['type'] for e in events] == ['player-joined']
+    assert woken_at - committed < 1  # Woken by the commit, not the timeout
@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask
+from sqlalchemy import text
+import ledger
+from database import db, init_db
+from models import User
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'ledger.db'}")
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        yield app
+
+def make_user(telegram_id):
+    user = User(telegram_id=telegram_id)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def test_to_cents_rounds_half_up():
+    assert ledger.to_cents(10) == 1000
+    assert ledger.to_cents(0.1 + 0.2) == 30
+    assert ledger.to_cents("19.995") == 2000
+
+def test_postings_update_cached_balances(app):
+    alice, bob = make_user(1), make_user(2)
+    ledger.post('deposit', [(ledger.USER, alice, 5000), (ledger.DEPOSITS, None, -5000)])
+    balances = ledger.post('game_entry', [
+        (ledger.USER, alice, -2000), (ledger.game_account(7), None, 2000)
+    ])
+    db.session.commit()
+    assert balances == {alice: 3000}
+    assert db.session.get(User, alice).balance == 30.0
+
+    with pytest.raises(ledger.InsufficientFunds):
+        ledger.post('game_entry', [(ledger.USER, bob, -2000), (ledger.game_account(7), None, 2000)])
+    db.session.rollback()
+
+    with pytest.raises(ValueError):
+        ledger.post('deposit', [(ledger.USER, bob, 100)])
+
+    assert ledger.reconcile(batch_size=1).ok
+
+def test_reconcile_finds_drifted_balances(app):
+    alice = make_user(1)
+    ledger.post('deposit', [(ledger.USER, alice, 5000), (ledger.DEPOSITS, None, -5000)])
+    db.session.execute(text('UPDATE "user" SET balance_cents = 9999'))
+    db.session.commit()
+
+    report = ledger.reconcile()
+    assert not report.ok and report.mismatches == [(alice, 9999, 5000)]
@@ -0,0 +1,41 @@
+import json
+from game_logic import BingoGame
+from game_store import InMemoryGameStore
+from lobby import Lobby
+
+def test_snapshot_tracks_joins_and_drops_finished_rooms():
+    lobby = Lobby()
+    game = BingoGame(1, entry_price=20)
+    game.min_players = 3
+    lobby.update(game)
+    body, etag = lobby.snapshot()
+    assert json.loads(body) == [{'id': 1, 'entry_price': 20, 'status': 'waiting', 'players': 0,
+                                 'max_players': 100, 'start_at': None, 'taken_cartelas': '0'}]
+
+    # Unchanged game: same body object, same ETag
+    lobby.update(game)
+    assert lobby.snapshot() == (body, etag)
+
+    game.add_player(5, cartela_number=9)
+    lobby.update(game)
+    body, new_etag = lobby.snapshot()
+    assert new_etag != etag
+    assert json.loads(body)[0]['taken_cartelas'] == format(1 << 9, 'x')
+
+    game.end_game()
+    lobby.update(game)
+    assert json.loads(lobby.snapshot()[0]) == []
+
+def test_sync_picks_up_rooms_changed_elsewhere():
+    store = InMemoryGameStore()
+    lobby = Lobby(sync_interval=60)
+    for game_id in (store.next_id(), store.next_id()):
+        store.add(BingoGame(game_id))
+    lobby.sync(store)
+    assert [room['id'] for room in json.loads(lobby.snapshot()[0])] == [1, 2]
+
+    store.update(2, lambda g: g.end_game())
+    lobby.sync(store)  # Within the interval: nothing re-read
+    assert len(json.loads(lobby.snapshot()[0])) == 2
+    lobby.sync(store, force=True)
+    assert [room['id'] for room in json.loads(lobby.snapshot()[0])] == [1]
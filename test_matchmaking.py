@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from game_caller import GameCaller
+from game_store import InMemoryGameStore
+from matchmaking import Matchmaker
+
+def test_joiners_share_a_room_per_price_until_it_starts():
+    store = InMemoryGameStore()
+    opened = []
+    matchmaker = Matchmaker(store, on_create=opened.append, min_players=2, countdown=30)
+
+    room = matchmaker.room_for(10)
+    assert matchmaker.room_for(10).game_id == room.game_id
+    assert matchmaker.room_for(20).game_id != room.game_id
+
+    store.update(room.game_id, lambda g: g.add_player(1))
+    store.update(room.game_id, lambda g: g.add_player(2))
+    game = store.get(room.game_id)
+    assert game.status == "waiting" and game.start_at is not None
+    assert game.events[-1]['type'] == 'countdown'
+
+    # Still filling during the countdown
+    assert matchmaker.room_for(10).game_id == room.game_id
+
+    store.update(room.game_id, lambda g: g.start_game())
+    next_room = matchmaker.room_for(10)
+    assert next_room.game_id not in (room.game_id, opened[1].game_id)
+    assert [g.entry_price for g in opened] == [10, 20, 10]
+
+def test_full_room_starts_at_once_and_caller_starts_on_countdown():
+    store = InMemoryGameStore()
+    matchmaker = Matchmaker(store, min_players=2, countdown=30)
+    room = matchmaker.room_for(10)
+    store.update(room.game_id, lambda g: setattr(g, 'max_players', 2))
+    store.update(room.game_id, lambda g: g.add_player(1))
+    store.update(room.game_id, lambda g: g.add_player(2))
+    assert store.get(room.game_id).status == "active"
+
+    other = matchmaker.room_for(10)
+    store.update(other.game_id, lambda g: g.add_player(3))
+    store.update(other.game_id, lambda g: g.add_player(4))
+    caller = GameCaller(store, interval=5)
+    assert 0 < caller._tick(other.game_id) <= 5
+    assert store.get(other.game_id).status == "waiting"
+
+    store.update(other.game_id, lambda g: setattr(g, 'start_at', datetime.utcnow() - timedelta(seconds=1)))
+    caller._tick(other.game_id)
+    assert store.get(other.game_id).status == "active"
@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine, inspect
+import migrations
+from database import db
+import models  # noqa: F401 - registers the tables on db.metadata
+
+def indexes(engine, table):
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+def test_fresh_database_gets_the_schema_of_the_models(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    migrations.upgrade(engine)
+
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        assert columns == {column.name for column in table.columns}, table.name
+        assert {index.name for index in table.indexes} <= indexes(engine, table.name), table.name
+
+def test_each_migration_creates_only_its_own_indexes(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'steps.db'}")
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:3])
+    migrations.upgrade(engine)
+    assert 'ux_transaction_transaction_id' not in indexes(engine, 'transaction')
+    assert indexes(engine, 'user') >= {'ix_user_phone'}
+
+    monkeypatch.undo()
+    migrations.upgrade(engine)
+    assert 'ux_transaction_transaction_id' in indexes(engine, 'transaction')
+    assert indexes(engine, 'ledger_entry') == {'ix_ledger_entry_user', 'ix_ledger_entry_posting',
+                                               'ix_ledger_entry_reference'}
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from notifications import Notifier, TokenBucket
+
+class FakeBot:
+    """Stands in for the Telegram Bot API and records what was sent."""
+
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = failures or {}  # chat_id -> exceptions to raise, in order
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        await asyncio.sleep(0)
+        if self.failures.get(chat_id):
+            raise self.failures[chat_id].pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+def run(notifier, messages, timeout=10):
+    async def go():
+        notifier.start()
+        notifier.send_many(messages)
+        await notifier.stop(drain_timeout=timeout)
+    asyncio.run(go())
+
+def test_token_bucket_refills_and_pauses():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() == 0.5
+    now[0] = 0.5
+    assert bucket.take() == 0
+    bucket.pause(3)
+    assert bucket.take() == 3
+    now[0] = 4.0
+    assert bucket.take() == 0
+
+def test_coalesces_messages_to_the_same_chat():
+    bot = FakeBot()
+    notifier = Notifier(bot, workers=4, global_rate=1000, chat_rate=1000)
+    run(notifier, [(1, "a"), (2, "b"), (1, "c")])
+    assert sorted((chat, text) for chat, text, _ in bot.sent) == [(1, "a\n\nc"), (2, "b")]
+    assert notifier.stats()['coalesced'] == 1
+
+def test_respects_the_global_rate():
+    bot = FakeBot()
+    notifier = Notifier(bot, workers=8, global_rate=20, chat_rate=1000)
+    run(notifier, [(chat, "hi") for chat in range(40)])
+    times = [t for _, _, t in bot.sent]
+    assert len(times) == 40
+    assert times[-1] - times[0] >= 0.9  # 20 burst, then 20 more at 20/s
+
+def test_retries_after_flood_control_and_drops_blocked_chats():
+    method = SendMessage(chat_id=1, text="x")
+    bot = FakeBot(failures={
+        1: [TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)],
+        2: [TelegramForbiddenError(method=method, message="bot was blocked by the user")],
+    })
+    notifier = Notifier(bot, workers=2, global_rate=1000, chat_rate=1000)
+    run(notifier, [(1, "won"), (2, "lost")])
+    assert [(chat, text) for chat, text, _ in bot.sent] == [(1, "won")]
+    stats = notifier.stats()
+    assert stats['sent'] == 1 and stats['retried'] == 1 and stats['failed'] == 1
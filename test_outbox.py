@@ -0,0 +1,78 @@
+import os
+import threading
+from outbox import Outbox
+
+def test_claim_complete_and_lease(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    first, _ = outbox.append('deposit', {'phone': '0911', 'amount': 50})
+    outbox.append('deposit', {'phone': '0922', 'amount': 20})
+
+    jobs = outbox.claim('deposit', limit=1, lease=60)
+    assert [job.id for job in jobs] == [first] and jobs[0].payload['amount'] == 50
+    assert [job.payload['phone'] for job in outbox.claim('deposit', limit=10, lease=60)] == ['0922']
+    assert outbox.claim('deposit', limit=10, lease=60) == []  # both leased
+
+    outbox.complete([first])
+    assert outbox.stats() == {'pending': 1}
+
+    # An expired lease (consumer died) makes the job claimable again
+    assert outbox.claim('deposit', limit=10, lease=-1) == []
+    outbox._connection().execute("UPDATE jobs SET claimed_until = 0")
+    assert [job.attempts for job in outbox.claim('deposit', limit=10, lease=60)] == [2]
+
+def test_retry_then_dead(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"), max_attempts=2)
+    outbox.append('deposit', {'phone': '0911', 'amount': 50})
+
+    job, = outbox.claim('deposit', limit=10, lease=60)
+    outbox.retry(job, "no pending deposit", delay=0)
+    job, = outbox.claim('deposit', limit=10, lease=60)
+    outbox.retry(job, "no pending deposit", delay=0)
+    assert outbox.claim('deposit', limit=10, lease=60) == []
+    assert outbox.stats() == {'dead': 1}
+
+def test_concurrent_consumers_never_share_a_job(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    producer = Outbox(path)
+    for i in range(200):
+        producer.append('deposit', {'n': i})
+
+    claimed = []
+    def consume():
+        consumer = Outbox(path)
+        while True:
+            jobs = consumer.claim('deposit', limit=7, lease=60)
+            if not jobs:
+                return
+            claimed.extend(job.payload['n'] for job in jobs)
+
+    threads = [threading.Thread(target=consume) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == list(range(200))
+
+def test_keyed_jobs_are_queued_once(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    job_id, created = outbox.append('deposit', {'phone': '0911', 'amount': 50}, key='sha256:abc')
+    assert created
+    assert outbox.append('deposit', {'phone': '0911', 'amount': 50}, key='sha256:abc') == (job_id, False)
+    assert len(outbox.claim('deposit', limit=10, lease=60)) == 1
+
+def test_forked_worker_opens_its_own_connection(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    outbox.append('deposit', {'phone': '0911', 'amount': 50})
+    parent_conn = outbox._connection()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = outbox._connection() is not parent_conn and outbox.append('deposit', {'phone': '0922', 'amount': 20})
+            os._exit(0 if ok else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert [job.payload['phone'] for job in outbox.claim('deposit', limit=10, lease=60)] == ['0911', '0922']
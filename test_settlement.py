@@ -0,0 +1,62 @@
+import pytest
+from flask import Flask
+import ledger
+from database import db, init_db
+from models import Game, Transaction, User
+from settlement import settle_game
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'settlement.db'}")
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        yield app
+
+def seat_players(game_id, count, entry_cents=1000):
+    """Create funded users and move their entry fees into the game's pot."""
+    db.session.add(Game(id=game_id, entry_price=entry_cents / 100, status='finished'))
+    user_ids = []
+    for telegram_id in range(1, count + 1):
+        user = User(telegram_id=telegram_id)
+        db.session.add(user)
+        db.session.flush()
+        ledger.post('deposit', [(ledger.USER, user.id, 5000), (ledger.DEPOSITS, None, -5000)])
+        ledger.post('game_entry', [(ledger.USER, user.id, -entry_cents),
+                                   (ledger.game_account(game_id), None, entry_cents)],
+                    reference=f"game:{game_id}")
+        user_ids.append(user.id)
+    db.session.commit()
+    return user_ids
+
+def finished_state(game_id, players, winners):
+    return {'game_id': game_id, 'players': {user_id: {} for user_id in players}, 'winner_ids': winners}
+
+def test_winners_share_the_pot_minus_house_cut(app):
+    players = seat_players(7, 3)
+    settlement = settle_game(finished_state(7, players, players[:2]), house_cut=0.1)
+    db.session.commit()
+
+    # 30.00 pot, 3.00 cut, 27.00 split two ways
+    assert settlement.pot_cents == 3000 and settlement.house_cents == 300
+    assert settlement.payouts == {players[0]: 1350, players[1]: 1350}
+    balances = [db.session.get(User, user_id).balance for user_id in players]
+    assert balances == [53.5, 53.5, 40.0]
+    assert [db.session.get(User, user_id).games_won for user_id in players] == [1, 1, 0]
+    assert all(db.session.get(User, user_id).games_played == 1 for user_id in players)
+    assert Transaction.query.filter_by(type='win').count() == 2
+
+    # Settling again (e.g. the game is flushed twice) changes nothing
+    assert settle_game(finished_state(7, players, players[:2])) is None
+    db.session.commit()
+    assert db.session.get(User, players[0]).balance == 53.5
+    assert ledger.reconcile().ok
+
+def test_game_without_winner_refunds_entries(app):
+    players = seat_players(8, 2)
+    settlement = settle_game(finished_state(8, players, []))
+    db.session.commit()
+
+    assert settlement.payouts == {players[0]: 1000, players[1]: 1000} and settlement.house_cents == 0
+    assert [db.session.get(User, user_id).balance for user_id in players] == [50.0, 50.0]
+    assert ledger.reconcile().ok
@@ -42,7 +42,7 @@ def test_simple_webhook():
         logger.info("Response:")
         print(json.dumps(response.json(), indent=2))
         
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             logger.info("✅ Test successful!")
         else:
             logger.error(f"❌ Test failed with status code: {response.status_code}")
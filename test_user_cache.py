@@ -0,0 +1,49 @@
+from user_cache import UserCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_hits_misses_and_ttl():
+    clock = FakeClock()
+    cache = UserCache(maxsize=10, ttl=30, clock=clock)
+    assert cache.get(1) is None
+    cache.put(1, 'alice')
+    assert cache.get(1) == 'alice'
+
+    clock.now = 31
+    assert cache.get(1) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+def test_evicts_least_recently_used():
+    cache = UserCache(maxsize=2, ttl=30)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    cache.get(1)
+    cache.put(3, 'c')
+    assert cache.get(2) is None and cache.get(1) == 'a' and cache.get(3) == 'c'
+    assert cache.evictions == 1
+
+def test_invalidate_rejects_racing_put():
+    cache = UserCache(maxsize=10, ttl=30)
+    generation = cache.generation(1)  # Lookup starts
+    cache.invalidate(1)  # Balance changes meanwhile
+    cache.put(1, 'stale', generation)
+    assert cache.get(1) is None
+    cache.put(1, 'fresh', cache.generation(1))
+    assert cache.get(1) == 'fresh'
+
+def test_forgotten_generations_still_reject_racing_puts():
+    cache = UserCache(maxsize=2, ttl=30)
+    generation = cache.generation(1)  # Lookup of user 1 starts
+    cache.invalidate(1)  # User 1's balance changes meanwhile
+    cache.invalidate(2)
+    cache.invalidate(3)  # User 1's generation is forgotten
+    assert len(cache._generations) == 2
+    cache.put(1, 'stale', generation)
+    assert cache.get(1) is None
+    cache.put(1, 'fresh', cache.generation(1))
+    assert cache.get(1) == 'fresh'
@@ -76,7 +76,7 @@ def test_webhooks():
                 print(f"\n{test_case['name']} Response:")
                 print(json.dumps(response.json(), indent=2))
 
-                if response.status_code == 200:
+                if response.status_code in (200, 202):
                     logger.info("✅ Test successful!")
                 else:
                     logger.error(f"❌ Test failed with status code: {response.status_code}")
@@ -97,7 +97,7 @@ def test_webhooks():
                     print("\nDeposit Endpoint Response:")
                     print(json.dumps(response.json(), indent=2))
 
-                    if response.status_code == 200:
+                    if response.status_code in (200, 202):
                         logger.info("✅ Deposit test successful!")
                     else:
                         logger.error(f"❌ Deposit test failed with status code: {response.status_code}")
@@ -0,0 +1,39 @@
+"""Verification of Telegram WebApp initData.
+
+Telegram passes every WebApp a query string (Telegram.WebApp.initData)
+describing the user who opened it, signed with a key derived from the
+bot token. Only initData whose hash checks out and which is recent
+identifies a user; see
+https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+"""
+import hmac
+import json
+import time
+import hashlib
+from typing import Optional
+from urllib.parse import parse_qsl
+
+def sign_init_data(fields: dict, bot_token: str) -> str:
+    """Hash of initData fields as Telegram computes it."""
+    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret_key = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    return hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+
+def verify_init_data(init_data: str, bot_token: str, max_age: float,
+                     now: Optional[float] = None) -> Optional[dict]:
+    """Return the Telegram user in initData, or None unless it is signed for this bot and recent."""
+    if not init_data or not bot_token:
+        return None
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop('hash', '')
+    if not hmac.compare_digest(sign_init_data(fields, bot_token), received):
+        return None
+    try:
+        auth_date = int(fields['auth_date'])
+        user = json.loads(fields['user'])
+        int(user['id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if (now if now is not None else time.time()) - auth_date > max_age:
+        return None
+    return user